@@ -4,6 +4,8 @@ set -o errexit
 pip install -r requirements.txt
 python manage.py collectstatic --no-input
 python manage.py migrate
+python manage.py build_corpus
+python manage.py prerender_surahs
 python manage.py ensure_superuser
 
 # Update site domain
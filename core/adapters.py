@@ -1,5 +1,27 @@
+from allauth.account.adapter import DefaultAccountAdapter
 from allauth.socialaccount.adapter import DefaultSocialAccountAdapter
 from allauth.account.utils import user_email
+from django.contrib.sites.shortcuts import get_current_site
+
+from core import outbox, usernames
+
+
+class CustomAccountAdapter(DefaultAccountAdapter):
+    """
+    Send allauth's emails (password reset and the like) through the outbox
+    instead of SMTP inside the request.
+    """
+    
+    def send_mail(self, template_prefix, email, context):
+        request = self.request
+        ctx = {
+            'request': request,
+            'email': email,
+            'current_site': get_current_site(request),
+        }
+        ctx.update(context)
+        outbox.queue_message(self.render_mail(template_prefix, email, ctx))
+
 
 class CustomSocialAccountAdapter(DefaultSocialAccountAdapter):
     """
@@ -32,20 +54,20 @@ class CustomSocialAccountAdapter(DefaultSocialAccountAdapter):
         
         # Generate unique username from email
         if user.email:
-            base_username = user.email.split('@')[0]
-            username = base_username
-            
-            # Handle duplicate usernames
-            from core.models import CustomUser
-            counter = 1
-            while CustomUser.objects.filter(username=username).exclude(pk=user.pk).exists():
-                username = f"{base_username}{counter}"
-                counter += 1
-            
-            user.username = username
+            user.username = usernames.next_free(usernames.base_username(user.email))
         
         return user
     
+    def save_user(self, request, sociallogin, form=None):
+        """
+        Save the new user, picking another username if a concurrent signup
+        took the one chosen in populate_user.
+        """
+        return usernames.save_with_username(
+            sociallogin.user,
+            lambda: super(CustomSocialAccountAdapter, self).save_user(request, sociallogin, form),
+        )
+    
     def pre_social_login(self, request, sociallogin):
         """
         Connect social account to existing user if email matches.
@@ -1,14 +1,53 @@
 from django.contrib import admin
-from .models import CustomUser, Feedback, ContactMessage, EmailVerification
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from . import export, rollups
+from .changelist import LargeTableAdmin
+from .models import (
+    CustomUser, Feedback, FeedbackDailyRollup, ContactMessage, EmailVerification, OutboundEmail, Surah, Ayah,
+    AyahGeneration, RecitationTiming,
+)
+
+
+class ExportActionsMixin:
+    """Actions streaming the selected rows as CSV or JSON Lines (see core.export)"""
+    export_name = None
+
+    def export_csv(self, request, queryset):
+        return export.streaming_response(request, export.get_export(self.export_name), 'csv', queryset)
+    export_csv.short_description = "Export selected as CSV"
+
+    def export_jsonl(self, request, queryset):
+        return export.streaming_response(request, export.get_export(self.export_name), 'jsonl', queryset)
+    export_jsonl.short_description = "Export selected as JSON Lines"
+
+
+class RatingFilter(admin.SimpleListFilter):
+    """Fixed 1-5 choices, instead of a SELECT DISTINCT over every row"""
+    title = 'rating'
+    parameter_name = 'rating'
+
+    def lookups(self, request, model_admin):
+        return [(str(rating), str(rating)) for rating in range(1, 6)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(rating=self.value())
+        return queryset
 
 
 @admin.register(Feedback)
-class FeedbackAdmin(admin.ModelAdmin):
+class FeedbackAdmin(ExportActionsMixin, LargeTableAdmin):
     list_display = ('name', 'email', 'feedback_type', 'rating', 'message_preview', 'created_at')
-    list_filter = ('feedback_type', 'rating', 'created_at')
+    list_filter = ('feedback_type', RatingFilter, 'created_at')
     search_fields = ('name', 'email', 'message')
+    search_columns = ('name', 'message')
     readonly_fields = ('created_at',)
-    ordering = ('-created_at',)
+
+    actions = ['export_csv', 'export_jsonl']
+    export_name = 'feedback'
     
     def message_preview(self, obj):
         """Show first 50 characters of message"""
@@ -16,15 +55,50 @@ class FeedbackAdmin(admin.ModelAdmin):
     message_preview.short_description = 'Message'
 
 
+@admin.register(FeedbackDailyRollup)
+class FeedbackDailyRollupAdmin(admin.ModelAdmin):
+    """Read-only dashboard of feedback per day and type, from the rollups alone"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in rollups.DASHBOARD_DAYS:
+            days = 30
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Feedback dashboard',
+            'day_choices': rollups.DASHBOARD_DAYS,
+            'dashboard': rollups.dashboard(days),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/core/feedbackdailyrollup/dashboard.html', context)
+
+
 @admin.register(ContactMessage)
-class ContactMessageAdmin(admin.ModelAdmin):
+class ContactMessageAdmin(ExportActionsMixin, LargeTableAdmin):
     list_display = ('name', 'email', 'subject', 'message_preview', 'is_read', 'created_at')
     list_filter = ('is_read', 'created_at')
     search_fields = ('name', 'email', 'subject', 'message')
+    search_columns = ('name', 'subject', 'message')
     readonly_fields = ('created_at',)
-    ordering = ('-created_at',)
     
-    actions = ['mark_as_read', 'mark_as_unread']
+    actions = ['mark_as_read', 'mark_as_unread', 'export_csv', 'export_jsonl']
+    export_name = 'contact_messages'
     
     def message_preview(self, obj):
         """Show first 75 characters of message"""
@@ -53,4 +127,60 @@ class EmailVerificationAdmin(admin.ModelAdmin):
     expired_status.short_description = 'Status'
 
 
-admin.site.register(CustomUser)
\ No newline at end of file
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'to')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    ordering = ('-created_at',)
+    
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        queryset.exclude(status=OutboundEmail.STATUS_SENT).update(
+            status=OutboundEmail.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now(),
+        )
+    retry_now.short_description = "Retry selected emails now"
+
+
+@admin.register(Surah)
+class SurahAdmin(admin.ModelAdmin):
+    list_display = ('number', 'name', 'name_arabic', 'name_translation', 'revelation_place', 'total_ayah')
+    list_filter = ('revelation_place',)
+    search_fields = ('name', 'name_arabic', 'name_translation')
+    ordering = ('number',)
+
+
+@admin.register(Ayah)
+class AyahAdmin(admin.ModelAdmin):
+    list_display = ('surah', 'number', 'language', 'text_preview')
+    list_filter = ('language',)
+    list_select_related = ('surah',)
+    raw_id_fields = ('surah',)
+    ordering = ('surah', 'number', 'language')
+
+    def text_preview(self, obj):
+        """Show first 75 characters of text"""
+        return obj.text[:75] + '...' if len(obj.text) > 75 else obj.text
+    text_preview.short_description = 'Text'
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            AyahGeneration.bump()
+
+
+@admin.register(RecitationTiming)
+class RecitationTimingAdmin(admin.ModelAdmin):
+    list_display = ('reciter', 'surah', 'updated_at')
+    list_filter = ('reciter',)
+    exclude = ('data',)
+    readonly_fields = ('updated_at',)
+    ordering = ('reciter', 'surah')
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(ExportActionsMixin, admin.ModelAdmin):
+    actions = ['export_csv', 'export_jsonl']
+    export_name = 'users'
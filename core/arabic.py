@@ -0,0 +1,69 @@
+"""
+Arabic text normalization shared by the search index and search queries.
+
+Uthmani script carries tashkeel, Quranic annotation marks and spelling
+variants that users never type. Folding both the stored text and the query
+through the same table lets "الرحمن" match "ٱلرَّحْمَٰنِ".
+"""
+
+# Harakat, tanween, shadda, sukun and the other combining marks
+DIACRITICS = [chr(c) for c in range(0x064B, 0x0660)] + ['ٰ']
+
+# Small high letters, pause marks and other Quranic annotation signs
+QURANIC_MARKS = [chr(c) for c in range(0x06D6, 0x06EE)]
+
+TATWEEL = 'ـ'
+
+FOLDED_LETTERS = {
+    # Alef variants (hamza above/below, madda, wasla)
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    # Hamza carried on waw and ya
+    'ؤ': 'و',
+    'ئ': 'ي',
+    # Alef maqsura and Farsi ya
+    'ى': 'ي',
+    'ی': 'ي',
+    # Ta marbuta
+    'ة': 'ه',
+    # Keheh
+    'ک': 'ك',
+}
+
+TRANSLATION_TABLE = str.maketrans({
+    **{ch: None for ch in DIACRITICS + QURANIC_MARKS + [TATWEEL]},
+    **FOLDED_LETTERS,
+})
+
+
+def normalize_arabic(text):
+    """Strip diacritics and tatweel, fold letter variants, collapse spaces"""
+    return ' '.join(text.translate(TRANSLATION_TABLE).casefold().split())
+
+
+def normalize_many(texts, memo=None):
+    """
+    Normalize a batch of texts (used at import time).
+
+    The corpus reuses a small vocabulary, so each distinct word is folded
+    once and memoized; that is several times faster than translating every
+    text character by character. Pass the same memo dict across batches to
+    keep reusing it.
+    """
+    table = TRANSLATION_TABLE
+    memo = {} if memo is None else memo
+    normalized = []
+
+    for text in texts:
+        words = []
+        for word in text.split():
+            folded = memo.get(word)
+            if folded is None:
+                folded = memo[word] = word.translate(table).casefold()
+            if folded:
+                words.append(folded)
+        normalized.append(' '.join(words))
+
+    return normalized
@@ -0,0 +1,38 @@
+"""
+Shared, connection-pooled async HTTP clients for upstream calls in ASGI
+mode. One httpx.AsyncClient per upstream host (and event loop) keeps
+connections alive between requests, speaks HTTP/2 when the h2 package is
+installed, and its pool limits cap the connections opened to that host.
+"""
+import asyncio
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(url):
+    """The pooled client for url's host on the running event loop"""
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    host = urlsplit(url).netloc
+    client = clients.get(host)
+    if client is None:
+        client = clients[host] = httpx.AsyncClient(
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return client
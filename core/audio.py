@@ -0,0 +1,261 @@
+import logging
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.urls import reverse
+
+from . import metrics, upstream
+from .quran_api import get_chapter_audio_url
+
+try:
+    import fcntl
+except ImportError:  # Windows: downloads are only coalesced per process
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+RECITER_RE = re.compile(r'^[a-z0-9][a-z0-9._-]{0,63}$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# A recitation file never changes once published
+AUDIO_MAX_AGE = 60 * 60 * 24 * 365
+
+
+class AudioUnavailable(Exception):
+    """The recitation could not be fetched from upstream"""
+
+
+_locks_guard = threading.Lock()
+_download_locks = {}
+
+
+@contextmanager
+def download_lock(path):
+    """
+    Serialize downloads of one file: a thread lock within the process and
+    an flock on a sidecar file across worker processes.
+    """
+    with _locks_guard:
+        thread_lock = _download_locks.setdefault(str(path), threading.Lock())
+
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(path.with_name(path.name + '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def cache_path(reciter, surah_number):
+    return Path(settings.AUDIO_CACHE_DIR) / reciter / f'{surah_number}.mp3'
+
+
+def get_audio_file(reciter, surah_number):
+    """
+    The cached MP3 for a reciter/surah, opened for binary reading and
+    downloaded on a miss. Concurrent misses for the same file wait for a
+    single download. Readers hold the file open, so eviction by another
+    request or worker can unlink it without cutting off their response.
+    Raises AudioUnavailable if upstream can't provide it.
+    """
+    if not RECITER_RE.match(reciter):
+        raise AudioUnavailable(f'Invalid reciter {reciter!r}')
+
+    try:
+        return open_or_download(reciter, surah_number)
+    except FileNotFoundError:
+        # Evicted between download and open: fetch it once more
+        try:
+            return open_or_download(reciter, surah_number)
+        except FileNotFoundError as e:
+            raise AudioUnavailable(str(e))
+
+
+def open_or_download(reciter, surah_number):
+    path = cache_path(reciter, surah_number)
+    f = open_cached(path)
+    if f is not None:
+        metrics.incr('audio.hit')
+        return f
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with download_lock(path):
+        # Someone else may have finished the download while we waited
+        f = open_cached(path)
+        if f is not None:
+            metrics.incr('audio.coalesced')
+            return f
+
+        metrics.incr('audio.miss')
+        download(upstream_url(reciter, surah_number), path)
+        f = open(path, 'rb')
+
+    # Never the file just fetched, even if it alone is over the limit
+    evict(settings.AUDIO_CACHE_MAX_BYTES, keep=path)
+    return f
+
+
+def upstream_url(reciter, surah_number):
+    """
+    Where a recitation is downloaded from: a quran.com recitation id (all
+    digits, as used by the player) is looked up through the Quran API, any
+    other identifier fills in AUDIO_UPSTREAM_URL.
+    """
+    if not reciter.isdigit():
+        return settings.AUDIO_UPSTREAM_URL.format(reciter=reciter, surah=surah_number)
+    url = get_chapter_audio_url(int(reciter), surah_number)
+    if not url:
+        raise AudioUnavailable(f'No audio for recitation {reciter} of surah {surah_number}')
+    return url
+
+
+def player_urls(reciter_id, surah_number):
+    """The player's audio source (through this cache) and its ayah timings"""
+    return {
+        'audio_url': reverse('audio_file', args=[str(reciter_id), surah_number]),
+        'timings_url': reverse('api_audio_timings', args=[str(reciter_id), surah_number]),
+    }
+
+
+def open_cached(path):
+    """The cached file opened for reading and marked as used, or None on a miss"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    touch(path)
+    return f
+
+
+def download(url, path):
+    """
+    Stream url into path atomically (temp file + rename), behind the
+    upstream circuit breaker: while the CDN is down misses fail fast.
+    """
+    try:
+        upstream.call(urlsplit(url).netloc, lambda: fetch_to(url, path), requests.RequestException)
+    except (upstream.UpstreamUnavailable, AudioUnavailable, OSError) as e:
+        logger.warning("Audio download from %s failed: %s", url, e)
+        raise AudioUnavailable(str(e))
+
+
+def fetch_to(url, path):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.part')
+    try:
+        with requests.get(url, stream=True, timeout=settings.AUDIO_DOWNLOAD_TIMEOUT) as response:
+            if 400 <= response.status_code < 500:
+                raise AudioUnavailable(f'Upstream answered {response.status_code}')
+            response.raise_for_status()
+            with os.fdopen(fd, 'wb') as f:
+                fd = None
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def touch(path):
+    """Mark a cached file as recently used (the LRU order is by mtime)"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict(max_bytes, keep=None):
+    """
+    Delete least recently used files, except keep, until the cache fits
+    in max_bytes (or only keep is left).
+    """
+    files = []
+    total = 0
+    for path in Path(settings.AUDIO_CACHE_DIR).glob('*/*.mp3'):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+        metrics.incr('audio.evicted')
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range Range header into (start, end) inclusive.
+    Returns None when the header is absent or not a single byte range (the
+    whole file is served), and raises ValueError when it is unsatisfiable.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+class FileRange:
+    """
+    A file object limited to one byte range. It keeps the real fileno()
+    and file position, so servers with wsgi.file_wrapper (gunicorn) can
+    sendfile() the range straight from the page cache.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.file = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,105 @@
+"""
+Ayah-level timing index for recitation files.
+
+Each (reciter, surah) index is three parallel uint32 arrays -- start time,
+end time (both in ms) and byte offset of every ayah in the cached MP3 --
+stored back to back as little-endian bytes. Lookups by time or byte offset
+are a bisect over the sorted arrays.
+"""
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+from .models import RecitationTiming
+
+
+class TimingIndex:
+
+    def __init__(self, starts, ends, offsets):
+        self.starts = array('I', starts)
+        self.ends = array('I', ends)
+        self.offsets = array('I', offsets)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        values = array('I')
+        values.frombytes(bytes(data))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        n = len(values) // 3
+        return cls(values[:n], values[n:2 * n], values[2 * n:])
+
+    def to_bytes(self):
+        values = self.starts + self.ends + self.offsets
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values.tobytes()
+
+    def ayah(self, number):
+        """
+        Timing of one ayah (1-based) as a dict; byte_end is None for the
+        last ayah, which runs to the end of the file.
+        """
+        if not 1 <= number <= len(self):
+            raise IndexError(number)
+        i = number - 1
+        return {
+            'ayah': number,
+            'start_ms': self.starts[i],
+            'end_ms': self.ends[i],
+            'byte_start': self.offsets[i],
+            'byte_end': self.offsets[i + 1] - 1 if number < len(self) else None,
+        }
+
+    def ayahs(self):
+        return [self.ayah(number) for number in range(1, len(self) + 1)]
+
+    def ayah_at(self, ms):
+        """Number of the ayah playing at a time offset (clamped to 1..n)"""
+        return min(max(bisect_right(self.starts, ms), 1), len(self))
+
+    def ayah_at_byte(self, offset):
+        """Number of the ayah containing a byte offset (clamped to 1..n)"""
+        return min(max(bisect_right(self.offsets, offset), 1), len(self))
+
+
+# Recitations without timings are remembered for a while too, so clip
+# requests for them don't each query the database
+MISS_TTL = 60
+MAX_MISSES = 10_000
+
+_indexes = {}
+_misses = {}
+
+
+def get_timing_index(reciter, surah_number):
+    """
+    Load a timing index lazily, once per process; None if none was imported.
+    Workers pick up re-imported timings when they restart, and newly
+    imported ones within MISS_TTL seconds.
+    """
+    key = (reciter, surah_number)
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+    if _misses.get(key, 0) > time.monotonic():
+        return None
+
+    data = (
+        RecitationTiming.objects
+        .filter(reciter=reciter, surah_id=surah_number)
+        .values_list('data', flat=True)
+        .first()
+    )
+    if data is None:
+        if len(_misses) >= MAX_MISSES:
+            _misses.clear()
+        _misses[key] = time.monotonic() + MISS_TTL
+        return None
+    index = _indexes[key] = TimingIndex.from_bytes(data)
+    _misses.pop(key, None)
+    return index
@@ -0,0 +1,49 @@
+import gzip
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+
+from django.utils.html import json_script
+
+
+CATALOG_PATH = Path(__file__).resolve().parent / 'data' / 'surahs.json'
+
+# The catalog only changes when the bundled file changes (i.e. on deploy)
+CATALOG_MAX_AGE = 60 * 60 * 24 * 7
+
+
+class SurahCatalog:
+    """
+    Metadata for all 114 surahs, loaded once per process from the bundled
+    data file. The serialized body, its gzip variant and the ETags are
+    computed up front so serving the catalog costs no work per request.
+    """
+
+    def __init__(self, surahs):
+        self.surahs = surahs
+        self.by_number = {surah['surahNo']: surah for surah in surahs}
+
+        self.body = json.dumps(surahs, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.gzipped_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzipped_etag = f'"{digest}-gzip"'
+
+        # Pre-escaped <script type="application/json"> tag for inlining
+        self.script_tag = json_script(surahs, 'surah-catalog')
+
+    def __len__(self):
+        return len(self.surahs)
+
+    def get(self, number):
+        """Return the metadata dict for a surah number, or None"""
+        return self.by_number.get(number)
+
+
+@lru_cache(maxsize=1)
+def get_catalog():
+    """Load the bundled surah catalog (cached for the life of the process)"""
+    with open(CATALOG_PATH, encoding='utf-8') as f:
+        return SurahCatalog(json.load(f))
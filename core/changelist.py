@@ -0,0 +1,202 @@
+"""
+Admin changelists that stay fast on tables with millions of rows.
+
+LargeTableAdmin is a ModelAdmin for append-mostly tables like Feedback and
+ContactMessage. Out of the box the admin runs two COUNT(*)s per page,
+pages with OFFSET, and searches with leading-wildcard ILIKEs; each of
+those reads the whole table. Here instead:
+
+- Counts come from the PostgreSQL planner (table statistics, or EXPLAIN's
+  row estimate when filtered) and are shown as "about N". Estimates under
+  EXACT_COUNT_BELOW are replaced by an exact count, which is cheap there.
+  SQLite has no statistics to read and always counts.
+- With the default newest-first ordering, pages are read by keyset:
+  "Older" continues after the last (keyset_field, pk) shown, so every
+  page is an index range scan however far back it is. Sorting by another
+  column falls back to numbered pages.
+- Search is full-text over search_columns through an expression GIN
+  index (PostgreSQL) or an FTS5 table (SQLite), both created by a
+  migration. A term containing '@' is looked up as an exact email
+  address instead, through an index on UPPER(email).
+
+List filters should not need a DISTINCT over the table either; use
+fields with choices or a SimpleListFilter with fixed lookups.
+"""
+import json
+
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Upper
+from django.utils.functional import cached_property
+
+from .search import fts5_phrase
+
+
+EXACT_COUNT_BELOW = 10_000
+
+CURSOR_VAR = 'cursor'
+OLDER, NEWER = 'older', 'newer'
+
+
+# ==================== COUNTS ====================
+
+def estimate_count(queryset):
+    """The planner's row estimate for queryset on PostgreSQL, else None"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table is first vacuumed or analyzed
+        if row and row[0] >= 0:
+            return row[0]
+
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        self.estimated = estimate is not None and estimate >= EXACT_COUNT_BELOW
+        return estimate if self.estimated else super().count
+
+
+# ==================== SEARCH ====================
+
+def text_search(model, columns, term):
+    """A filter matching rows whose columns contain every word of term"""
+    connection = connections[model.objects.db]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        document = " || ' ' || ".join(connection.ops.quote_name(column) for column in columns)
+        return RawSQL(
+            f"to_tsvector('simple', {document}) @@ websearch_to_tsquery('simple', %s)",
+            [term],
+            output_field=BooleanField(),
+        )
+    match = ' '.join(fts5_phrase(word) for word in term.split())
+    return Q(pk__in=RawSQL(f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s', [match]))
+
+
+# ==================== KEYSET PAGES ====================
+
+def make_cursor(direction, value, pk):
+    return f'{direction}:{pk}:{value.isoformat()}'
+
+
+def parse_cursor(cursor, field):
+    """(direction, value, pk) from a cursor, or (OLDER, None, None) for the first page"""
+    if not cursor:
+        return OLDER, None, None
+    try:
+        direction, pk, value = cursor.split(':', 2)
+        value = field.to_python(value)
+        if direction not in (OLDER, NEWER) or value is None:
+            raise ValueError(cursor)
+        return direction, value, int(pk)
+    except (ValueError, ValidationError) as e:
+        raise IncorrectLookupParameters(e) from e
+
+
+class KeysetChangeList(ChangeList):
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR, '')
+        self.keyset = False
+        super().__init__(request, *args, **kwargs)
+        # Filter and sort links start again from the newest rows
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_results(self, request):
+        if ORDER_VAR in self.params or self.show_all:
+            return super().get_results(request)
+
+        name = self.model_admin.keyset_field
+        field = self.opts.get_field(name)
+        direction, value, pk = parse_cursor(self.cursor, field)
+
+        queryset = self.queryset
+        if value is not None and direction == OLDER:
+            # The plain range condition lets the (field, id) index bound the scan
+            queryset = queryset.filter(
+                Q(**{f'{name}__lt': value}) | Q(pk__lt=pk), **{f'{name}__lte': value},
+            )
+        elif value is not None:
+            queryset = queryset.filter(
+                Q(**{f'{name}__gt': value}) | Q(pk__gt=pk), **{f'{name}__gte': value},
+            ).order_by(name, 'pk')
+
+        rows = list(queryset[:self.list_per_page + 1])
+        more = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+        if direction == NEWER:
+            rows.reverse()
+
+        # An empty page (a stale cursor, say) only links back to the newest
+        has_older = bool(rows) and (more if direction == OLDER else True)
+        has_newer = bool(rows) and value is not None and (more if direction == NEWER else True)
+        self.newest_url = value is not None and self.get_query_string(remove=[CURSOR_VAR])
+        self.older_url = has_older and self.get_query_string(
+            {CURSOR_VAR: make_cursor(OLDER, getattr(rows[-1], name), rows[-1].pk)}
+        )
+        self.newer_url = has_newer and self.get_query_string(
+            {CURSOR_VAR: make_cursor(NEWER, getattr(rows[0], name), rows[0].pk)}
+        )
+
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = has_older or has_newer
+        self.keyset = True
+
+
+# ==================== ADMIN ====================
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ModelAdmin for big tables; see the module docstring"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-created_at',)
+    keyset_field = 'created_at'
+    # Must match the document indexed by the model's full-text migration
+    search_columns = ()
+    search_help_text = 'Matches whole words, or an exact email address'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if '@' in term:
+            # Spelled out rather than iexact (a LIKE on SQLite) so both
+            # databases use the UPPER(email) index
+            return queryset.alias(email_upper=Upper('email')).filter(email_upper=Upper(Value(term))), False
+        return queryset.filter(text_search(queryset.model, self.search_columns, term)), False
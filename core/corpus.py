@@ -0,0 +1,134 @@
+"""
+Read-only, memory-mapped corpus of ayah texts.
+
+`manage.py build_corpus` writes every ayah of every language into one file:
+
+    header      magic, version, surah count, language count, index position,
+                generation of the ayah rows it was built from
+    blobs       UTF-8 ayah texts, back to back
+    index       surah starts: (surahs + 1) uint32, the global number of each
+                surah's first ayah; then per language a 16-byte code and the
+                position of its table; then per language a table of
+                (start, end) uint32 pairs, one per ayah ((0, 0) if missing)
+
+All integers are little-endian. Workers mmap the file read-only, so the
+text lives once in the page cache however many processes serve it, and a
+lookup is two integer reads and a slice of the mapping.
+
+Ayah texts keep changing after a build (import_quran, admin edits), and
+each change bumps AyahGeneration. A corpus whose generation is not the
+database's is not served; callers read the database until it is rebuilt.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+from .models import AyahGeneration
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'QRNC'
+VERSION = 2
+HEADER = struct.Struct('<4sIIIIQ')
+LANGUAGE_ENTRY = struct.Struct('<16sI')
+SPAN = struct.Struct('<II')
+
+
+class CorpusError(ValueError):
+    """The corpus file is missing pieces or was written by another version"""
+
+
+class Corpus:
+
+    def __init__(self, f):
+        self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+
+        if len(self.mmap) < HEADER.size:
+            raise CorpusError('Corpus file is truncated')
+        magic, version = struct.unpack_from('<4sI', self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise CorpusError('Not a corpus file of this version')
+        _, _, surah_count, language_count, index, self.generation = HEADER.unpack_from(self.mmap, 0)
+
+        # The small tables are unpacked once; ayah spans stay in the mapping
+        self.surah_starts = struct.unpack_from(f'<{surah_count + 1}I', self.mmap, index)
+        position = index + 4 * (surah_count + 1)
+        self.tables = {}
+        for _ in range(language_count):
+            code, table = LANGUAGE_ENTRY.unpack_from(self.mmap, position)
+            self.tables[code.rstrip(b'\0').decode('ascii')] = table
+            position += LANGUAGE_ENTRY.size
+
+    @property
+    def languages(self):
+        return list(self.tables)
+
+    def ayah_count(self, surah_number):
+        if not 1 <= surah_number < len(self.surah_starts):
+            return 0
+        return self.surah_starts[surah_number] - self.surah_starts[surah_number - 1]
+
+    def ayah_bytes(self, surah_number, ayah_number, language='ar'):
+        """UTF-8 text of one ayah as a zero-copy memoryview, or None"""
+        table = self.tables.get(language)
+        if table is None or not 1 <= ayah_number <= self.ayah_count(surah_number):
+            return None
+        index = self.surah_starts[surah_number - 1] + ayah_number - 1
+        start, end = SPAN.unpack_from(self.mmap, table + SPAN.size * index)
+        if start == end:
+            return None
+        return self.view[start:end]
+
+    def text(self, surah_number, ayah_number, language='ar'):
+        data = self.ayah_bytes(surah_number, ayah_number, language)
+        return None if data is None else str(data, 'utf-8')
+
+
+@lru_cache(maxsize=1)
+def _open_corpus(path, inode, size):
+    with open(path, 'rb') as f:
+        return Corpus(f)
+
+
+# How long a process trusts the generation it last read from the database
+GENERATION_CHECK_INTERVAL = 5
+
+_generation = {'value': None, 'checked_at': 0.0}
+
+
+def current_generation():
+    """AyahGeneration in the database, re-read at most every GENERATION_CHECK_INTERVAL seconds"""
+    now = time.monotonic()
+    if _generation['value'] is None or now - _generation['checked_at'] >= GENERATION_CHECK_INTERVAL:
+        _generation['value'] = AyahGeneration.current()
+        _generation['checked_at'] = now
+    return _generation['value']
+
+
+def get_corpus():
+    """
+    The corpus at CORPUS_PATH, mapped once per process, or None if it
+    hasn't been built or is older than the ayah rows (callers then read
+    from the database). A rebuilt file is replaced with a rename, so a
+    new inode reopens it.
+    """
+    path = settings.CORPUS_PATH
+    try:
+        stat = os.stat(path)
+        corpus = _open_corpus(str(path), stat.st_ino, stat.st_size)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Could not open corpus %s: %s", path, e)
+        return None
+
+    if corpus.generation != current_generation():
+        return None
+    return corpus
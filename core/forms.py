@@ -1,6 +1,8 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.contrib.auth import authenticate
+from django.template.loader import render_to_string
+from . import outbox, usernames
 from .models import CustomUser, Feedback, ContactMessage, EmailVerification
 
 
@@ -49,24 +51,13 @@ class CodeVerificationForm(forms.Form):
         if not self.email:
             raise forms.ValidationError("Session expired. Please start again.")
         
-        try:
-            verification = EmailVerification.objects.filter(
-                email=self.email,
-                code=code,
-                is_verified=False
-            ).latest('created_at')
-            
-            if verification.is_expired():
-                raise forms.ValidationError("This code has expired. Please request a new one.")
-            
-            # Mark as verified
-            verification.is_verified = True
-            verification.save()
-            
+        if EmailVerification.verify(self.email, code):
             return code
-            
-        except EmailVerification.DoesNotExist:
-            raise forms.ValidationError("Invalid verification code.")
+        
+        # Only failed attempts pay for a second query to explain why
+        if EmailVerification.objects.filter(email=self.email, code=code, is_verified=False).exists():
+            raise forms.ValidationError("This code has expired. Please request a new one.")
+        raise forms.ValidationError("Invalid verification code.")
 
 
 # ==================== STEP 3: Complete Registration ====================
@@ -99,11 +90,13 @@ class CompleteRegistrationForm(UserCreationForm):
     def save(self, commit=True):
         user = super().save(commit=False)
         user.email = self.email
-        user.username = self.email.split('@')[0]  # Auto-generate username from email
         user.full_name = self.cleaned_data['full_name']
         
+        # Auto-generate a unique username from the email
         if commit:
-            user.save()
+            usernames.save_with_username(user)
+        else:
+            user.username = usernames.next_free(usernames.base_username(self.email))
         return user
 
 
@@ -209,4 +202,17 @@ class ContactForm(forms.ModelForm):
                 'placeholder': 'Write your message here...',
                 'required': True
             }),
-        }
\ No newline at end of file
+        }
+
+
+# ==================== PASSWORD RESET ====================
+class OutboxPasswordResetForm(PasswordResetForm):
+    """Queue the reset link in the outbox instead of sending it over SMTP in the request"""
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        # Email subject *must not* contain newlines
+        subject = ''.join(render_to_string(subject_template_name, context).splitlines())
+        body = render_to_string(email_template_name, context)
+        html_body = render_to_string(html_email_template_name, context) if html_email_template_name else ''
+        outbox.queue(subject=subject, body=body, to=[to_email], html_body=html_body, from_email=from_email)
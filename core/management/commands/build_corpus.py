@@ -0,0 +1,115 @@
+import os
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalog import get_catalog
+from core.corpus import HEADER, LANGUAGE_ENTRY, MAGIC, VERSION
+from core.models import Ayah, AyahGeneration
+
+
+# Offsets are stored as uint32
+MAX_OFFSET = (1 << 32) - 1
+
+
+def little_endian(values):
+    values = array('I', values)
+    if values.itemsize != 4:
+        raise CommandError('The platform has no 32-bit unsigned array type.')
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+class Command(BaseCommand):
+    help = 'Write every ayah text and translation into the memory-mapped corpus file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=str(settings.CORPUS_PATH),
+            help='Corpus file to write (default: CORPUS_PATH)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        output = Path(options['output'])
+
+        catalog = get_catalog()
+        surah_starts = [0]
+        for surah in catalog.surahs:
+            surah_starts.append(surah_starts[-1] + surah['totalAyah'])
+        total = surah_starts[-1]
+
+        # Read before the rows: an import that lands while they are being
+        # read leaves the file one generation behind, never ahead
+        generation = AyahGeneration.current()
+        rows = (
+            Ayah.objects
+            .order_by('language', 'surah', 'number')
+            .values_list('language', 'surah_id', 'number', 'text')
+            .iterator(chunk_size=2000)
+        )
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=output.parent, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(bytes(HEADER.size))
+                position = HEADER.size
+                spans = {}
+                count = 0
+
+                for language, surah, number, text in rows:
+                    if not 1 <= number <= surah_starts[surah] - surah_starts[surah - 1]:
+                        continue
+                    encoded = language.encode('ascii')
+                    if len(encoded) > LANGUAGE_ENTRY.size - 4:
+                        raise CommandError(f'Language code {language!r} is too long.')
+                    table = spans.get(language)
+                    if table is None:
+                        table = spans[language] = array('I', bytes(8 * total))
+
+                    data = text.encode('utf-8')
+                    if position + len(data) > MAX_OFFSET:
+                        raise CommandError('The corpus is too large for 32-bit offsets.')
+                    index = 2 * (surah_starts[surah - 1] + number - 1)
+                    table[index], table[index + 1] = position, position + len(data)
+                    f.write(data)
+                    position += len(data)
+                    count += 1
+
+                index_position = position
+                index = [little_endian(surah_starts)]
+                table_position = (
+                    index_position + 4 * len(surah_starts) + LANGUAGE_ENTRY.size * len(spans)
+                )
+                for language, table in spans.items():
+                    index.append(LANGUAGE_ENTRY.pack(language.encode('ascii'), table_position))
+                    table_position += 4 * len(table)
+                index.extend(little_endian(table) for table in spans.values())
+
+                if table_position > MAX_OFFSET:
+                    raise CommandError('The corpus is too large for 32-bit offsets.')
+                f.write(b''.join(index))
+                f.seek(0)
+                f.write(HEADER.pack(
+                    MAGIC, VERSION, len(catalog.surahs), len(spans), index_position, generation,
+                ))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, output)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {count} ayahs in {len(spans)} language(s) to {output} '
+            f'({table_position / 1e6:.1f} MB) in {elapsed:.2f}s.'
+        ))
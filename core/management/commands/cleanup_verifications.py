@@ -1,11 +1,10 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
 from datetime import timedelta
-from core.models import EmailVerification
+from core.retention import get_policy, purge
 
 
 class Command(BaseCommand):
-    help = 'Delete expired email verification codes older than 24 hours'
+    help = 'Delete expired email verification codes older than 24 hours (see also: purge)'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -17,13 +16,10 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         hours = options['hours']
-        cutoff_time = timezone.now() - timedelta(hours=hours)
-        
-        # Delete old verifications
-        deleted_count, _ = EmailVerification.objects.filter(
-            created_at__lt=cutoff_time
-        ).delete()
-        
+
+        # Delete old verifications, in chunks like `purge verifications`
+        deleted_count = sum(purge(get_policy('verifications'), max_age=timedelta(hours=hours)))
+
         if deleted_count > 0:
             self.stdout.write(
                 self.style.SUCCESS(
@@ -35,4 +31,4 @@ class Command(BaseCommand):
                 self.style.WARNING(
                     f'No expired verifications found older than {hours} hours.'
                 )
-            )
\ No newline at end of file
+            )
@@ -0,0 +1,124 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.audio import RECITER_RE, cache_path
+from core.audio_timing import TimingIndex
+from core.catalog import get_catalog
+from core.mp3 import Mp3Error, get_frame_table, id3v2_size
+from core.models import RecitationTiming, Surah
+
+
+def iter_verse_timings(data):
+    """
+    Yield (surah, ayah, start_ms, end_ms) from the segment-timing JSON that
+    quran.com / QuranCDN publish: either one chapter's
+    {"audio_file": {"timestamps" | "verse_timings": [...]}} or a multi-chapter
+    {"audio_files": [{"verse_timings": [...]}, ...]}.
+    """
+    if 'audio_files' in data:
+        files = data['audio_files']
+    else:
+        files = [data.get('audio_file', data)]
+
+    for audio_file in files:
+        timings = audio_file.get('verse_timings') or audio_file.get('timestamps') or []
+        for timing in timings:
+            surah, ayah = (int(part) for part in timing['verse_key'].split(':'))
+            yield surah, ayah, int(timing['timestamp_from']), int(timing['timestamp_to'])
+
+
+class Command(BaseCommand):
+    help = 'Import ayah segment timings for one reciter and build the per-surah timing index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Segment-timing JSON file')
+        parser.add_argument(
+            '--reciter',
+            required=True,
+            help=(
+                'Reciter identifier used by the audio proxy: a quran.com recitation id as the '
+                'player uses (e.g. 7), or an AUDIO_UPSTREAM_URL reciter such as ar.alafasy'
+            )
+        )
+        parser.add_argument(
+            '--bitrate',
+            type=int,
+            default=128,
+            help=(
+                'Bitrate of the audio files in kbps, used to estimate byte offsets when the '
+                'file is not in the audio cache yet (default: 128)'
+            )
+        )
+
+    def handle(self, *args, **options):
+        reciter = options['reciter']
+        if not RECITER_RE.match(reciter):
+            raise CommandError(f'Invalid reciter identifier {reciter!r}.')
+        bytes_per_ms = options['bitrate'] * 1000 / 8 / 1000
+
+        try:
+            with open(options['path'], encoding='utf-8') as f:
+                data = json.load(f)
+            by_surah = {}
+            for surah, ayah, start_ms, end_ms in iter_verse_timings(data):
+                by_surah.setdefault(surah, {})[ayah] = (start_ms, end_ms)
+        except OSError as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+        except (ValueError, KeyError, TypeError) as e:
+            raise CommandError(f'Malformed timing file: {e}')
+
+        # RecitationTiming.surah is a foreign key; import_quran creates the rows
+        missing = set(by_surah) - set(
+            Surah.objects.filter(number__in=by_surah).values_list('number', flat=True)
+        )
+        if missing:
+            raise CommandError(
+                f'No Surah rows for {len(missing)} surah(s) in the file (e.g. {min(missing)}). '
+                'Run import_quran first.'
+            )
+
+        catalog = get_catalog()
+        imported = 0
+
+        for surah, ayahs in sorted(by_surah.items()):
+            meta = catalog.get(surah)
+            if meta is None or sorted(ayahs) != list(range(1, meta['totalAyah'] + 1)):
+                self.stdout.write(self.style.WARNING(f'Skipping surah {surah}: incomplete ayah timings.'))
+                continue
+
+            starts = [ayahs[n][0] for n in sorted(ayahs)]
+            ends = [ayahs[n][1] for n in sorted(ayahs)]
+            offsets = self.byte_offsets(cache_path(reciter, surah), starts, bytes_per_ms)
+
+            RecitationTiming.objects.update_or_create(
+                reciter=reciter,
+                surah_id=surah,
+                defaults={'data': TimingIndex(starts, ends, offsets).to_bytes()},
+            )
+            imported += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Imported timing indexes for {imported} surah(s) of {reciter}.')
+        )
+
+    def byte_offsets(self, path, starts, bytes_per_ms):
+        """
+        Frame-exact offsets from the cached file, else a CBR estimate that
+        starts after the file's ID3v2 tag (unknown, so 0, if it isn't cached)
+        """
+        tag_size = 0
+        try:
+            with open(path, 'rb') as f:
+                try:
+                    frames = get_frame_table(f)
+                except Mp3Error:
+                    f.seek(0)
+                    tag_size = id3v2_size(f.read(10))
+                else:
+                    return [frames.byte_offset(frames.frame_at(start)) for start in starts]
+        except OSError:
+            self.stdout.write(self.style.WARNING(
+                f'{path} is not in the audio cache; byte offsets are estimated from the bitrate.'
+            ))
+        return [tag_size + int(start * bytes_per_ms) for start in starts]
@@ -0,0 +1,204 @@
+import json
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from core.arabic import normalize_many
+from core.catalog import get_catalog
+from core.models import Surah, Ayah, AyahGeneration
+
+
+READ_CHUNK_SIZE = 1 << 16
+
+
+def iter_json_array(f):
+    """
+    Yield objects from a top-level JSON array one at a time, decoding
+    incrementally so the whole document never has to fit in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+
+    while True:
+        chunk = f.read(READ_CHUNK_SIZE)
+        buffer += chunk
+        pos = 0
+
+        while True:
+            # Skip whitespace, separators and the opening bracket
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,[':
+                if buffer[pos] == '[':
+                    started = True
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            if not started and pos < len(buffer):
+                raise ValueError('Expected a JSON array of ayah objects')
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # Object continues in the next chunk
+                break
+            yield obj
+            pos = end
+
+        buffer = buffer[pos:]
+        if not chunk:
+            if buffer.strip():
+                raise ValueError('Unexpected end of JSON input')
+            return
+
+
+def iter_jsonl(f):
+    """Yield one object per non-empty line"""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Import Quran text and translations from a JSON array or JSONL dump. '
+        'Each record needs "surah", "ayah", "language" and "text" keys. '
+        'Re-running the import only writes rows whose text changed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to a .json or .jsonl corpus dump')
+        parser.add_argument(
+            '--format',
+            choices=['json', 'jsonl'],
+            help='Input format (default: guessed from the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Rows written per bulk_create call (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'json')
+        batch_size = options['batch_size']
+
+        self.import_surahs()
+
+        stats = {'read': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        self.normalize_memo = {}
+        start = time.perf_counter()
+
+        try:
+            with open(path, encoding='utf-8') as f:
+                records = iter_jsonl(f) if fmt == 'jsonl' else iter_json_array(f)
+                for batch in batched(records, batch_size):
+                    self.import_batch(batch, stats, batch_size)
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f"  {stats['read']} rows read...")
+        except OSError as e:
+            raise CommandError(f'Could not read {path}: {e}')
+        except (ValueError, KeyError, TypeError) as e:
+            raise CommandError(f'Malformed corpus record near row {stats["read"]}: {e}')
+
+        elapsed = time.perf_counter() - start
+        rate = stats['read'] / elapsed if elapsed > 0 else 0
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {stats['read']} rows in {elapsed:.2f}s ({rate:,.0f} rows/s): "
+                f"{stats['created']} created, {stats['updated']} updated, "
+                f"{stats['unchanged']} unchanged, {stats['skipped']} skipped."
+            )
+        )
+
+    def import_surahs(self):
+        """Make sure every surah in the bundled catalog has a row"""
+        Surah.objects.bulk_create(
+            [
+                Surah(
+                    number=surah['surahNo'],
+                    name=surah['surahName'],
+                    name_arabic=surah['surahNameArabic'],
+                    name_translation=surah['surahNameTranslation'],
+                    revelation_place=surah['revelationPlace'],
+                    total_ayah=surah['totalAyah'],
+                )
+                for surah in get_catalog().surahs
+            ],
+            update_conflicts=True,
+            unique_fields=['number'],
+            update_fields=['name', 'name_arabic', 'name_translation', 'revelation_place', 'total_ayah'],
+        )
+
+    def import_batch(self, records, stats, batch_size):
+        catalog = get_catalog()
+        incoming = {}
+
+        for record in records:
+            stats['read'] += 1
+            surah, number = int(record['surah']), int(record['ayah'])
+            language = record.get('language') or 'ar'
+
+            surah_meta = catalog.get(surah)
+            if surah_meta is None or not (1 <= number <= surah_meta['totalAyah']):
+                stats['skipped'] += 1
+                continue
+            incoming[(surah, number, language)] = record['text']
+
+        if not incoming:
+            return
+
+        # One query fetches whatever already exists for this batch
+        groups = {}
+        for surah, number, language in incoming:
+            groups.setdefault((surah, language), []).append(number)
+        lookup = Q()
+        for (surah, language), numbers in groups.items():
+            lookup |= Q(surah_id=surah, language=language, number__in=numbers)
+
+        with transaction.atomic():
+            existing = {
+                (surah, number, language): text
+                for surah, number, language, text in Ayah.objects.filter(lookup).values_list(
+                    'surah_id', 'number', 'language', 'text'
+                )
+            }
+
+            changed = []
+            for key, text in incoming.items():
+                if key not in existing:
+                    stats['created'] += 1
+                elif existing[key] != text:
+                    stats['updated'] += 1
+                else:
+                    stats['unchanged'] += 1
+                    continue
+                surah, number, language = key
+                changed.append(Ayah(surah_id=surah, number=number, language=language, text=text))
+
+            # bulk_create skips Ayah.save(), so normalize the batch here
+            normalized = normalize_many([ayah.text for ayah in changed], self.normalize_memo)
+            for ayah, text_normalized in zip(changed, normalized):
+                ayah.text_normalized = text_normalized
+
+            if changed:
+                Ayah.objects.bulk_create(
+                    changed,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=['surah', 'number', 'language'],
+                    update_fields=['text', 'text_normalized'],
+                )
+                # Committed with the rows: the corpus built before is now stale
+                AyahGeneration.bump()
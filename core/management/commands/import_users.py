@@ -0,0 +1,107 @@
+import csv
+import time
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from core import usernames
+from core.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Create users from a CSV file with an "email" column and optional '
+        '"full_name" and "password" columns. Usernames are derived from the '
+        'emails; existing emails are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users inserted per query (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            f = open(options['path'], newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+
+        created = skipped = 0
+        with f:
+            reader = csv.DictReader(f)
+            if 'email' not in (reader.fieldnames or []):
+                raise CommandError('The CSV file needs an "email" column.')
+
+            batch = []
+            for row in reader:
+                batch.append(row)
+                if len(batch) >= options['batch_size']:
+                    c, s = self.import_batch(batch)
+                    created, skipped = created + c, skipped + s
+                    batch = []
+            if batch:
+                c, s = self.import_batch(batch)
+                created, skipped = created + c, skipped + s
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} user(s), skipped {skipped}, in {elapsed:.2f}s.'
+        ))
+
+    def import_batch(self, rows):
+        emails = {}
+        for row in rows:
+            email = (row.get('email') or '').strip()
+            if email and '@' in email and email.lower() not in emails:
+                emails[email.lower()] = row
+        # Compared lowercased on both sides: the unique constraint on email
+        # is case-sensitive, so Ahmed@ and ahmed@ would both go in
+        existing = set(
+            CustomUser.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails)
+            .values_list('email_lower', flat=True)
+        )
+
+        users = [
+            CustomUser(
+                email=row['email'].strip(),
+                full_name=(row.get('full_name') or '').strip() or None,
+                password=self.password(row.get('password')),
+            )
+            for email, row in emails.items() if email not in existing
+        ]
+        names = usernames.allocate([usernames.base_username(user.email) for user in users])
+        for user, username in zip(users, names):
+            user.username = username
+
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(users)
+        except IntegrityError:
+            # A signup took one of the names (or emails) meanwhile; go one by one
+            saved = []
+            for user in users:
+                user.pk, user.username = None, ''
+                try:
+                    usernames.save_with_username(user)
+                    saved.append(user)
+                except IntegrityError:
+                    pass
+            users = saved
+        return len(users), len(rows) - len(users)
+
+    def password(self, value):
+        """Django password hashes are kept; plain passwords are hashed; none is unusable"""
+        if not value:
+            return make_password(None)
+        try:
+            identify_hasher(value)
+            return value
+        except ValueError:
+            return make_password(value)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.page_cache import invalidate_pages
+
+
+class Command(BaseCommand):
+    help = 'Drop every page in the anonymous page cache, in every worker'
+
+    def handle(self, *args, **options):
+        invalidate_pages()
+        self.stdout.write(self.style.SUCCESS('Anonymous page cache invalidated.'))
@@ -0,0 +1,265 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.template.loader import get_template, render_to_string
+from django.test import RequestFactory
+
+from core.audio import player_urls
+from core.catalog import get_catalog
+from core.models import Ayah
+from core.quran_api import get_chapter_audio_url
+from core.reciters import get_reciters
+from core.verses import iter_ayahs
+
+try:
+    import brotli
+except ImportError:  # WhiteNoise serves the .gz variants alone
+    brotli = None
+
+
+PAGES_DIR = 'pages'
+# Where earlier versions kept the manifest, publicly served
+LEGACY_MANIFEST_NAME = f'{PAGES_DIR}/manifest.json'
+
+TEMPLATES = ('home/index.html', 'home/surah_audio.html', 'home/surah_audio_player.html')
+
+
+def digest(*parts):
+    """Stable hash of JSON-serializable parts"""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def sources_digest():
+    """
+    Hash of everything besides page data that ends up in the output: the
+    template sources and, in production, the collectstatic manifest (asset
+    URLs carry their content hash).
+    """
+    parts = [get_template(name).template.source for name in TEMPLATES]
+    manifest_name = getattr(staticfiles_storage, 'manifest_name', None)
+    if manifest_name and staticfiles_storage.exists(manifest_name):
+        with staticfiles_storage.open(manifest_name) as f:
+            parts.append(f.read().decode('utf-8'))
+    return digest(*parts)
+
+
+def write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def variants(name):
+    return [name, f'{name}.gz', f'{name}.br']
+
+
+def anonymous_request(path):
+    """
+    The request a page is rendered for: a GET from a visitor without a
+    session, so `request`, `user` and `messages` in templates are what any
+    anonymous visitor would get
+    """
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    return request
+
+
+def init_worker():
+    # Spawned (non-forked) workers start with Django unconfigured
+    django.setup()
+
+
+def render_page(job):
+    """
+    Render one page in a worker process and write it with .gz (and .br, if
+    brotli is installed) siblings. Returns (name, bytes written, seconds).
+    """
+    started = time.perf_counter()
+
+    if job['kind'] == 'json':
+        body = json.dumps(job['data'], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    else:
+        context = dict(job['context'])
+        if 'player' in job:
+            context['player'] = render_to_string('home/surah_audio_player.html', job['player'])
+        request = anonymous_request(job['path'])
+        body = render_to_string(job['template'], context, request=request).encode('utf-8')
+        if 'CSRF_COOKIE' in request.META:
+            # Every visitor would get the same token, and no cookie to match it
+            raise CommandError(f"{job['template']} uses csrf_token and can't be pre-rendered.")
+
+    outputs = {'': body, '.gz': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        outputs['.br'] = brotli.compress(body, quality=11)
+
+    root = Path(job['root'])
+    written = 0
+    for suffix, data in outputs.items():
+        write_atomic(root / f'{job["name"]}{suffix}', data)
+        written += len(data)
+
+    return job['name'], written, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the home grid and every surah page (HTML and ayah JSON) with .br/.gz '
+        'variants into PRERENDER_ROOT for WhiteNoise; only changed pages are rebuilt'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild every page')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Render processes (default: one per CPU)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        root = Path(settings.PRERENDER_ROOT)
+        manifest_path = Path(settings.PRERENDER_MANIFEST)
+        legacy_manifest_path = root / LEGACY_MANIFEST_NAME
+        previous = {}
+        for path in (manifest_path, legacy_manifest_path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    previous = json.load(f)['pages']
+                break
+            except (OSError, ValueError, KeyError):
+                continue
+
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('brotli is not installed; writing .gz variants only.'))
+
+        jobs = list(self.build_jobs(str(root), sources_digest()))
+        total = sum(1 for job in jobs if not job.get('unavailable'))
+
+        manifest = {}
+        pending = []
+        for job in jobs:
+            entry = previous.get(job['name'])
+            if job.get('unavailable'):
+                # Keep the last good page rather than pin an upstream outage
+                if entry is not None:
+                    manifest[job['name']] = {'source': entry['source']}
+                continue
+            unchanged = (
+                entry is not None
+                and entry['source'] == job['source']
+                and (root / job['name']).exists()
+            )
+            manifest[job['name']] = {'source': job['source']}
+            if options['force'] or not unchanged:
+                pending.append(job)
+
+        written = 0
+        if pending:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=max(options['workers'], 1), initializer=init_worker) as pool:
+                for name, size, _ in pool.map(render_page, pending, chunksize=4):
+                    written += size
+
+        # Drop pages that no longer exist, and the content-hashed copies
+        # earlier versions of this command wrote next to each page
+        for name, entry in previous.items():
+            stale = variants(entry['file']) if 'file' in entry else []
+            if name not in manifest:
+                stale += variants(name)
+            for path in stale:
+                try:
+                    (root / path).unlink()
+                except OSError:
+                    pass
+
+        write_atomic(
+            manifest_path,
+            json.dumps({'pages': manifest}, indent=2, sort_keys=True).encode('utf-8'),
+        )
+        try:
+            legacy_manifest_path.unlink()
+        except OSError:
+            pass
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {len(pending)} page(s), {total - len(pending)} unchanged, '
+            f'{written / 1e6:.1f} MB written in {elapsed:.2f}s.'
+        ))
+
+    def build_jobs(self, root, templates_hash):
+        """
+        Gather page data in this process (database and upstream access stay
+        here) and describe each page for the render workers.
+        """
+        catalog = get_catalog()
+        reciters = get_reciters()
+        reciter_id = settings.DEFAULT_RECITER_ID
+        if reciters and reciter_id not in {reciter['id'] for reciter in reciters}:
+            reciter_id = reciters[0]['id']
+        languages = list(Ayah.objects.order_by('language').values_list('language', flat=True).distinct())
+
+        def job(name, kind, source, **extra):
+            # JSON pages don't go through templates
+            source_hash = digest(templates_hash if kind == 'html' else None, kind, source)
+            return {
+                'root': root,
+                'name': name,
+                # The URL WhiteNoise serves it at
+                'path': '/' + name.removesuffix('index.html'),
+                'source': source_hash,
+                'kind': kind,
+                **extra,
+            }
+
+        context = {'surah_catalog': catalog.script_tag}
+        yield job(f'{PAGES_DIR}/index.html', 'html', context, template='home/index.html', context=context)
+
+        for surah in catalog.surahs:
+            number = surah['surahNo']
+
+            name = f'{PAGES_DIR}/surah/{number}/index.html'
+            if not (reciters and get_chapter_audio_url(reciter_id, number)):
+                yield {'name': name, 'unavailable': True}
+            else:
+                player = {
+                    'surah': surah,
+                    'reciters': reciters,
+                    'reciter_id': reciter_id,
+                    **player_urls(reciter_id, number),
+                }
+                context = {'surah_number': number, 'surah': surah}
+                yield job(
+                    name, 'html', [context, player],
+                    template='home/surah_audio.html', context=context, player=player,
+                )
+
+            data = {
+                'surah': surah,
+                'languages': languages,
+                'ayahs': list(iter_ayahs(number, 0, surah['totalAyah'], languages)),
+            }
+            yield job(f'{PAGES_DIR}/surah/{number}.json', 'json', data, data=data)
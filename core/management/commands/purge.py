@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.retention import POLICIES, count, purge
+
+
+class Command(BaseCommand):
+    help = 'Delete rows past their retention (RETENTION_DAYS) in small chunks; safe to run from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'policies',
+            nargs='*',
+            help=f'Policies to run (default: all of {", ".join(policy.name for policy in POLICIES)})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rows that would be deleted'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.PURGE_CHUNK_SIZE,
+            help='Rows deleted per statement (default: PURGE_CHUNK_SIZE)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=settings.PURGE_CHUNK_SLEEP,
+            help='Seconds to pause between chunks (default: PURGE_CHUNK_SLEEP)'
+        )
+
+    def handle(self, *args, **options):
+        names = options['policies']
+        unknown = set(names) - {policy.name for policy in POLICIES}
+        if unknown:
+            raise CommandError(f'Unknown policies: {", ".join(sorted(unknown))}')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+
+        total = 0
+        for policy in POLICIES:
+            if names and policy.name not in names:
+                continue
+            if policy.max_age is None:
+                self.stdout.write(f'{policy.name}: kept forever, skipped.')
+                continue
+
+            started = time.perf_counter()
+            if options['dry_run']:
+                rows = count(policy)
+                self.stdout.write(
+                    f'{policy.name}: {rows} row(s) older than {policy.max_age.days} day(s) would be deleted '
+                    f'(counted in {time.perf_counter() - started:.2f}s).'
+                )
+                continue
+
+            rows = chunks = 0
+            for deleted in purge(policy, chunk_size=options['chunk_size'], sleep=options['sleep']):
+                rows += deleted
+                chunks += 1
+            elapsed = time.perf_counter() - started
+            rate = rows / elapsed if elapsed else 0
+            self.stdout.write(
+                f'{policy.name}: deleted {rows} row(s) in {chunks} chunk(s), '
+                f'{elapsed:.2f}s ({rate:.0f} rows/s).'
+            )
+            total += rows
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Purge done: {total} row(s) deleted.'))
@@ -0,0 +1,50 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.rollups import REBUILD_BATCH_DAYS, rebuild_batches, rebuildable_since
+
+
+class Command(BaseCommand):
+    help = 'Recount the daily feedback rollups from the feedback table (backfill or repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='First day to rebuild, YYYY-MM-DD (default: oldest complete day still in the table)'
+        )
+        parser.add_argument(
+            '--until',
+            help='Day to stop before, YYYY-MM-DD (default: tomorrow)'
+        )
+        parser.add_argument(
+            '--batch-days',
+            type=int,
+            default=REBUILD_BATCH_DAYS,
+            help=f'Days recounted per upsert (default: {REBUILD_BATCH_DAYS})'
+        )
+
+    def handle(self, *args, **options):
+        since = parse_date(options['since']) if options['since'] else rebuildable_since()
+        until = parse_date(options['until']) if options['until'] else timezone.localdate() + timedelta(days=1)
+        if (options['since'] and since is None) or until is None:
+            raise CommandError('Dates must be YYYY-MM-DD.')
+        if options['batch_days'] < 1:
+            raise CommandError('--batch-days must be at least 1.')
+        if since is None:
+            self.stdout.write(self.style.WARNING('No feedback to count.'))
+            return
+
+        started = time.perf_counter()
+        total = 0
+        for first_day, rows in rebuild_batches(since, until, options['batch_days']):
+            total += rows
+            self.stdout.write(f'{first_day}: {rows} rollup row(s).')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {total} rollup row(s) for {since} to {until - timedelta(days=1)} '
+            f'in {time.perf_counter() - started:.2f}s.'
+        ))
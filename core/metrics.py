@@ -0,0 +1,18 @@
+import threading
+from collections import Counter
+
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def incr(name, amount=1):
+    """Increment a named in-process counter"""
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot(prefix=''):
+    """Copy of the counters of this process, optionally filtered by prefix"""
+    with _lock:
+        return {name: value for name, value in sorted(_counters.items()) if name.startswith(prefix)}
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:43
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Surah',
+            fields=[
+                ('number', models.PositiveSmallIntegerField(primary_key=True, serialize=False, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(114)])),
+                ('name', models.CharField(max_length=50)),
+                ('name_arabic', models.CharField(max_length=50)),
+                ('name_translation', models.CharField(max_length=100)),
+                ('revelation_place', models.CharField(choices=[('Mecca', 'Mecca'), ('Madina', 'Madina')], max_length=10)),
+                ('total_ayah', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Surah',
+                'verbose_name_plural': 'Surahs',
+                'ordering': ['number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Ayah',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField()),
+                ('language', models.CharField(default='ar', max_length=20)),
+                ('text', models.TextField()),
+                ('surah', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ayahs', to='core.surah')),
+            ],
+            options={
+                'verbose_name': 'Ayah',
+                'verbose_name_plural': 'Ayahs',
+                'ordering': ['surah', 'number', 'language'],
+                'constraints': [models.UniqueConstraint(fields=('surah', 'number', 'language'), name='unique_ayah_per_language')],
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations
+
+
+# PostgreSQL keeps a generated tsvector column (recomputed by the database
+# whenever a row changes) behind a GIN index.
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE core_ayah ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(text, ''))) STORED
+    """,
+    "CREATE INDEX core_ayah_search_vector_gin ON core_ayah USING gin (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS core_ayah_search_vector_gin",
+    "ALTER TABLE core_ayah DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite uses an external-content FTS5 table kept in sync by triggers.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE core_ayah_fts USING fts5(
+        text, language UNINDEXED,
+        content='core_ayah', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_insert AFTER INSERT ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(rowid, text, language) VALUES (new.id, new.text, new.language);
+    END
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_delete AFTER DELETE ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(core_ayah_fts, rowid, text, language)
+        VALUES ('delete', old.id, old.text, old.language);
+    END
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_update AFTER UPDATE ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(core_ayah_fts, rowid, text, language)
+        VALUES ('delete', old.id, old.text, old.language);
+        INSERT INTO core_ayah_fts(rowid, text, language) VALUES (new.id, new.text, new.language);
+    END
+    """,
+    "INSERT INTO core_ayah_fts(core_ayah_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS core_ayah_fts_update",
+    "DROP TRIGGER IF EXISTS core_ayah_fts_delete",
+    "DROP TRIGGER IF EXISTS core_ayah_fts_insert",
+    "DROP TABLE IF EXISTS core_ayah_fts",
+]
+
+
+def run_for_vendor(postgres_sql, sqlite_sql):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        statements = {'postgresql': postgres_sql, 'sqlite': sqlite_sql}.get(vendor, [])
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_surah_ayah'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,193 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+# A frozen copy of core.arabic as of this migration, so later changes to
+# the live normalization don't change what it writes
+DIACRITICS = [chr(c) for c in range(0x064B, 0x0660)] + ['\u0670']
+QURANIC_MARKS = [chr(c) for c in range(0x06D6, 0x06EE)]
+TATWEEL = '\u0640'
+FOLDED_LETTERS = {
+    '\u0623': '\u0627',  # alef with hamza above
+    '\u0625': '\u0627',  # alef with hamza below
+    '\u0622': '\u0627',  # alef with madda
+    '\u0671': '\u0627',  # alef wasla
+    '\u0624': '\u0648',  # waw with hamza
+    '\u0626': '\u064A',  # ya with hamza
+    '\u0649': '\u064A',  # alef maqsura
+    '\u06CC': '\u064A',  # Farsi ya
+    '\u0629': '\u0647',  # ta marbuta
+    '\u06A9': '\u0643',  # keheh
+}
+TRANSLATION_TABLE = str.maketrans({
+    **{ch: None for ch in DIACRITICS + QURANIC_MARKS + [TATWEEL]},
+    **FOLDED_LETTERS,
+})
+
+
+def normalize_many(texts, memo):
+    normalized = []
+    for text in texts:
+        words = []
+        for word in text.split():
+            folded = memo.get(word)
+            if folded is None:
+                folded = memo[word] = word.translate(TRANSLATION_TABLE).casefold()
+            if folded:
+                words.append(folded)
+        normalized.append(' '.join(words))
+    return normalized
+
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "DROP INDEX IF EXISTS core_ayah_search_vector_gin",
+    "ALTER TABLE core_ayah DROP COLUMN IF EXISTS search_vector",
+    """
+    ALTER TABLE core_ayah ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', text_normalized)) STORED
+    """,
+    "CREATE INDEX core_ayah_search_vector_gin ON core_ayah USING gin (search_vector)",
+    "CREATE INDEX core_ayah_text_normalized_trgm ON core_ayah USING gin (text_normalized gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS core_ayah_text_normalized_trgm",
+    "DROP INDEX IF EXISTS core_ayah_search_vector_gin",
+    "ALTER TABLE core_ayah DROP COLUMN IF EXISTS search_vector",
+    """
+    ALTER TABLE core_ayah ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(text, ''))) STORED
+    """,
+    "CREATE INDEX core_ayah_search_vector_gin ON core_ayah USING gin (search_vector)",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS core_ayah_fts_update",
+    "DROP TRIGGER IF EXISTS core_ayah_fts_delete",
+    "DROP TRIGGER IF EXISTS core_ayah_fts_insert",
+    "DROP TABLE IF EXISTS core_ayah_trigram",
+    "DROP TABLE IF EXISTS core_ayah_fts",
+]
+
+# Word index and trigram (substring) index, both over the normalized text
+SQLITE_FORWARD = SQLITE_DROP + [
+    """
+    CREATE VIRTUAL TABLE core_ayah_fts USING fts5(
+        text_normalized, language UNINDEXED,
+        content='core_ayah', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE core_ayah_trigram USING fts5(
+        text_normalized, language UNINDEXED,
+        content='core_ayah', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_insert AFTER INSERT ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(rowid, text_normalized, language)
+        VALUES (new.id, new.text_normalized, new.language);
+        INSERT INTO core_ayah_trigram(rowid, text_normalized, language)
+        VALUES (new.id, new.text_normalized, new.language);
+    END
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_delete AFTER DELETE ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(core_ayah_fts, rowid, text_normalized, language)
+        VALUES ('delete', old.id, old.text_normalized, old.language);
+        INSERT INTO core_ayah_trigram(core_ayah_trigram, rowid, text_normalized, language)
+        VALUES ('delete', old.id, old.text_normalized, old.language);
+    END
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_update AFTER UPDATE ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(core_ayah_fts, rowid, text_normalized, language)
+        VALUES ('delete', old.id, old.text_normalized, old.language);
+        INSERT INTO core_ayah_trigram(core_ayah_trigram, rowid, text_normalized, language)
+        VALUES ('delete', old.id, old.text_normalized, old.language);
+        INSERT INTO core_ayah_fts(rowid, text_normalized, language)
+        VALUES (new.id, new.text_normalized, new.language);
+        INSERT INTO core_ayah_trigram(rowid, text_normalized, language)
+        VALUES (new.id, new.text_normalized, new.language);
+    END
+    """,
+    "INSERT INTO core_ayah_fts(core_ayah_fts) VALUES ('rebuild')",
+    "INSERT INTO core_ayah_trigram(core_ayah_trigram) VALUES ('rebuild')",
+]
+
+# Back to the 0003 index over the raw text
+SQLITE_BACKWARD = SQLITE_DROP + [
+    """
+    CREATE VIRTUAL TABLE core_ayah_fts USING fts5(
+        text, language UNINDEXED,
+        content='core_ayah', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_insert AFTER INSERT ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(rowid, text, language) VALUES (new.id, new.text, new.language);
+    END
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_delete AFTER DELETE ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(core_ayah_fts, rowid, text, language)
+        VALUES ('delete', old.id, old.text, old.language);
+    END
+    """,
+    """
+    CREATE TRIGGER core_ayah_fts_update AFTER UPDATE ON core_ayah BEGIN
+        INSERT INTO core_ayah_fts(core_ayah_fts, rowid, text, language)
+        VALUES ('delete', old.id, old.text, old.language);
+        INSERT INTO core_ayah_fts(rowid, text, language) VALUES (new.id, new.text, new.language);
+    END
+    """,
+    "INSERT INTO core_ayah_fts(core_ayah_fts) VALUES ('rebuild')",
+]
+
+
+def run_for_vendor(postgres_sql, sqlite_sql):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        statements = {'postgresql': postgres_sql, 'sqlite': sqlite_sql}.get(vendor, [])
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+def normalize_existing_ayahs(apps, schema_editor):
+    Ayah = apps.get_model('core', 'Ayah')
+    memo = {}
+    last_pk = 0
+
+    while True:
+        batch = list(Ayah.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'text')[:5000])
+        if not batch:
+            break
+        for ayah, text_normalized in zip(batch, normalize_many([a.text for a in batch], memo)):
+            ayah.text_normalized = text_normalized
+        Ayah.objects.bulk_update(batch, ['text_normalized'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_ayah_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ayah',
+            name='text_normalized',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(normalize_existing_ayahs, migrations.RunPython.noop),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
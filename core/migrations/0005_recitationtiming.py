@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_ayah_text_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecitationTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reciter', models.CharField(max_length=64)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('surah', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timings', to='core.surah')),
+            ],
+            options={
+                'verbose_name': 'Recitation Timing',
+                'verbose_name_plural': 'Recitation Timings',
+                'ordering': ['reciter', 'surah'],
+                'constraints': [models.UniqueConstraint(fields=('reciter', 'surah'), name='unique_recitation_timing')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recitationtiming'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailverification',
+            index=models.Index(fields=['email', 'is_verified', 'created_at'], name='email_verification_lookup'),
+        ),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:29
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+# Full-text search for the Feedback and ContactMessage admin (see
+# core.changelist). The indexed document must stay identical to the one
+# LargeTableAdmin builds from search_columns, or the planner won't use it.
+POSTGRES_FORWARD = [
+    """
+    CREATE INDEX feedback_search_gin ON core_feedback
+        USING gin (to_tsvector('simple', "name" || ' ' || "message"))
+    """,
+    """
+    CREATE INDEX contact_message_search_gin ON core_contactmessage
+        USING gin (to_tsvector('simple', "name" || ' ' || "subject" || ' ' || "message"))
+    """,
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS contact_message_search_gin",
+    "DROP INDEX IF EXISTS feedback_search_gin",
+]
+
+
+# SQLite uses external-content FTS5 tables kept in sync by triggers, as for
+# core_ayah_fts.
+def sqlite_fts(table, columns):
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f"""
+        CREATE VIRTUAL TABLE {table}_fts USING fts5(
+            {column_list}, content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        f"""
+        CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_fts({table}_fts, rowid, {column_list})
+            VALUES ('delete', old.id, {old_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {table}_fts({table}_fts, rowid, {column_list})
+            VALUES ('delete', old.id, {old_values});
+            INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """,
+        f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+    ]
+
+
+def drop_sqlite_fts(table):
+    return [
+        f"DROP TRIGGER IF EXISTS {table}_fts_update",
+        f"DROP TRIGGER IF EXISTS {table}_fts_delete",
+        f"DROP TRIGGER IF EXISTS {table}_fts_insert",
+        f"DROP TABLE IF EXISTS {table}_fts",
+    ]
+
+
+SQLITE_FORWARD = (
+    sqlite_fts('core_feedback', ['name', 'message'])
+    + sqlite_fts('core_contactmessage', ['name', 'subject', 'message'])
+)
+SQLITE_BACKWARD = drop_sqlite_fts('core_contactmessage') + drop_sqlite_fts('core_feedback')
+
+
+def run_for_vendor(postgres_sql, sqlite_sql):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        statements = {'postgresql': postgres_sql, 'sqlite': sqlite_sql}.get(vendor, [])
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_retention_indexes'),
+    ]
+
+    # The new created_at indexes go in before the old ones come out, so
+    # purge and the admin are never left without one
+    operations = [
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['created_at', 'id'], name='contact_message_created_at_id'),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['is_read', 'created_at', 'id'], name='contact_message_read_created'),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='contact_message_email_upper'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['created_at', 'id'], name='feedback_created_at_id'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['feedback_type', 'created_at', 'id'], name='feedback_type_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='feedback_email_upper'),
+        ),
+        migrations.RemoveIndex(
+            model_name='contactmessage',
+            name='contact_message_created_at',
+        ),
+        migrations.RemoveIndex(
+            model_name='feedback',
+            name='feedback_created_at',
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:01
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill(apps, schema_editor):
+    """Count the feedback already in the table, one GROUP BY"""
+    Feedback = apps.get_model('core', 'Feedback')
+    FeedbackDailyRollup = apps.get_model('core', 'FeedbackDailyRollup')
+    counts = (
+        Feedback.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'feedback_type')
+        .annotate(count=Count('id'), rated_count=Count('rating'), rating_sum=Sum('rating'))
+        .order_by()
+    )
+    FeedbackDailyRollup.objects.bulk_create(
+        FeedbackDailyRollup(
+            day=row['day'],
+            feedback_type=row['feedback_type'],
+            count=row['count'],
+            rated_count=row['rated_count'],
+            rating_sum=row['rating_sum'] or 0,
+        )
+        for row in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_user_date_joined_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedbackDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('feedback_type', models.CharField(choices=[('bug', 'Bug Report'), ('feature', 'Feature Request'), ('improvement', 'Improvement Suggestion'), ('compliment', 'Compliment'), ('other', 'Other')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('rated_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Feedback Daily Rollup',
+                'verbose_name_plural': 'Feedback Daily Rollups',
+                'ordering': ['-day', 'feedback_type'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'feedback_type'), name='unique_feedback_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
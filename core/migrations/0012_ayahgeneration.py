@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_feedbackdailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AyahGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Ayah Generation',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_ayahgeneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('namespace', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Cache Generation',
+            },
+        ),
+    ]
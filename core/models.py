@@ -1,10 +1,15 @@
 import random
 from django.utils import timezone
 from datetime import timedelta
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.functions import Lower, Upper
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from . import ratelimit
+from .arabic import normalize_arabic
+
 
 class CustomUser(AbstractUser):
     full_name = models.CharField(max_length=150, null=True, blank=True)
@@ -13,6 +18,14 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['full_name']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Date-range exports (core.export) read users by join date
+            models.Index(fields=['date_joined', 'id'], name='user_date_joined_id'),
+            # import_users skips existing emails whatever their case
+            models.Index(Lower('email'), name='user_email_lower'),
+        ]
+
     groups = models.ManyToManyField(
         'auth.Group',
         verbose_name='groups',
@@ -78,11 +91,73 @@ class Feedback(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Feedback'
         verbose_name_plural = 'Feedbacks'
+        # Admin changelist (core.changelist): newest first with the pk as
+        # keyset tie-breaker, per-type filter, exact email search. Full-text
+        # search over name and message is added by migration 0009.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='feedback_created_at_id'),
+            models.Index(fields=['feedback_type', 'created_at', 'id'], name='feedback_type_created_at'),
+            models.Index(Upper('email'), name='feedback_email_upper'),
+        ]
 
     def __str__(self):
         display_name = self.name or "Anonymous"
         return f"{display_name} - {self.get_feedback_type_display()}"
 
+    def save(self, *args, **kwargs):
+        # New feedback is counted in the daily rollup in the same transaction
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                FeedbackDailyRollup.add(self)
+
+
+class FeedbackDailyRollup(models.Model):
+    """
+    Feedback counted per local day and type, for the admin dashboard.
+    Kept current by Feedback.save() and recounted from the raw table by
+    `manage.py rebuild_feedback_rollups` (see core.rollups).
+    """
+    day = models.DateField()
+    feedback_type = models.CharField(max_length=20, choices=Feedback.FEEDBACK_TYPE_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    rated_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day', 'feedback_type']
+        verbose_name = 'Feedback Daily Rollup'
+        verbose_name_plural = 'Feedback Daily Rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'feedback_type'], name='unique_feedback_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.feedback_type}: {self.count}"
+
+    @classmethod
+    def add(cls, feedback):
+        """
+        Count one new feedback with an atomic F() increment of its day's
+        row. The first feedback of a day and type creates the row; if a
+        concurrent request created it first, the increment is retried.
+        """
+        key = {'day': timezone.localdate(feedback.created_at), 'feedback_type': feedback.feedback_type}
+        rated = feedback.rating is not None
+        increments = {
+            'count': F('count') + 1,
+            'rated_count': F('rated_count') + int(rated),
+            'rating_sum': F('rating_sum') + (feedback.rating or 0),
+        }
+        if cls.objects.filter(**key).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**key, count=1, rated_count=int(rated), rating_sum=feedback.rating or 0)
+        except IntegrityError:
+            cls.objects.filter(**key).update(**increments)
+
 
 class ContactMessage(models.Model):
     name = models.CharField(max_length=150)
@@ -96,6 +171,12 @@ class ContactMessage(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Contact Message'
         verbose_name_plural = 'Contact Messages'
+        # As on Feedback; full-text search covers name, subject and message
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='contact_message_created_at_id'),
+            models.Index(fields=['is_read', 'created_at', 'id'], name='contact_message_read_created'),
+            models.Index(Upper('email'), name='contact_message_email_upper'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.subject}"
@@ -104,6 +185,156 @@ class ContactMessage(models.Model):
         return self.message[:100] + '...' if len(self.message) > 100 else self.message
 
 
+class Surah(models.Model):
+    REVELATION_PLACE_CHOICES = [
+        ('Mecca', 'Mecca'),
+        ('Madina', 'Madina'),
+    ]
+
+    number = models.PositiveSmallIntegerField(
+        primary_key=True,
+        validators=[MinValueValidator(1), MaxValueValidator(114)]
+    )
+    name = models.CharField(max_length=50)
+    name_arabic = models.CharField(max_length=50)
+    name_translation = models.CharField(max_length=100)
+    revelation_place = models.CharField(max_length=10, choices=REVELATION_PLACE_CHOICES)
+    total_ayah = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['number']
+        verbose_name = 'Surah'
+        verbose_name_plural = 'Surahs'
+
+    def __str__(self):
+        return f"{self.number}. {self.name}"
+
+
+class Ayah(models.Model):
+    """
+    A single verse in one language. The original Arabic text is stored with
+    language 'ar'; each translation is a separate row for the same verse.
+    """
+    surah = models.ForeignKey(Surah, on_delete=models.CASCADE, related_name='ayahs')
+    number = models.PositiveSmallIntegerField()
+    language = models.CharField(max_length=20, default='ar')
+    text = models.TextField()
+    # Search form of the text (see core.arabic); indexed for full-text,
+    # substring and fuzzy matching
+    text_normalized = models.TextField(blank=True, default='', editable=False)
+
+    class Meta:
+        ordering = ['surah', 'number', 'language']
+        verbose_name = 'Ayah'
+        verbose_name_plural = 'Ayahs'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['surah', 'number', 'language'],
+                name='unique_ayah_per_language',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.surah_id}:{self.number} ({self.language})"
+
+    def save(self, *args, **kwargs):
+        self.text_normalized = normalize_arabic(self.text)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            AyahGeneration.bump()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            AyahGeneration.bump()
+        return result
+
+
+class AyahGeneration(models.Model):
+    """
+    Single-row counter bumped with every change to ayah texts. build_corpus
+    stamps it into the corpus file, and a corpus whose generation differs
+    from the database's is not served (see core.corpus).
+    """
+    generation = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Ayah Generation'
+
+    def __str__(self):
+        return f"Ayah generation {self.generation}"
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('generation', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(generation=F('generation') + 1):
+            # A concurrent first bump may win the insert; either way it moved
+            try:
+                with transaction.atomic():
+                    cls.objects.create(pk=1, generation=1)
+            except IntegrityError:
+                cls.objects.filter(pk=1).update(generation=F('generation') + 1)
+
+
+class CacheGeneration(models.Model):
+    """
+    Generation of a core.tiered_cache namespace. Kept here rather than in
+    the shared cache, which may evict it: a generation that fell back to 0
+    would make invalidated entries reachable again.
+    """
+    namespace = models.CharField(max_length=100, primary_key=True)
+    generation = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Cache Generation'
+
+    def __str__(self):
+        return f"{self.namespace}: {self.generation}"
+
+    @classmethod
+    def current(cls, namespace):
+        return cls.objects.filter(pk=namespace).values_list('generation', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, namespace):
+        if not cls.objects.filter(pk=namespace).update(generation=F('generation') + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(pk=namespace, generation=1)
+            except IntegrityError:
+                cls.objects.filter(pk=namespace).update(generation=F('generation') + 1)
+
+
+class RecitationTiming(models.Model):
+    """
+    Ayah timing index of one recitation file (see core.audio_timing for the
+    packed array format of `data`).
+    """
+    reciter = models.CharField(max_length=64)
+    surah = models.ForeignKey(Surah, on_delete=models.CASCADE, related_name='timings')
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['reciter', 'surah']
+        verbose_name = 'Recitation Timing'
+        verbose_name_plural = 'Recitation Timings'
+        constraints = [
+            models.UniqueConstraint(fields=['reciter', 'surah'], name='unique_recitation_timing'),
+        ]
+
+    def __str__(self):
+        return f"{self.reciter} - {self.surah_id}"
+
+
+CODES_PER_HOUR = ratelimit.Rate('verification_codes', 3, 60 * 60)
+RESEND_COOLDOWN = ratelimit.Rate('verification_resend', 1, 60)
+CODE_LIFETIME = timedelta(minutes=5)
+
+
 class EmailVerification(models.Model):
     email = models.EmailField()
     code = models.CharField(max_length=6)
@@ -114,6 +345,12 @@ class EmailVerification(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Email Verification'
         verbose_name_plural = 'Email Verifications'
+        indexes = [
+            # Every lookup in the signup flow is by email and state, newest first
+            models.Index(fields=['email', 'is_verified', 'created_at'], name='email_verification_lookup'),
+            # Retention (core.retention) ages codes out by creation time
+            models.Index(fields=['created_at'], name='email_verification_created_at'),
+        ]
     
     def __str__(self):
         return f"{self.email} - {self.code}"
@@ -125,63 +362,21 @@ class EmailVerification(models.Model):
     
     def is_expired(self):
         """Check if code is older than 5 minutes"""
-        expiry_time = self.created_at + timedelta(minutes=5)
+        expiry_time = self.created_at + CODE_LIFETIME
         return timezone.now() > expiry_time
     
-    @classmethod
-    def check_rate_limit(cls, email):
-        """
-        Check if email has exceeded rate limit (3 codes per hour).
-        Returns tuple: (is_allowed, wait_time_seconds)
-        """
-        one_hour_ago = timezone.now() - timedelta(hours=1)
-        recent_attempts = cls.objects.filter(
-            email=email,
-            created_at__gte=one_hour_ago
-        ).count()
-        
-        if recent_attempts >= 3:
-            # Find the oldest attempt in the last hour
-            oldest_attempt = cls.objects.filter(
-                email=email,
-                created_at__gte=one_hour_ago
-            ).order_by('created_at').first()
-            
-            if oldest_attempt:
-                # Calculate when the rate limit will reset
-                reset_time = oldest_attempt.created_at + timedelta(hours=1)
-                wait_seconds = int((reset_time - timezone.now()).total_seconds())
-                return False, max(wait_seconds, 0)
-            
-            return False, 3600  # Default to 1 hour wait
-        
-        return True, 0
-    
-    @classmethod
-    def can_resend(cls, email):
-        """
-        Check if user can resend code (60 second cooldown).
-        Returns tuple: (can_resend, wait_time_seconds)
-        """
-        last_code = cls.objects.filter(email=email).order_by('-created_at').first()
-        
-        if last_code:
-            time_since_last = timezone.now() - last_code.created_at
-            if time_since_last.total_seconds() < 60:
-                wait_seconds = int(60 - time_since_last.total_seconds())
-                return False, wait_seconds
-        
-        return True, 0
-    
     @classmethod
     def create_verification(cls, email):
         """
         Create a new verification code for an email.
-        Checks rate limiting before creating.
+        Checks rate limiting (3 codes per hour, at least 60 seconds apart)
+        before creating.
         """
-        # Check rate limit
-        is_allowed, wait_time = cls.check_rate_limit(email)
-        if not is_allowed:
+        decision = ratelimit.hit(email.strip().lower(), RESEND_COOLDOWN, CODES_PER_HOUR)
+        if not decision.allowed:
+            wait_time = decision.retry_after
+            if decision.rate is RESEND_COOLDOWN:
+                raise ValueError(f"Please wait {wait_time} seconds before requesting a new code.")
             minutes = wait_time // 60
             seconds = wait_time % 60
             raise ValueError(
@@ -193,3 +388,62 @@ class EmailVerification(models.Model):
         
         code = cls.generate_code()
         return cls.objects.create(email=email, code=code)
+    
+    @classmethod
+    def verify(cls, email, code):
+        """
+        Mark an unexpired, unverified code for this email as verified in a
+        single conditional UPDATE. Returns whether a code matched, so of two
+        concurrent submissions of the same code only one succeeds.
+        """
+        return cls.objects.filter(
+            email=email,
+            code=code,
+            is_verified=False,
+            created_at__gt=timezone.now() - CODE_LIFETIME,
+        ).update(is_verified=True) > 0
+    
+    @classmethod
+    def is_email_verified(cls, email):
+        """Whether any code for this email has been verified"""
+        return cls.objects.filter(email=email, is_verified=True).exists()
+
+
+class OutboundEmail(models.Model):
+    """
+    A message waiting in the outbox. Requests only insert rows;
+    `manage.py send_outbox` delivers them (see core.outbox).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
+        indexes = [
+            # The worker's claim query: due pending messages, oldest first
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due'),
+            models.Index(fields=['created_at'], name='outbound_email_created_at'),
+        ]
+
+    def __str__(self):
+        return f"{', '.join(self.to)} - {self.subject}"
@@ -0,0 +1,210 @@
+"""
+Minimal pure-Python MPEG audio (Layer III) frame parser.
+
+Enough of the format to cut a recitation into ayah clips at frame
+boundaries without decoding or re-encoding: frame headers, a leading ID3v2
+tag, a trailing ID3v1 tag and the Xing/Info header frame that VBR (and
+LAME CBR) files start with. Every Layer III frame holds a fixed number of
+samples, so time -> frame is a division for CBR and VBR alike; only the
+byte offsets need a scan, which reads headers in buffered chunks.
+"""
+import os
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+
+
+READ_CHUNK_SIZE = 1 << 16
+MAX_FRAME_LENGTH = 1441  # 320 kbps at 32 kHz (or 160 kbps at 8 kHz), padded
+
+# kbps by [MPEG-1?][bitrate index] for Layer III
+BITRATES = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+}
+SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG-1
+    2: [22050, 24000, 16000],  # MPEG-2
+    0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+FrameHeader = namedtuple('FrameHeader', 'version sample_rate bitrate length samples mono')
+
+
+class Mp3Error(ValueError):
+    """The file is not a Layer III stream this parser understands"""
+
+
+def parse_header(b0, b1, b2, b3):
+    """Decode a 4-byte Layer III frame header; None if it isn't one"""
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = BITRATES[mpeg1][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    samples = 1152 if mpeg1 else 576
+    length = (samples // 8) * bitrate // sample_rate + padding
+    mono = (b3 >> 6) == 3
+    return FrameHeader(version, sample_rate, bitrate, length, samples, mono)
+
+
+def id3v2_size(header):
+    """Length of an ID3v2 tag given the first 10 bytes of the file"""
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def xing_tag(frame, header):
+    """b'Xing' (VBR) or b'Info' (CBR) for a Xing header frame, else None"""
+    if header.version == 3:
+        side_info = 17 if header.mono else 32
+    else:
+        side_info = 9 if header.mono else 17
+    tag = frame[4 + side_info:8 + side_info]
+    return tag if tag in (b'Xing', b'Info') else None
+
+
+class FrameTable:
+    """
+    Byte offset of every audio frame in a file, plus where the audio ends.
+    All frames share one duration, so the frame playing at a time is
+    ms // frame_ms.
+    """
+
+    def __init__(self, offsets, data_end, frame_ms, vbr):
+        self.offsets = offsets
+        self.data_end = data_end
+        self.frame_ms = frame_ms
+        self.vbr = vbr
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def duration_ms(self):
+        return len(self.offsets) * self.frame_ms
+
+    def frame_at(self, ms):
+        return min(max(int(ms // self.frame_ms), 0), len(self.offsets))
+
+    def byte_offset(self, frame_index):
+        """Start of a frame; len(self) means the end of the audio data"""
+        if frame_index >= len(self.offsets):
+            return self.data_end
+        return self.offsets[frame_index]
+
+    def byte_range(self, start_ms, end_ms):
+        """[start, end) bytes holding every frame that overlaps the interval"""
+        first = self.frame_at(start_ms)
+        last = min(-int(-end_ms // self.frame_ms), len(self.offsets))
+        return self.byte_offset(first), self.byte_offset(max(last, first))
+
+
+def scan_frames(f):
+    """Build the FrameTable of an open MP3 file by walking frame headers"""
+    f.seek(0)
+    position = id3v2_size(f.read(10))
+    f.seek(position)
+    buffer = f.read(READ_CHUNK_SIZE)
+    buffer_start = position
+
+    offsets = array('I')
+    first = None
+    vbr = False
+    data_end = position
+
+    while True:
+        cursor = position - buffer_start
+        # Refill so the buffer always holds a whole frame (unless at EOF)
+        if cursor > 0 and len(buffer) - cursor < MAX_FRAME_LENGTH:
+            f.seek(position)
+            buffer = f.read(READ_CHUNK_SIZE)
+            buffer_start, cursor = position, 0
+        if len(buffer) - cursor < 4:
+            break
+
+        header = parse_header(*buffer[cursor:cursor + 4])
+        if header is None or (first is not None and header.sample_rate != first.sample_rate):
+            if buffer[cursor:cursor + 3] == b'TAG':
+                break  # ID3v1 tag at the end of the file
+            # Junk between frames: resynchronize on the next byte
+            position += 1
+            continue
+        if cursor + header.length > len(buffer):
+            break  # truncated last frame
+
+        if first is None:
+            first = header
+            tag = xing_tag(buffer[cursor:cursor + header.length], header)
+            if tag:
+                # Metadata, not audio: never copied into clips
+                vbr = tag == b'Xing'
+                position += header.length
+                continue
+
+        offsets.append(position)
+        position += header.length
+        data_end = position
+
+    if first is None:
+        raise Mp3Error('No MPEG Layer III frames found')
+
+    return FrameTable(offsets, data_end, first.samples * 1000 / first.sample_rate, vbr)
+
+
+FRAME_TABLE_CACHE_SIZE = 16
+
+_frame_tables = OrderedDict()
+_frame_tables_lock = threading.Lock()
+
+
+def get_frame_table(f):
+    """
+    FrameTable of an open file, scanned once per process while the file is
+    unchanged. Keyed on inode rather than mtime: the audio cache bumps
+    mtime on every hit, but replaces files with a rename (a new inode).
+    """
+    stat = os.fstat(f.fileno())
+    key = (f.name, stat.st_ino, stat.st_size)
+    with _frame_tables_lock:
+        table = _frame_tables.get(key)
+        if table is not None:
+            _frame_tables.move_to_end(key)
+            return table
+
+    table = scan_frames(f)
+    with _frame_tables_lock:
+        _frame_tables[key] = table
+        while len(_frame_tables) > FRAME_TABLE_CACHE_SIZE:
+            _frame_tables.popitem(last=False)
+    return table
+
+
+def iter_byte_range(f, start, end, loops=1, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield bytes [start, end) of an open file, repeated `loops` times, in
+    chunks. The file is closed once the generator is exhausted or closed.
+    """
+    with f:
+        for _ in range(loops):
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
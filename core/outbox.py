@@ -0,0 +1,144 @@
+"""
+Database-backed outbox for outgoing email.
+
+Requests call queue() (or queue_message() for an already built
+EmailMessage), which is one INSERT, so a slow SMTP relay never holds up a
+worker. `manage.py send_outbox` drains the outbox with deliver_batch():
+
+- claim up to OUTBOX_BATCH_SIZE due messages with SELECT ... FOR UPDATE
+  SKIP LOCKED, so any number of senders can run side by side, and lease
+  them for OUTBOX_LEASE seconds before committing. A sender that dies
+  mid-batch only delays its messages until the lease runs out.
+- send the whole batch over one SMTP connection from get_connection().
+- mark each message sent, or schedule a retry after OUTBOX_RETRY_BACKOFF
+  seconds, doubling per attempt, until OUTBOX_MAX_ATTEMPTS marks it failed.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from . import metrics
+from .models import OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue(subject, body, to, html_body='', from_email=None):
+    """Add a message to the outbox"""
+    metrics.incr('outbox.queued')
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+
+def queue_message(message):
+    """Add an EmailMessage (optionally with an HTML alternative) to the outbox"""
+    html_body = ''
+    body = message.body
+    if message.content_subtype == 'html':
+        html_body, body = body, strip_tags(body)
+    for content, mimetype in getattr(message, 'alternatives', []):
+        if mimetype == 'text/html':
+            html_body = content
+    return queue(message.subject, body, message.to, html_body, message.from_email)
+
+
+def build_message(outbound, connection):
+    message = EmailMultiAlternatives(
+        subject=outbound.subject,
+        body=outbound.body,
+        from_email=outbound.from_email,
+        to=outbound.to,
+        connection=connection,
+    )
+    if outbound.html_body:
+        message.attach_alternative(outbound.html_body, 'text/html')
+    return message
+
+
+def claim(batch_size):
+    """Lease up to batch_size due messages to this sender"""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if batch:
+            OutboundEmail.objects.filter(pk__in=[outbound.pk for outbound in batch]).update(
+                next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE),
+            )
+    return batch
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1))
+
+
+def deliver_batch(batch_size=None):
+    """
+    Send one batch of due messages over a single connection. Returns
+    (sent, failed) counts; failed messages are rescheduled or given up on.
+    """
+    batch = claim(batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # Nothing got through; every message of the batch counts an attempt
+        for outbound in batch:
+            record_failure(outbound, e)
+        metrics.incr('outbox.failed', len(batch))
+        return 0, len(batch)
+
+    try:
+        for outbound in batch:
+            try:
+                build_message(outbound, connection).send()
+            except Exception as e:
+                record_failure(outbound, e)
+                failed += 1
+            else:
+                outbound.status = OutboundEmail.STATUS_SENT
+                outbound.attempts += 1
+                outbound.sent_at = timezone.now()
+                outbound.last_error = ''
+                outbound.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+                sent += 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    metrics.incr('outbox.sent', sent)
+    metrics.incr('outbox.failed', failed)
+    return sent, failed
+
+
+def record_failure(outbound, error):
+    outbound.attempts += 1
+    outbound.last_error = f'{type(error).__name__}: {error}'[:1000]
+    if outbound.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        outbound.status = OutboundEmail.STATUS_FAILED
+        logger.error("Giving up on email %s to %s: %s", outbound.pk, outbound.to, outbound.last_error)
+    else:
+        outbound.next_attempt_at = timezone.now() + retry_delay(outbound.attempts)
+        logger.warning("Email %s to %s failed, retrying: %s", outbound.pk, outbound.to, outbound.last_error)
+    outbound.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
@@ -0,0 +1,173 @@
+"""
+Full-page cache for anonymous visitors.
+
+Views decorated with @cache_for_anonymous render the same HTML for every
+visitor without a session. AnonymousPageCacheMiddleware sits right after
+WhiteNoise and answers repeat requests for those pages from the 'tiered'
+cache (over the 'pages' store, away from rate limits and locks) before
+the session, auth and messages middleware or the view run.
+
+A request bypasses the cache when it isn't a GET or HEAD, or carries a
+session or messages cookie. That covers signed-in users and anyone with
+a flash message still to show. A response is only stored when the view
+was decorated, the status is 200, and it sets no cookies (a CSRF cookie,
+say).
+
+Keys are the host, the path and only the query parameters the view lists
+in @cache_for_anonymous(query=...), under PAGE_CACHE_VERSION (the
+deployed commit by default), so a deploy starts from a fresh cache.
+Tracking parameters and cache-busting junk all share one entry; a view
+must not read a parameter it doesn't list. Requests for URLs that don't
+resolve to a decorated view skip the cache without a lookup.
+PAGE_CACHE_TIMEOUT = 0 (the default with DEBUG) turns the cache off.
+invalidate_pages() (`manage.py invalidate_pages`) drops every cached
+page in every worker, through the tiered cache's version keys.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.http import urlencode
+
+from . import metrics
+
+
+NAMESPACE = 'page'
+
+# Headers worth replaying; the rest (Date, Vary-dependent bits) are
+# per-response
+STORED_HEADERS = ('Content-Type', 'Content-Language', 'Cache-Control', 'Vary', 'X-Frame-Options')
+
+
+def cache_for_anonymous(view=None, *, query=()):
+    """
+    Let AnonymousPageCacheMiddleware cache this view's responses, keyed on
+    the query parameters in `query` and no others. The view can still opt
+    a response out with response.cache_for_anonymous = False.
+    """
+    if view is None:
+        return lambda view: cache_for_anonymous(view, query=query)
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            return mark(await view(request, *args, **kwargs))
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return mark(view(request, *args, **kwargs))
+    wrapper.page_cache_query = tuple(sorted(query))
+    return wrapper
+
+
+def mark(response):
+    if not hasattr(response, 'cache_for_anonymous'):
+        response.cache_for_anonymous = True
+    return response
+
+
+def invalidate_pages():
+    caches['tiered'].invalidate(NAMESPACE)
+
+
+def cached_query(request):
+    """The query parameters the request's view is cached on, or None if it isn't cached"""
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    return getattr(match.func, 'page_cache_query', None)
+
+
+def page_key(request, query=()):
+    params = [(name, value) for name in query for value in request.GET.getlist(name)]
+    url = f'{request.get_host()}{request.path}?{urlencode(params)}'
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+    return f'{NAMESPACE}:{settings.PAGE_CACHE_VERSION}:{digest}'
+
+
+def is_cacheable_request(request):
+    return (
+        settings.PAGE_CACHE_TIMEOUT > 0
+        and request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def is_cacheable_response(response):
+    return (
+        getattr(response, 'cache_for_anonymous', False)
+        and response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+    )
+
+
+def freeze(response):
+    headers = {name: response[name] for name in STORED_HEADERS if response.has_header(name)}
+    return {'content': response.content, 'headers': headers}
+
+
+def thaw(entry, request):
+    response = HttpResponse(b'' if request.method == 'HEAD' else entry['content'])
+    for name, value in entry['headers'].items():
+        response[name] = value
+    response['Content-Length'] = str(len(entry['content']))
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+class AnonymousPageCacheMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        query = cached_query(request) if is_cacheable_request(request) else None
+        if query is None:
+            return self.get_response(request)
+
+        key = page_key(request, query)
+        entry = caches['tiered'].get(key)
+        if entry is not None:
+            metrics.incr('page_cache.hit')
+            return thaw(entry, request)
+        metrics.incr('page_cache.miss')
+
+        response = self.get_response(request)
+        if is_cacheable_response(response):
+            metrics.incr('page_cache.store')
+            caches['tiered'].set(key, freeze(response), settings.PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+    async def __acall__(self, request):
+        query = cached_query(request) if is_cacheable_request(request) else None
+        if query is None:
+            return await self.get_response(request)
+
+        key = page_key(request, query)
+        entry = await caches['tiered'].aget(key)
+        if entry is not None:
+            metrics.incr('page_cache.hit')
+            return thaw(entry, request)
+        metrics.incr('page_cache.miss')
+
+        response = await self.get_response(request)
+        if is_cacheable_response(response):
+            metrics.incr('page_cache.store')
+            await caches['tiered'].aset(key, freeze(response), settings.PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
@@ -0,0 +1,146 @@
+import logging
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import upstream
+from .async_http import get_async_client
+
+
+logger = logging.getLogger(__name__)
+
+
+def api_url(path):
+    return f"{settings.QURAN_API_URL.rstrip('/')}/{path.lstrip('/')}"
+
+
+def api_host():
+    return urlsplit(settings.QURAN_API_URL).netloc
+
+
+def request_json(path, **params):
+    """
+    GET a path on the quran.com API through the upstream guard (breaker and
+    retries). Returns parsed JSON, None for a 4xx answer, and raises
+    UpstreamUnavailable when upstream can't answer.
+    """
+    url = api_url(path)
+
+    def get():
+        response = requests.get(url, params=params, timeout=settings.QURAN_API_TIMEOUT)
+        if 400 <= response.status_code < 500:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    return upstream.call(api_host(), get, (requests.RequestException, ValueError))
+
+
+def fetch_json(path, **params):
+    """GET a path on the quran.com API; returns parsed JSON or None on failure"""
+    try:
+        return request_json(path, **params)
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Quran API request to %s failed: %s", api_url(path), e)
+        return None
+
+
+async def arequest_json(path, **params):
+    """
+    request_json() for async views. Under ASGI it uses the shared pooled
+    client; under WSGI every async view runs in a throwaway event loop that
+    a pool can't outlive, so it defers to request_json() in a thread.
+    """
+    if settings.SERVER_MODE != 'asgi':
+        return await sync_to_async(request_json, thread_sensitive=False)(path, **params)
+
+    url = api_url(path)
+
+    async def get():
+        response = await get_async_client(url).get(url, params=params, timeout=settings.QURAN_API_TIMEOUT)
+        if 400 <= response.status_code < 500:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    return await upstream.acall(api_host(), get, (httpx.HTTPError, ValueError))
+
+
+async def afetch_json(path, **params):
+    try:
+        return await arequest_json(path, **params)
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Quran API request to %s failed: %s", api_url(path), e)
+        return None
+
+
+def parse_recitations(data):
+    if not data:
+        return []
+
+    return sorted(
+        (
+            {
+                'id': item['id'],
+                'reciter_name': item['reciter_name'],
+                'style': item.get('style'),
+            }
+            for item in data.get('recitations', [])
+        ),
+        key=lambda item: item['reciter_name'],
+    )
+
+
+def fetch_recitations():
+    """
+    Fetch the list of available reciters as dicts with id, reciter_name and
+    style, sorted by name. Uncached (see core.reciters); [] on failure.
+    """
+    return parse_recitations(fetch_json('resources/recitations', language='en'))
+
+
+async def afetch_recitations():
+    return parse_recitations(await afetch_json('resources/recitations', language='en'))
+
+
+def chapter_audio_key(reciter_id, surah_number):
+    return f'quran_api:chapter_audio:{reciter_id}:{surah_number}'
+
+
+def parse_chapter_audio_url(data):
+    return ((data or {}).get('audio_file') or {}).get('audio_url')
+
+
+def get_chapter_audio_url(reciter_id, surah_number):
+    """
+    Audio URL of a whole surah for one reciter, or None. Fetched once at a
+    time across workers, and the last known URL is kept for outages.
+    """
+    path = f'chapter_recitations/{reciter_id}/{surah_number}'
+    try:
+        return upstream.cached(
+            chapter_audio_key(reciter_id, surah_number),
+            lambda: parse_chapter_audio_url(request_json(path)),
+            settings.QURAN_API_CACHE_TIMEOUT,
+        )
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Quran API request to %s failed: %s", api_url(path), e)
+        return None
+
+
+async def aget_chapter_audio_url(reciter_id, surah_number):
+    path = f'chapter_recitations/{reciter_id}/{surah_number}'
+
+    async def fetch():
+        return parse_chapter_audio_url(await arequest_json(path))
+
+    try:
+        return await upstream.acached(
+            chapter_audio_key(reciter_id, surah_number), fetch, settings.QURAN_API_CACHE_TIMEOUT,
+        )
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Quran API request to %s failed: %s", api_url(path), e)
+        return None
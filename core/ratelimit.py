@@ -0,0 +1,121 @@
+"""
+Atomic rate limiting on the Django cache.
+
+Each Rate is a GCRA token bucket (limit requests per period, bursting up
+to limit) stored as a single number per key: the theoretical arrival time
+of the next request. hit() checks one or more rates for a key and only
+consumes from all of them if every one allows the request.
+
+With the Redis cache backend a check is one Lua script call, so it is a
+single round trip and atomic across workers and servers. Other backends
+(the file-based cache on a single box) fall back to a process lock
+around get_many/set_many, which is atomic within one process.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+
+Decision = namedtuple('Decision', 'allowed retry_after rate')
+
+
+class Rate:
+    """At most `limit` hits per `period` seconds (bursts of up to `limit`)"""
+
+    def __init__(self, name, limit, period):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.interval = period / limit
+
+    def __repr__(self):
+        return f'Rate({self.name!r}, {self.limit}, {self.period})'
+
+    def cache_key(self, key):
+        digest = hashlib.sha256(str(key).encode('utf-8')).hexdigest()[:32]
+        return f'ratelimit:{self.name}:{digest}'
+
+
+# KEYS: one bucket per rate; ARGV: period, interval for each rate.
+# Returns {index of the refusing rate (0 if allowed), seconds to wait}.
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tats = {}
+local refused, retry = 0, 0
+for i, key in ipairs(KEYS) do
+    local period = tonumber(ARGV[2 * i - 1])
+    local interval = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', key) or now)
+    if tat < now then tat = now end
+    tats[i] = tat + interval
+    local wait = tats[i] - period - now
+    if wait > retry then refused, retry = i, wait end
+end
+if refused == 0 then
+    for i, key in ipairs(KEYS) do
+        redis.call('SET', key, tostring(tats[i]), 'PX', math.ceil((tats[i] - now) * 1000))
+    end
+end
+return {refused, tostring(retry)}
+"""
+
+_script = None
+_local_lock = threading.Lock()
+
+
+def hit(key, *rates):
+    """
+    Count one request for key against every rate. Returns a Decision; when
+    refused, retry_after is whole seconds until it would be allowed and
+    rate is the rate that refused it.
+    """
+    return hit_all(*[(rate, key) for rate in rates])
+
+
+def hit_all(*checks):
+    """hit() for (rate, key) pairs with a key of their own, still atomic"""
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        refused, retry_after = _hit_redis(backend, checks)
+    else:
+        refused, retry_after = _hit_local(backend, checks)
+
+    if refused:
+        return Decision(False, max(math.ceil(retry_after), 1), checks[refused - 1][0])
+    return Decision(True, 0, None)
+
+
+def _hit_redis(backend, checks):
+    global _script
+    keys = [backend.make_and_validate_key(rate.cache_key(key)) for rate, key in checks]
+    client = backend._cache.get_client(keys[0], write=True)
+    if _script is None:
+        _script = client.register_script(GCRA_SCRIPT)
+    args = [value for rate, _ in checks for value in (rate.period, rate.interval)]
+    refused, retry_after = _script(keys=keys, args=args, client=client)
+    return int(refused), float(retry_after)
+
+
+def _hit_local(backend, checks):
+    keys = [rate.cache_key(key) for rate, key in checks]
+    with _local_lock:
+        now = time.time()
+        stored = backend.get_many(keys)
+        tats = {}
+        refused, retry_after = 0, 0
+        for i, ((rate, _), cache_key) in enumerate(zip(checks, keys), start=1):
+            tat = max(stored.get(cache_key, now), now) + rate.interval
+            tats[cache_key] = tat
+            wait = tat - rate.period - now
+            if wait > retry_after:
+                refused, retry_after = i, wait
+        if not refused:
+            for cache_key, tat in tats.items():
+                backend.set(cache_key, tat, math.ceil(tat - now))
+    return refused, retry_after
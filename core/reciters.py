@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .quran_api import afetch_recitations, fetch_recitations
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'reciters:catalog'
+REFRESH_LOCK_KEY = 'reciters:refreshing'
+REFRESH_LOCK_TIMEOUT = 60
+
+
+class ReciterCatalog:
+    """
+    The quran.com reciter list, served from memory, the shared Django cache
+    or a file on disk, in that order. Once an entry is older than the TTL it
+    keeps being served while a single background thread refreshes it
+    (stale-while-revalidate); only a completely cold start waits on upstream.
+    """
+
+    def __init__(self, ttl, persist_path):
+        self.ttl = ttl
+        self.persist_path = Path(persist_path)
+        self.entry = None
+        self.refresh_lock = threading.Lock()
+
+    def get(self):
+        """Return the list of reciters (empty if upstream was never reachable)"""
+        entry = self.entry or self.load_cached()
+
+        if entry is None:
+            metrics.incr('reciters.miss')
+            entry = self.refresh()
+            return entry['reciters'] if entry else []
+
+        self.entry = entry
+        if self.is_stale(entry):
+            self.refresh_in_background()
+        return self.entry['reciters']
+
+    async def aget(self):
+        """
+        get() for async views: a cold start awaits the async upstream client,
+        and the cache calls behind a refresh run off the event loop
+        """
+        entry = self.entry
+        if entry is None:
+            entry = await sync_to_async(self.load_cached)()
+            if entry is None:
+                metrics.incr('reciters.miss')
+                reciters = await afetch_recitations()
+                entry = await sync_to_async(self.store)(reciters)
+                return entry['reciters'] if entry else []
+            self.entry = entry
+
+        if self.is_stale(entry):
+            await sync_to_async(self.refresh_in_background)()
+        return self.entry['reciters']
+
+    def is_stale(self, entry):
+        if time.time() - entry['fetched_at'] > self.ttl:
+            metrics.incr('reciters.stale')
+            return True
+        metrics.incr('reciters.hit')
+        return False
+
+    def load_cached(self):
+        return self.load_shared() or self.load_from_disk()
+
+    def load_shared(self):
+        entry = cache.get(CACHE_KEY)
+        if entry is not None:
+            metrics.incr('reciters.shared_hit')
+        return entry
+
+    def load_from_disk(self):
+        try:
+            with open(self.persist_path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        metrics.incr('reciters.disk_hit')
+        return entry
+
+    def save_to_disk(self, entry):
+        self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.persist_path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+    def refresh(self):
+        """Fetch from upstream and store everywhere; returns the new entry or None"""
+        return self.store(fetch_recitations())
+
+    def store(self, reciters):
+        if not reciters:
+            metrics.incr('reciters.refresh_failed')
+            return None
+
+        entry = {'reciters': reciters, 'fetched_at': time.time()}
+        self.entry = entry
+        # The shared copy outlives the TTL so stale data can still be served
+        cache.set(CACHE_KEY, entry, None)
+        try:
+            self.save_to_disk(entry)
+        except OSError as e:
+            logger.warning("Could not persist reciter catalog to %s: %s", self.persist_path, e)
+        metrics.incr('reciters.refresh')
+        return entry
+
+    def refresh_in_background(self):
+        # One refresh per process, and one across workers via the cache lock
+        if not self.refresh_lock.acquire(blocking=False):
+            return
+        if not cache.add(REFRESH_LOCK_KEY, 1, REFRESH_LOCK_TIMEOUT):
+            self.refresh_lock.release()
+            # Another worker is refreshing (or upstream just failed); adopt
+            # its result once it lands in the shared cache
+            shared = cache.get(CACHE_KEY)
+            if shared and shared['fetched_at'] > self.entry['fetched_at']:
+                self.entry = shared
+            return
+
+        def run():
+            try:
+                if self.refresh():
+                    cache.delete(REFRESH_LOCK_KEY)
+                # On failure the lock is left to expire, so upstream is
+                # retried at most once per REFRESH_LOCK_TIMEOUT
+            finally:
+                self.refresh_lock.release()
+
+        threading.Thread(target=run, name='reciter-catalog-refresh', daemon=True).start()
+
+
+_catalog = None
+
+
+def get_reciter_catalog():
+    global _catalog
+    if _catalog is None:
+        _catalog = ReciterCatalog(settings.RECITERS_TTL, settings.RECITERS_CACHE_FILE)
+    return _catalog
+
+
+def get_reciters():
+    """List of reciters as dicts with id, reciter_name and style"""
+    return get_reciter_catalog().get()
+
+
+async def aget_reciters():
+    return await get_reciter_catalog().aget()
@@ -0,0 +1,113 @@
+"""
+Retention policies and a chunked purge for them.
+
+Each Policy names a model, the date field that ages its rows and the
+setting in RETENTION_DAYS that says how old a row may get (None keeps
+rows forever). purge() never deletes with one unbounded statement:
+
+- it finds the highest primary key among expired rows once, which bounds
+  every later scan;
+- it then deletes in primary-key order, PURGE_CHUNK_SIZE rows per
+  statement and transaction, each chunk starting after the last key of
+  the one before, sleeping PURGE_CHUNK_SLEEP seconds between chunks.
+
+Locks are held for one short chunk at a time, WAL grows in small steps,
+and the site keeps running while a purge runs from cron. The date field
+is indexed on every policy's model, so a dry run's count of a policy
+with no extra filter is an index-only scan on Postgres.
+"""
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+
+class Policy:
+
+    def __init__(self, name, model, date_field, **filters):
+        self.name = name
+        self.model_label = model
+        self.date_field = date_field
+        self.filters = filters
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def max_age(self):
+        days = settings.RETENTION_DAYS.get(self.name)
+        return None if days is None else timedelta(days=days)
+
+    def expired(self, max_age=None):
+        """Rows older than max_age (default: the policy's), or None if kept forever"""
+        max_age = self.max_age if max_age is None else max_age
+        if max_age is None:
+            return None
+        cutoff = timezone.now() - max_age
+        return self.model._default_manager.filter(
+            **{f'{self.date_field}__lt': cutoff}, **self.filters
+        ).order_by()
+
+
+POLICIES = [
+    Policy('verifications', 'core.EmailVerification', 'created_at'),
+    # Pending mail is never purged, however old
+    Policy('outbox', 'core.OutboundEmail', 'created_at', status__in=['sent', 'failed']),
+    # Expired sessions (age 0: as soon as expire_date has passed)
+    Policy('sessions', 'sessions.Session', 'expire_date'),
+    Policy('feedback', 'core.Feedback', 'created_at'),
+    # Unread messages are kept until someone has read them
+    Policy('contact_messages', 'core.ContactMessage', 'created_at', is_read=True),
+]
+
+
+def get_policy(name):
+    for policy in POLICIES:
+        if policy.name == name:
+            return policy
+    raise KeyError(name)
+
+
+def count(policy, max_age=None):
+    queryset = policy.expired(max_age)
+    return 0 if queryset is None else queryset.count()
+
+
+def purge(policy, max_age=None, chunk_size=None, sleep=None):
+    """
+    Delete the policy's expired rows in primary-key ordered chunks,
+    yielding the number of rows deleted by each chunk.
+    """
+    chunk_size = chunk_size or settings.PURGE_CHUNK_SIZE
+    sleep = settings.PURGE_CHUNK_SLEEP if sleep is None else sleep
+    queryset = policy.expired(max_age)
+    if queryset is None:
+        return
+
+    # Rows that expire while we run wait for the next purge
+    last = queryset.aggregate(last=Max('pk'))['last']
+    if last is None:
+        return
+    queryset = queryset.filter(pk__lte=last)
+
+    after = None
+    while True:
+        chunk = queryset if after is None else queryset.filter(pk__gt=after)
+        with transaction.atomic():
+            pks = list(chunk.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return
+            deleted, _ = policy.model._default_manager.filter(pk__in=pks).delete()
+        # Start the next chunk past this one instead of rescanning the dead
+        # index entries it leaves behind until vacuum
+        after = pks[-1]
+        yield deleted
+        if len(pks) < chunk_size:
+            return
+        if sleep:
+            time.sleep(sleep)
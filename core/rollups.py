@@ -0,0 +1,181 @@
+"""
+Daily feedback rollups: counts and rating sums per local day and type.
+
+Feedback.save() adds every new row to its day's FeedbackDailyRollup with
+an atomic increment, so the dashboard reads at most one small row per
+day and type however much feedback there is. rebuild() recounts a range of days
+from the raw table (backfills, feedback bulk-inserted without save(),
+ratings edited in the admin) with one GROUP BY over the created_at index
+per batch of days, and writes the counts with an upsert rather than
+delete-and-insert.
+
+A count is only right if no increment lands between reading it and
+writing it, so rebuild() holds the range's rollup rows locked from
+before it counts until it commits. Rows that don't exist can't be
+locked, so it first inserts an empty placeholder for every day and type
+in the range: every save() on those days then increments a locked row
+and waits for the rebuild, and its feedback is counted either by the
+rebuild (committed first) or by its own increment afterwards (not yet).
+Placeholders still empty at the end are deleted. On SQLite the first
+insert takes the database's write lock, which does the same.
+
+Rollups outlive the raw rows: purge and admin deletes don't decrement
+them, and rebuilds never reach back past the feedback retention cutoff,
+where the raw table is no longer complete.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Feedback, FeedbackDailyRollup
+from .retention import get_policy
+
+
+DASHBOARD_DAYS = (7, 30, 90, 365)
+REBUILD_BATCH_DAYS = 31
+
+
+def start_of(day):
+    """The aware datetime at which a local day begins"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+# ==================== REBUILD ====================
+
+def rebuildable_since():
+    """
+    The first day whose feedback is all still in the table: the day of the
+    oldest row, but never a day partly purged by retention.
+    """
+    oldest = Feedback.objects.aggregate(oldest=Min('created_at'))['oldest']
+    if oldest is None:
+        return None
+    since = timezone.localdate(oldest)
+    max_age = get_policy('feedback').max_age
+    if max_age is not None:
+        since = max(since, timezone.localdate(timezone.now() - max_age) + timedelta(days=1))
+    return since
+
+
+def rebuild(since, until):
+    """
+    Overwrite the rollups of days in [since, until) with fresh counts
+    from the feedback table, in one upsert, with the range locked against
+    concurrent increments (see the module docstring); existing rollups
+    with no feedback left count zero. Returns the rows written.
+    """
+    in_range = FeedbackDailyRollup.objects.filter(day__gte=since, day__lt=until)
+    with transaction.atomic():
+        existing = set(in_range.values_list('day', 'feedback_type'))
+        days = [since + timedelta(days=offset) for offset in range((until - since).days)]
+        FeedbackDailyRollup.objects.bulk_create(
+            [
+                FeedbackDailyRollup(day=day, feedback_type=feedback_type)
+                for day in days for feedback_type, _ in Feedback.FEEDBACK_TYPE_CHOICES
+            ],
+            ignore_conflicts=True,
+        )
+        # In key order, so overlapping rebuilds queue rather than deadlock
+        locked = list(
+            in_range.select_for_update().order_by('day', 'feedback_type').values_list('pk', 'day', 'feedback_type')
+        )
+
+        counts = (
+            Feedback.objects
+            .filter(created_at__gte=start_of(since), created_at__lt=start_of(until))
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'feedback_type')
+            .annotate(count=Count('id'), rated_count=Count('rating'), rating_sum=Sum('rating'))
+            .order_by()
+        )
+        rollups = {
+            (row['day'], row['feedback_type']): FeedbackDailyRollup(
+                day=row['day'],
+                feedback_type=row['feedback_type'],
+                count=row['count'],
+                rated_count=row['rated_count'],
+                rating_sum=row['rating_sum'] or 0,
+            )
+            for row in counts
+        }
+        for day, feedback_type in existing:
+            rollups.setdefault((day, feedback_type), FeedbackDailyRollup(day=day, feedback_type=feedback_type))
+
+        FeedbackDailyRollup.objects.bulk_create(
+            rollups.values(),
+            update_conflicts=True,
+            unique_fields=['day', 'feedback_type'],
+            update_fields=['count', 'rated_count', 'rating_sum'],
+        )
+        # Placeholders nothing was counted in; a save() waiting on one
+        # finds it gone and creates its own
+        FeedbackDailyRollup.objects.filter(
+            pk__in=[pk for pk, day, feedback_type in locked if (day, feedback_type) not in rollups]
+        ).delete()
+    return len(rollups)
+
+
+def rebuild_batches(since, until, batch_days=REBUILD_BATCH_DAYS):
+    """Rebuild [since, until) batch_days at a time, yielding (first day, rows written)"""
+    while since < until:
+        end = min(since + timedelta(days=batch_days), until)
+        yield since, rebuild(since, end)
+        since = end
+
+
+# ==================== DASHBOARD ====================
+
+def average(rating_sum, rated_count):
+    return round(rating_sum / rated_count, 2) if rated_count else None
+
+
+def dashboard(days):
+    """
+    Per-day and per-type counts and average ratings for the last `days`
+    days, today included, read from the rollups only.
+    """
+    today = timezone.localdate()
+    since = today - timedelta(days=days - 1)
+    types = Feedback.FEEDBACK_TYPE_CHOICES
+
+    per_day = {}
+    totals = {value: [0, 0, 0] for value, _ in types}
+    for rollup in FeedbackDailyRollup.objects.filter(day__gte=since, day__lte=today):
+        per_day.setdefault(rollup.day, {})[rollup.feedback_type] = rollup
+        total = totals.setdefault(rollup.feedback_type, [0, 0, 0])
+        total[0] += rollup.count
+        total[1] += rollup.rated_count
+        total[2] += rollup.rating_sum
+
+    rows = []
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        cells = per_day.get(day, {})
+        rows.append({
+            'day': day,
+            'cells': [
+                (cells[value].count, average(cells[value].rating_sum, cells[value].rated_count))
+                if value in cells else (0, None)
+                for value, _ in types
+            ],
+            'count': sum(cell.count for cell in cells.values()),
+            'average': average(
+                sum(cell.rating_sum for cell in cells.values()),
+                sum(cell.rated_count for cell in cells.values()),
+            ),
+        })
+
+    return {
+        'days': days,
+        'since': since,
+        'types': [label for _, label in types],
+        'rows': rows,
+        'totals': [(totals[value][0], average(totals[value][2], totals[value][1])) for value, _ in types],
+        'count': sum(total[0] for total in totals.values()),
+        'average': average(
+            sum(total[2] for total in totals.values()), sum(total[1] for total in totals.values()),
+        ),
+    }
@@ -0,0 +1,170 @@
+from django.db import connection
+from django.db.models import Q
+
+from .arabic import normalize_arabic
+from .catalog import get_catalog
+from .corpus import get_corpus
+from .models import Ayah
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+# Deeper pages mean ever longer OFFSET scans; nobody reads that far
+MAX_PAGE = 100
+
+# words:    ranked full-text match on whole words
+# contains: substring match, served by the trigram index
+# fuzzy:    trigram word similarity (PostgreSQL only; SQLite uses contains)
+SEARCH_MODES = ('words', 'contains', 'fuzzy')
+MIN_TRIGRAM_QUERY_LENGTH = 3
+
+# Every query returns (surah, ayah, language, text, rank) rows, best first;
+# text is NULL when the mapped corpus will provide it.
+# One extra row is fetched so the caller can tell whether a next page exists.
+POSTGRES_SQL = {
+    'words': """
+        SELECT a.surah_id, a.number, a.language, {text_column},
+               ts_rank_cd(a.search_vector, query) AS rank
+        FROM core_ayah a, websearch_to_tsquery('simple', %(term)s) query
+        WHERE a.search_vector @@ query {language_filter}
+        ORDER BY rank DESC, a.surah_id, a.number
+        LIMIT %(limit)s OFFSET %(offset)s
+    """,
+    'contains': """
+        SELECT a.surah_id, a.number, a.language, {text_column},
+               similarity(a.text_normalized, %(term)s) AS rank
+        FROM core_ayah a
+        WHERE a.text_normalized LIKE %(pattern)s {language_filter}
+        ORDER BY rank DESC, a.surah_id, a.number
+        LIMIT %(limit)s OFFSET %(offset)s
+    """,
+    'fuzzy': """
+        SELECT a.surah_id, a.number, a.language, {text_column},
+               word_similarity(%(term)s, a.text_normalized) AS rank
+        FROM core_ayah a
+        WHERE %(term)s <%% a.text_normalized {language_filter}
+        ORDER BY rank DESC, a.surah_id, a.number
+        LIMIT %(limit)s OFFSET %(offset)s
+    """,
+}
+
+SQLITE_SQL = """
+    SELECT a.surah_id, a.number, a.language, {text_column}, -hit.rank
+    FROM (
+        SELECT rowid, rank FROM {table}
+        WHERE {table} MATCH %(term)s {language_filter}
+        ORDER BY rank
+        LIMIT %(limit)s OFFSET %(offset)s
+    ) hit
+    JOIN core_ayah a ON a.id = hit.rowid
+    ORDER BY hit.rank
+"""
+
+
+def fts5_phrase(text):
+    """Quote text as a single FTS5 string so it is never parsed as syntax"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def build_query(term, mode, language, with_text=True):
+    if connection.vendor == 'postgresql':
+        sql = POSTGRES_SQL[mode]
+        language_filter = 'AND a.language = %(language)s' if language else ''
+        params = {'term': term, 'pattern': like_pattern(term)}
+    else:
+        if mode == 'words':
+            table, match = 'core_ayah_fts', ' '.join(fts5_phrase(word) for word in term.split())
+        else:
+            # The trigram tokenizer matches a quoted string as a substring
+            table, match = 'core_ayah_trigram', fts5_phrase(term)
+        sql = SQLITE_SQL.replace('{table}', table)
+        language_filter = 'AND language = %(language)s' if language else ''
+        params = {'term': match}
+
+    params['language'] = language
+    text_column = 'a.text' if with_text else 'NULL'
+    return sql.format(language_filter=language_filter, text_column=text_column), params
+
+
+def with_texts(corpus, rows):
+    """
+    Fill in row texts from the corpus; any it lacks (built before the
+    latest import) are read from the database in one query.
+    """
+    rows = [
+        (surah, number, lang, corpus.text(surah, number, lang), rank)
+        for surah, number, lang, _, rank in rows
+    ]
+    missing = [row for row in rows if row[3] is None]
+    if missing:
+        keys = Q()
+        for surah, number, lang, _, _ in missing:
+            keys |= Q(surah_id=surah, number=number, language=lang)
+        texts = {
+            (surah, number, lang): text
+            for surah, number, lang, text in
+            Ayah.objects.filter(keys).values_list('surah_id', 'number', 'language', 'text')
+        }
+        rows = [
+            (surah, number, lang, text if text is not None else texts.get((surah, number, lang), ''), rank)
+            for surah, number, lang, text, rank in rows
+        ]
+    return rows
+
+
+def search_ayahs(query, language=None, page=1, page_size=DEFAULT_PAGE_SIZE, mode='words'):
+    """
+    Ranked search over ayah text and translations. The query goes through
+    the same Arabic normalization as the indexed text.
+    Returns a dict with the page of results and a has_next flag.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}'.")
+    if not 1 <= page <= MAX_PAGE:
+        raise ValueError(f'Page must be between 1 and {MAX_PAGE}.')
+
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    term = normalize_arabic(query)
+
+    if mode != 'words' and len(term) < MIN_TRIGRAM_QUERY_LENGTH:
+        raise ValueError(f'Search query must be at least {MIN_TRIGRAM_QUERY_LENGTH} characters.')
+
+    corpus = get_corpus()
+    if not term:
+        rows = []
+    else:
+        sql, params = build_query(term, mode, language, with_text=corpus is None)
+        params.update(limit=page_size + 1, offset=(page - 1) * page_size)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+    if corpus is not None:
+        rows = with_texts(corpus, rows[:page_size]) + rows[page_size:]
+
+    catalog = get_catalog()
+    results = [
+        {
+            'surah': surah,
+            'surah_name': catalog.get(surah)['surahName'],
+            'ayah': number,
+            'language': lang,
+            'text': text,
+            'rank': round(rank, 6),
+        }
+        for surah, number, lang, text, rank in rows[:page_size]
+    ]
+
+    return {
+        'query': query,
+        'mode': mode,
+        'page': page,
+        'page_size': page_size,
+        'has_next': len(rows) > page_size,
+        'results': results,
+    }
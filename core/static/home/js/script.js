@@ -1,4 +1,4 @@
-const API_URL = 'https://quranapi.pages.dev/api/surah.json';
+const API_URL = '/api/surahs/';
 
 const surahList = document.getElementById('surahList');
 const sidebar = document.getElementById('left-sidebar');
@@ -34,8 +34,14 @@ document.addEventListener('keydown', (e) => {
     }
 });
 
-// Fetch and display surahs from API
+// Fetch and display surahs, preferring the catalog inlined by the server
 async function fetchSurahs() {
+    const inlineCatalog = document.getElementById('surah-catalog');
+    if (inlineCatalog) {
+        displaySurahs(JSON.parse(inlineCatalog.textContent));
+        return;
+    }
+
     try {
         const response = await fetch(API_URL);
         
@@ -93,9 +99,9 @@ function createSurahBox(surah, number) {
         </div>
     `;
     
-    // Click surah to go to audio page
+    // Click surah to go to audio page (pre-rendered, falls back to the live view)
     surahBox.addEventListener('click', (e) => {
-        window.location.href = `/surah/audio/${number}/`;
+        window.location.href = `/pages/surah/${number}/`;
     });
     
     return surahBox;
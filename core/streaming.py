@@ -0,0 +1,60 @@
+"""
+Streaming response bodies that suit the server running the request.
+
+Under WSGI a StreamingHttpResponse is iterated synchronously as it is
+sent, and gunicorn sendfile()s the file of a FileResponse. Under ASGI,
+Django collects a synchronous body with sync_to_async(list) before the
+first byte goes out, so a whole recitation or export would sit in memory.
+There the body is wrapped in a ThreadedIterator instead: an async
+iterator that runs each step of the synchronous one in the request's
+sync thread (where its ORM cursor lives) and hands it over as it comes.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+
+# Each chunk costs a hop to the sync thread, so read more than
+# FileResponse's 4 KB at a time
+FILE_CHUNK_SIZE = 1 << 16
+
+
+class ThreadedIterator:
+    """Async iterator over a sync one; closing it closes the sync one (or calls `close`)"""
+
+    def __init__(self, iterator, close=None):
+        self.iterator = iter(iterator)
+        self.close_iterator = close or getattr(iterator, 'close', None)
+
+    def __aiter__(self):
+        return self.parts()
+
+    async def parts(self):
+        next_part = sync_to_async(next)
+        while True:
+            part = await next_part(self.iterator, None)
+            if part is None:
+                return
+            yield part
+
+    def close(self):
+        if self.close_iterator is not None:
+            self.close_iterator()
+
+
+def is_asgi(request):
+    return isinstance(request, ASGIRequest)
+
+
+def body(request, iterator):
+    """A StreamingHttpResponse body: iterator itself under WSGI, threaded under ASGI"""
+    return ThreadedIterator(iterator) if is_asgi(request) else iterator
+
+
+def file_body(request, f):
+    """
+    A FileResponse body: the file itself under WSGI (so it can be
+    sendfile()d), its chunks threaded under ASGI
+    """
+    if not is_asgi(request):
+        return f
+    return ThreadedIterator(iter(lambda: f.read(FILE_CHUNK_SIZE), b''), close=f.close)
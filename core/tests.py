@@ -1,3 +1,2226 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import csv
+import itertools
+import json
+import random
+import re
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.request import urlopen
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.contrib.auth.hashers import make_password
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.db.models import Q
+from django.template import engines
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    async_http, audio, audio_timing, corpus, export, metrics, mp3, outbox, page_cache, ratelimit, reciters, retention, rollups,
+    throttle, upstream, usernames, verses, views,
+)
+from .models import (
+    CODES_PER_HOUR, RESEND_COOLDOWN, Ayah, CacheGeneration, ContactMessage, CustomUser, EmailVerification, Feedback,
+    FeedbackDailyRollup, OutboundEmail, RecitationTiming, Surah,
+)
+from .audio_timing import TimingIndex
+from .management.commands import prerender_surahs
+from .admin import FeedbackAdmin
+from .catalog import get_catalog
+from .changelist import CURSOR_VAR, OLDER, make_cursor
+from .forms import CompleteRegistrationForm
+from .tiered_cache import LRU
+from myquran.settings import days_or_forever
+
+
+# ==================== BENCHMARKS ====================
+# Tests tagged 'benchmark' time a path and print what they measured; skip
+# them with `manage.py test --exclude-tag benchmark`.
+
+def timed(function, runs):
+    """Milliseconds taken by each of `runs` calls of function"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def report(name, **figures):
+    line = ', '.join(f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}' for key, value in figures.items())
+    print(f'\n[benchmark] {name}: {line}', file=sys.stderr)
+
+
+# ==================== SIGNUP ====================
+
+class SignupQueryBudgetTests(TestCase):
+    """
+    Queries per signup request. The budgets include the database session
+    (and the savepoints it takes inside the test transaction): step 1
+    creates the session, step 3 cycles it on login. A failed code costs one
+    query more than a correct one, the only path that looks up why.
+    """
+    email = 'reader@example.com'
+
+    def setUp(self):
+        cache.delete_many([rate.cache_key(self.email) for rate in (RESEND_COOLDOWN, CODES_PER_HOUR)])
+        self.addCleanup(
+            cache.delete_many, [rate.cache_key(self.email) for rate in (RESEND_COOLDOWN, CODES_PER_HOUR)],
+        )
+
+    def start_signup(self):
+        session = self.client.session
+        session['signup_email'] = self.email
+        session.save()
+
+    def test_step1_email(self):
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse('signup_step1_email'), {'email': self.email})
+        self.assertRedirects(response, reverse('signup_step2_verify'), fetch_redirect_response=False)
+        self.assertEqual(OutboundEmail.objects.get().to, [self.email])
+
+    def test_step2_right_code(self):
+        self.start_signup()
+        EmailVerification.objects.create(email=self.email, code='123456')
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('signup_step2_verify'), {'code': '123456'})
+        self.assertRedirects(response, reverse('signup_step3_complete'), fetch_redirect_response=False)
+        self.assertTrue(EmailVerification.is_email_verified(self.email))
+
+    def test_step2_wrong_code(self):
+        self.start_signup()
+        EmailVerification.objects.create(email=self.email, code='123456')
+        with self.assertNumQueries(3):
+            response = self.client.post(reverse('signup_step2_verify'), {'code': '654321'})
+        self.assertContains(response, 'Invalid verification code.')
+
+    def test_step2_expired_code(self):
+        self.start_signup()
+        verification = EmailVerification.objects.create(email=self.email, code='123456')
+        EmailVerification.objects.filter(pk=verification.pk).update(
+            created_at=timezone.now() - timedelta(minutes=6),
+        )
+        with self.assertNumQueries(3):
+            response = self.client.post(reverse('signup_step2_verify'), {'code': '123456'})
+        self.assertContains(response, 'This code has expired.')
+        self.assertFalse(EmailVerification.is_email_verified(self.email))
+
+    def test_step3_complete(self):
+        self.start_signup()
+        EmailVerification.objects.create(email=self.email, code='123456', is_verified=True)
+        with self.assertNumQueries(16):
+            response = self.client.post(reverse('signup_step3_complete'), {
+                'full_name': 'A Reader', 'password1': 'a long passphrase 42', 'password2': 'a long passphrase 42',
+            })
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(CustomUser.objects.get().email, self.email)
+
+
+# ==================== RATE LIMITS ====================
+
+class Clock:
+    """Stands in for the time module in core.ratelimit"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def database_rate_checks(email):
+    """The three queries create_verification and the resend view ran before the cache-backed limiter"""
+    hour_ago = timezone.now() - timedelta(hours=1)
+    recent = EmailVerification.objects.filter(email=email, created_at__gte=hour_ago)
+    if recent.count() >= 3:
+        recent.order_by('created_at').first()
+    EmailVerification.objects.filter(email=email).order_by('-created_at').first()
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.clock = Clock()
+        patcher = mock.patch.object(ratelimit, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bursts_up_to_the_limit_then_spaces_hits(self):
+        rate = ratelimit.Rate('test_burst', 3, 60)
+        self.assertEqual([ratelimit.hit('key', rate).allowed for _ in range(3)], [True] * 3)
+        self.assertEqual(ratelimit.hit('key', rate), ratelimit.Decision(False, 20, rate))
+
+        self.clock.now += 19
+        self.assertEqual(ratelimit.hit('key', rate).retry_after, 1)
+        self.clock.now += 1
+        self.assertTrue(ratelimit.hit('key', rate).allowed)
+        self.assertFalse(ratelimit.hit('key', rate).allowed)
+
+    def test_refused_hit_consumes_from_no_rate(self):
+        cooldown, hourly = ratelimit.Rate('test_cooldown', 1, 60), ratelimit.Rate('test_hourly', 3, 3600)
+        self.assertTrue(ratelimit.hit('key', cooldown, hourly).allowed)
+        self.clock.now += 10
+        self.assertIs(ratelimit.hit('key', cooldown, hourly).rate, cooldown)
+        # Had the refusal above counted against the hourly rate, the third of these would fail
+        for _ in range(2):
+            self.clock.now += 60
+            self.assertTrue(ratelimit.hit('key', cooldown, hourly).allowed)
+        self.clock.now += 60
+        decision = ratelimit.hit('key', cooldown, hourly)
+        self.assertIs(decision.rate, hourly)
+        self.assertEqual(decision.retry_after, 1010)
+
+    def test_keys_are_separate_and_hashed(self):
+        rate = ratelimit.Rate('test_keys', 1, 60)
+        self.assertTrue(ratelimit.hit('first@example.com', rate).allowed)
+        self.assertFalse(ratelimit.hit('first@example.com', rate).allowed)
+        self.assertTrue(ratelimit.hit('second@example.com', rate).allowed)
+        self.assertNotIn('example.com', rate.cache_key('first@example.com'))
+
+    def test_hit_all_checks_each_rate_against_its_own_key(self):
+        per_ip, per_email = ratelimit.Rate('test_ip', 2, 60), ratelimit.Rate('test_email', 1, 60)
+        self.assertTrue(ratelimit.hit_all((per_ip, '10.0.0.1'), (per_email, 'a@example.com')).allowed)
+        self.assertIs(ratelimit.hit_all((per_ip, '10.0.0.1'), (per_email, 'a@example.com')).rate, per_email)
+        # The refusal didn't spend the IP's second hit
+        self.assertTrue(ratelimit.hit_all((per_ip, '10.0.0.1'), (per_email, 'b@example.com')).allowed)
+        self.assertIs(ratelimit.hit_all((per_ip, '10.0.0.1'), (per_email, 'c@example.com')).rate, per_ip)
+
+    def test_concurrent_hits_never_exceed_the_limit(self):
+        rate = ratelimit.Rate('test_concurrent', 5, 3600)
+        barrier = threading.Barrier(20)
+        decisions = []
+
+        def hit():
+            barrier.wait()
+            decisions.append(ratelimit.hit('key', rate).allowed)
+
+        threads = [threading.Thread(target=hit) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(decisions.count(True), 5)
+
+    @skipUnless(settings.REDIS_URL, 'needs REDIS_URL for the Lua script')
+    def test_redis_script(self):
+        rate = ratelimit.Rate('test_redis', 3, 60)
+        key = f'test-{time.time_ns()}'
+        self.assertEqual([ratelimit.hit(key, rate).allowed for _ in range(3)], [True] * 3)
+        decision = ratelimit.hit(key, rate)
+        self.assertFalse(decision.allowed)
+        self.assertIn(decision.retry_after, (20, 21))
+
+
+class VerificationRateLimitTests(TestCase):
+    email = 'reader@example.com'
+
+    def setUp(self):
+        cache.clear()
+        self.clock = Clock()
+        patcher = mock.patch.object(ratelimit, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_codes_are_a_minute_apart(self):
+        EmailVerification.create_verification(self.email)
+        self.clock.now += 15
+        with self.assertRaisesMessage(ValueError, 'Please wait 45 seconds before requesting a new code.'):
+            EmailVerification.create_verification(self.email)
+        self.clock.now += 45
+        EmailVerification.create_verification(self.email)
+
+    def test_three_codes_an_hour(self):
+        for _ in range(3):
+            EmailVerification.create_verification(self.email)
+            self.clock.now += 60
+        with self.assertRaisesMessage(ValueError, 'Too many attempts. Please try again in 17m 0s.'):
+            EmailVerification.create_verification(self.email)
+
+    def test_limit_ignores_email_case(self):
+        EmailVerification.create_verification(self.email)
+        with self.assertRaises(ValueError):
+            EmailVerification.create_verification(' Reader@Example.COM ')
+
+    def test_refused_resend_reads_only_the_session(self):
+        session = self.client.session
+        session['signup_email'] = self.email
+        session.save()
+        EmailVerification.create_verification(self.email)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('signup_step2_resend'))
+        self.assertRedirects(response, reverse('signup_step2_verify'), fetch_redirect_response=False)
+        self.assertEqual(EmailVerification.objects.count(), 1)
+        self.assertContains(self.client.get(reverse('signup_step2_verify')), 'Please wait 60 seconds')
+
+    @tag('benchmark')
+    def test_limiter_cost(self):
+        """One cache round trip against the database checks it replaced, and the two views it sits in"""
+        for number in range(50):
+            EmailVerification.objects.create(email=self.email, code='123456')
+        with CaptureQueriesContext(connection) as queries:
+            database_rate_checks(self.email)
+        database_queries = len(queries)
+        with CaptureQueriesContext(connection) as queries:
+            ratelimit.hit(self.email, RESEND_COOLDOWN, CODES_PER_HOUR)
+        limiter_queries = len(queries)
+        database_ms = statistics.median(timed(lambda: database_rate_checks(self.email), 200))
+        limiter_ms = statistics.median(timed(lambda: ratelimit.hit(self.email, RESEND_COOLDOWN, CODES_PER_HOUR), 200))
+
+        emails = (f'reader{number}@example.com' for number in range(10_000))
+        step1_ms = timed(lambda: self.client.post(reverse('signup_step1_email'), {'email': next(emails)}), 100)
+        resend_ms = timed(lambda: self.client.get(reverse('signup_step2_resend')), 100)
+
+        report(
+            'verification rate limit',
+            database_queries=database_queries, limiter_queries=limiter_queries,
+            database_ms=database_ms, limiter_ms=limiter_ms,
+            step1_per_s=1000 / statistics.mean(step1_ms), refused_resend_per_s=1000 / statistics.mean(resend_ms),
+        )
+        self.assertEqual(limiter_queries, 0)
+        self.assertLess(limiter_ms, database_ms)
+
+
+# ==================== USERNAMES ====================
+
+def user(username, email=None):
+    return CustomUser(username=username, email=email or f'{username}@example.com', password='!')
+
+
+class UsernameTests(TestCase):
+
+    def test_base_username(self):
+        self.assertEqual(usernames.base_username('Ahmed.Ali+quran@example.com'), 'Ahmed.Ali+quran')
+        self.assertEqual(usernames.base_username('(ahmed)@example.com'), 'ahmed')
+        self.assertEqual(usernames.base_username('@example.com'), 'user')
+        self.assertEqual(len(usernames.base_username('a' * 300 + '@example.com')), 150 - usernames.MAX_SUFFIX_DIGITS)
+
+    def test_next_free_counts_past_the_highest_suffix_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(usernames.next_free('ahmed'), 'ahmed')
+        CustomUser.objects.bulk_create([user('ahmed'), user('ahmed7'), user('ahmedali'), user('ahmed_2')])
+        with self.assertNumQueries(1):
+            self.assertEqual(usernames.next_free('ahmed'), 'ahmed8')
+        # Regex characters in the base are literal
+        CustomUser.objects.bulk_create([user('a.b'), user('axb3')])
+        self.assertEqual(usernames.next_free('a.b'), 'a.b1')
+
+    def test_allocate_counts_up_in_memory(self):
+        CustomUser.objects.bulk_create([user('ahmed'), user('ahmed1')])
+        with self.assertNumQueries(2):
+            names = usernames.allocate(['ahmed', 'sara', 'ahmed', 'sara'])
+        self.assertEqual(names, ['ahmed2', 'sara', 'ahmed3', 'sara1'])
+
+    def test_save_retries_when_a_concurrent_signup_takes_the_name(self):
+        user('ahmed', 'ahmed@example.net').save()
+        # The first name was allocated before the other signup committed it
+        allocated = iter(['ahmed'])
+        next_free = usernames.next_free
+        new = CustomUser(email='ahmed@example.org', password='!')
+        tried = []
+
+        def save():
+            tried.append(new.username)
+            new.save()
+
+        with mock.patch.object(usernames, 'next_free', lambda base: next(allocated, None) or next_free(base)):
+            usernames.save_with_username(new, save)
+        self.assertEqual(tried, ['ahmed', 'ahmed1'])
+        self.assertEqual(CustomUser.objects.get(email='ahmed@example.org').username, 'ahmed1')
+
+    def test_save_raises_other_integrity_errors(self):
+        user('ahmed').save()
+        with self.assertRaises(IntegrityError):
+            usernames.save_with_username(CustomUser(email='ahmed@example.com', password='!'))
+
+    def test_signup_form_picks_a_free_name(self):
+        user('reader').save()
+        form = CompleteRegistrationForm(email='reader@example.org', data={
+            'full_name': 'A Reader', 'password1': 'a long passphrase 42', 'password2': 'a long passphrase 42',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().username, 'reader1')
+
+
+class ImportUsersTests(TestCase):
+
+    def import_users(self, text, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+            f.write(text)
+        self.addCleanup(Path(f.name).unlink)
+        stdout = StringIO()
+        call_command('import_users', f.name, *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_imports_with_free_usernames(self):
+        user('ahmed').save()
+        hashed = make_password('already hashed')
+        output = self.import_users(
+            'email,full_name,password\n'
+            'ahmed@example.org,Ahmed,plain secret\n'
+            f'ahmed@example.net,,{hashed}\n'
+            'sara@example.com,Sara,\n'
+            'not an email,,\n'
+        )
+        self.assertIn('Imported 3 user(s), skipped 1', output)
+        users = {u.email: u for u in CustomUser.objects.all()}
+        self.assertEqual(users['ahmed@example.org'].username, 'ahmed1')
+        self.assertEqual(users['ahmed@example.net'].username, 'ahmed2')
+        self.assertTrue(users['ahmed@example.org'].check_password('plain secret'))
+        self.assertEqual(users['ahmed@example.net'].password, hashed)
+        self.assertFalse(users['sara@example.com'].has_usable_password())
+        self.assertEqual(users['sara@example.com'].full_name, 'Sara')
+
+    def test_skips_existing_emails_whatever_their_case(self):
+        user('ahmed', 'Ahmed@Example.com').save()
+        output = self.import_users('email\nahmed@example.com\nAHMED@EXAMPLE.COM\nsara@example.com\nSara@Example.com\n')
+        self.assertIn('Imported 1 user(s), skipped 3', output)
+        self.assertEqual(
+            sorted(CustomUser.objects.values_list('email', flat=True)), ['Ahmed@Example.com', 'sara@example.com'],
+        )
+
+    def test_batches_share_the_suffix_count(self):
+        self.import_users(''.join(['email\n'] + [f'ahmed@{n}.example.com\n' for n in range(5)]), '--batch-size', '2')
+        self.assertEqual(
+            sorted(CustomUser.objects.values_list('username', flat=True)),
+            ['ahmed', 'ahmed1', 'ahmed2', 'ahmed3', 'ahmed4'],
+        )
+
+    def test_needs_an_email_column(self):
+        with self.assertRaisesMessage(CommandError, 'The CSV file needs an "email" column.'):
+            self.import_users('mail\nahmed@example.com\n')
+
+    @tag('benchmark')
+    def test_ten_thousand_colliding_names(self):
+        CustomUser.objects.bulk_create(
+            [user('ahmed', 'ahmed@0.example.com')]
+            + [user(f'ahmed{n}', f'ahmed@{n}.example.com') for n in range(1, 10_000)]
+        )
+
+        def exists_loop(base):
+            """The allocator this replaced: one query per name tried"""
+            username, counter = base, 1
+            while CustomUser.objects.filter(username=username).exists():
+                username, counter = f'{base}{counter}', counter + 1
+            return username, counter
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(usernames.next_free('ahmed'), 'ahmed10000')
+        allocator_queries = len(queries)
+        allocator_ms = statistics.median(timed(lambda: usernames.next_free('ahmed'), 20))
+        started = time.perf_counter()
+        self.assertEqual(exists_loop('ahmed'), ('ahmed10000', 10_001))
+        exists_loop_ms = (time.perf_counter() - started) * 1000
+
+        csv_text = ''.join(['email\n'] + [f'ahmed@{n}.example.org\n' for n in range(10_000)])
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            self.import_users(csv_text)
+            import_seconds = time.perf_counter() - started
+        self.assertEqual(CustomUser.objects.filter(username='ahmed19999').count(), 1)
+
+        report(
+            '10k users named ahmed',
+            allocator_queries=allocator_queries, allocator_ms=allocator_ms,
+            exists_loop_queries=10_001, exists_loop_ms=exists_loop_ms,
+            import_queries=len(queries), import_rows_per_s=10_000 / import_seconds,
+        )
+
+
+# ==================== SIGN-IN THROTTLE ====================
+
+def exhaust(rate, key):
+    while ratelimit.hit(key, rate).allowed:
+        pass
+
+
+class LoginThrottleTests(TestCase):
+    email = 'reader@example.com'
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('core.forms.authenticate', return_value=None)
+        self.authenticate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sign_in(self, email=None, ip='10.0.0.1'):
+        return self.client.post(
+            reverse('signin'), {'email': email or self.email, 'password': 'guess'}, REMOTE_ADDR=ip,
+        )
+
+    def test_refuses_before_hashing(self):
+        exhaust(throttle.LOGIN_PER_EMAIL, self.email)
+        response = self.sign_in()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(int(throttle.LOGIN_PER_EMAIL.interval)))
+        self.assertContains(response, 'Too many sign-in attempts.', status_code=429)
+        self.authenticate.assert_not_called()
+
+    def test_per_email_bucket_spans_addresses(self):
+        for attempt in range(settings.LOGIN_EMAIL_LIMIT):
+            self.assertEqual(self.sign_in(self.email.upper(), ip=f'10.0.1.{attempt}').status_code, 200)
+        self.assertEqual(self.authenticate.call_count, settings.LOGIN_EMAIL_LIMIT)
+        self.assertEqual(self.sign_in(ip='10.0.2.1').status_code, 429)
+        # Someone else is unaffected
+        self.assertEqual(self.sign_in('other@example.com', ip='10.0.2.1').status_code, 200)
+
+    def test_per_ip_bucket_spans_emails(self):
+        for attempt in range(settings.LOGIN_IP_LIMIT):
+            self.assertEqual(self.sign_in(f'reader{attempt}@example.com').status_code, 200)
+        self.assertEqual(self.sign_in('another@example.com').status_code, 429)
+        self.assertEqual(self.sign_in('another@example.com', ip='10.0.0.2').status_code, 200)
+
+    def test_allauth_login_is_throttled(self):
+        exhaust(throttle.LOGIN_PER_IP, '10.0.0.1')
+        with mock.patch('allauth.account.views.LoginView.dispatch') as dispatch:
+            response = self.client.post(
+                reverse('account_login'), {'login': self.email, 'password': 'guess'}, REMOTE_ADDR='10.0.0.1',
+            )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertIn('Retry-After', response)
+        dispatch.assert_not_called()
+
+    def test_client_ip(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2, 3.3.3.3')
+        with override_settings(TRUSTED_PROXY_COUNT=0):
+            self.assertEqual(throttle.client_ip(request), '10.0.0.9')
+        with override_settings(TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(throttle.client_ip(request), '3.3.3.3')
+        with override_settings(TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(throttle.client_ip(request), '2.2.2.2')
+        with override_settings(TRUSTED_PROXY_COUNT=4):
+            self.assertEqual(throttle.client_ip(request), '10.0.0.9')
+
+    def test_counters(self):
+        before = metrics.snapshot('login.')
+        self.sign_in()
+        exhaust(throttle.LOGIN_PER_EMAIL, self.email)
+        self.sign_in()
+        after = metrics.snapshot('login.')
+        for name in ('login.allowed', 'login.throttled', 'login.throttled_login_email'):
+            self.assertEqual(after[name] - before.get(name, 0), 1, name)
+
+        staff = CustomUser.objects.create_user(username='staff', email='staff@example.com', password='!', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('api_metrics')).json()['counters']['login.throttled'], after['login.throttled'])
+
+
+class LoginFloodTests(TransactionTestCase):
+    """Committed rows, so the flood's threads see the same users"""
+
+    @tag('benchmark')
+    def test_legitimate_latency_under_a_flood(self):
+        """
+        A real sign-in, PBKDF2 and all, while two threads stuff credentials
+        for other accounts at 10 attempts a second each, or as fast as
+        they are answered when that is slower
+        """
+        CustomUser.objects.create_user(username='reader', email='reader@example.com', password='the right one')
+
+        def sign_in(client, email='reader@example.com', password='the right one', ip='10.0.0.1'):
+            return client.post(reverse('signin'), {'email': email, 'password': password}, REMOTE_ADDR=ip)
+
+        def latency(runs=3):
+            samples = []
+            for _ in range(runs):
+                client = Client()
+                started = time.perf_counter()
+                self.assertEqual(sign_in(client).status_code, 302)
+                samples.append((time.perf_counter() - started) * 1000)
+            return statistics.median(samples)
+
+        def flooded(throttled):
+            cache.clear()
+            # The steady state: the attacker spent its burst long ago, and
+            # gets one attempt through every LOGIN_IP_PERIOD / LOGIN_IP_LIMIT
+            exhaust(throttle.LOGIN_PER_IP, '203.0.113.1')
+            stop = threading.Event()
+
+            def flood():
+                client = Client()
+                for attempt in itertools.count():
+                    started = time.perf_counter()
+                    sign_in(client, f'user{attempt}@example.com', 'guess', ip='203.0.113.1')
+                    if stop.wait(max(0.1 - (time.perf_counter() - started), 0)):
+                        return
+
+            allow = mock.patch.object(views, 'check_login', return_value=ratelimit.Decision(True, 0, None))
+            threads = [threading.Thread(target=flood) for _ in range(2)]
+            with contextlib.nullcontext() if throttled else allow:
+                for thread in threads:
+                    thread.start()
+                try:
+                    return latency()
+                finally:
+                    stop.set()
+                    for thread in threads:
+                        thread.join()
+
+        cache.clear()
+        quiet = latency()
+        throttled = flooded(throttled=True)
+        unthrottled = flooded(throttled=False)
+        report(
+            'sign-in p50 under a 20 attempts/s flood (ms)',
+            quiet=quiet, throttled=throttled, unthrottled=unthrottled,
+        )
+        self.assertLess(throttled, unthrottled)
+
+
+# ==================== RETENTION ====================
+
+def verifications(count, days_old):
+    rows = EmailVerification.objects.bulk_create(
+        EmailVerification(email=f'reader{number}@example.com', code='123456') for number in range(count)
+    )
+    EmailVerification.objects.filter(pk__in=[row.pk for row in rows]).update(
+        created_at=timezone.now() - timedelta(days=days_old),
+    )
+    return rows
+
+
+class RetentionTests(TestCase):
+
+    def test_retention_days_setting(self):
+        self.assertIsNone(days_or_forever(''))
+        self.assertIsNone(days_or_forever(' None '))
+        self.assertEqual(days_or_forever('30'), 30)
+        self.assertEqual(days_or_forever(7), 7)
+        with self.assertRaises(ValueError):
+            days_or_forever('forever')
+
+    def test_purges_expired_rows_in_chunks(self):
+        verifications(25, days_old=2)
+        fresh = verifications(5, days_old=0)
+        policy = retention.get_policy('verifications')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(retention.purge(policy, chunk_size=10, sleep=0)), [10, 10, 5])
+        self.assertEqual(list(EmailVerification.objects.order_by('pk')), fresh)
+        # Each chunk starts after the previous one's last key
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT "core_emailverification"."id"')]
+        self.assertEqual(len(selects), 3)
+        self.assertNotIn('"id" >', selects[0])
+        self.assertTrue(all('"id" >' in sql for sql in selects[1:]))
+
+    def test_rows_expiring_during_a_purge_wait_for_the_next(self):
+        verifications(4, days_old=2)
+        chunks = retention.purge(retention.get_policy('verifications'), chunk_size=2, sleep=0)
+        self.assertEqual(next(chunks), 2)
+        late = verifications(1, days_old=2)
+        self.assertEqual(list(chunks), [2])
+        self.assertEqual(list(EmailVerification.objects.all()), late)
+
+    def test_policy_filters(self):
+        old = timezone.now() - timedelta(days=400)
+        OutboundEmail.objects.bulk_create(
+            OutboundEmail(subject=status, body='', from_email='app@example.com', to=[], status=status)
+            for status in ('pending', 'sent', 'failed')
+        )
+        OutboundEmail.objects.update(created_at=old)
+        ContactMessage.objects.bulk_create(
+            ContactMessage(name='A', email='a@example.com', subject=str(read), message='', is_read=read)
+            for read in (True, False)
+        )
+        ContactMessage.objects.update(created_at=old)
+
+        call_command('purge', 'outbox', 'contact_messages', sleep=0, stdout=StringIO())
+        self.assertEqual(list(OutboundEmail.objects.values_list('status', flat=True)), ['pending'])
+        self.assertEqual(list(ContactMessage.objects.values_list('is_read', flat=True)), [False])
+
+    def test_command(self):
+        verifications(3, days_old=2)
+        stdout = StringIO()
+        call_command('purge', 'verifications', dry_run=True, stdout=stdout)
+        self.assertIn('verifications: 3 row(s) older than 1 day(s) would be deleted', stdout.getvalue())
+        self.assertEqual(EmailVerification.objects.count(), 3)
+
+        stdout = StringIO()
+        call_command('purge', 'verifications', chunk_size=2, sleep=0, stdout=stdout)
+        self.assertIn('verifications: deleted 3 row(s) in 2 chunk(s)', stdout.getvalue())
+        self.assertIn('Purge done: 3 row(s) deleted.', stdout.getvalue())
+
+        with self.assertRaisesMessage(CommandError, 'Unknown policies: nothing'):
+            call_command('purge', 'nothing')
+        with self.assertRaisesMessage(CommandError, '--chunk-size must be at least 1.'):
+            call_command('purge', chunk_size=0)
+
+    def test_kept_forever(self):
+        Feedback.objects.create(name='A', email='a@example.com', rating=5, message='')
+        Feedback.objects.update(created_at=timezone.now() - timedelta(days=10_000))
+        with override_settings(RETENTION_DAYS={**settings.RETENTION_DAYS, 'feedback': None}):
+            self.assertEqual(list(retention.purge(retention.get_policy('feedback'))), [])
+            stdout = StringIO()
+            call_command('purge', 'feedback', stdout=stdout)
+        self.assertIn('feedback: kept forever, skipped.', stdout.getvalue())
+        self.assertEqual(Feedback.objects.count(), 1)
+
+    @tag('benchmark')
+    def test_purge_throughput(self):
+        verifications(50_000, days_old=2)
+        verifications(1_000, days_old=0)
+        chunk_ms = []
+        started = time.perf_counter()
+        chunks = retention.purge(retention.get_policy('verifications'), chunk_size=1000, sleep=0)
+        while True:
+            chunk_started = time.perf_counter()
+            if next(chunks, None) is None:
+                break
+            chunk_ms.append((time.perf_counter() - chunk_started) * 1000)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(EmailVerification.objects.count(), 1_000)
+        report(
+            'purge 50k expired verifications, 1000 per chunk',
+            rows_per_s=50_000 / elapsed, chunks=len(chunk_ms),
+            chunk_p50_ms=percentile(chunk_ms, 50), chunk_max_ms=max(chunk_ms),
+        )
+
+
+# ==================== ADMIN CHANGELISTS ====================
+
+class LargeTableAdminTests(TestCase):
+    rows = 45
+
+    def setUp(self):
+        admin_user = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='!')
+        self.client.force_login(admin_user)
+        # Four rows to a timestamp, so equal values straddle page boundaries
+        started = timezone.now().replace(microsecond=0)
+        Feedback.objects.bulk_create(
+            Feedback(message=f'message {number}', feedback_type='bug' if number % 3 else 'other', email=f'r{number}@example.com')
+            for number in range(self.rows)
+        )
+        for number, pk in enumerate(Feedback.objects.order_by('pk').values_list('pk', flat=True)):
+            Feedback.objects.filter(pk=pk).update(created_at=started + timedelta(seconds=number // 4))
+        patcher = mock.patch.object(FeedbackAdmin, 'list_per_page', 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def changelist(self, query='', **params):
+        """The changelist for a page link (a query string) or for params"""
+        response = self.client.get(reverse('admin:core_feedback_changelist') + query, params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def newest_first(self):
+        return list(Feedback.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def test_keyset_pages_walk_older_and_back_newer(self):
+        pages = [self.changelist()]
+        self.assertTrue(pages[0].keyset)
+        self.assertFalse(pages[0].newer_url)
+        while pages[-1].older_url:
+            pages.append(self.changelist(pages[-1].older_url))
+        self.assertEqual(len(pages), 5)
+        self.assertEqual([row.pk for page in pages for row in page.result_list], self.newest_first())
+
+        walked_back = [[row.pk for row in pages[-1].result_list]]
+        page = pages[-1]
+        while page.newer_url:
+            page = self.changelist(page.newer_url)
+            walked_back.append([row.pk for row in page.result_list])
+        self.assertEqual(walked_back[::-1], [[row.pk for row in page.result_list] for page in pages])
+        self.assertTrue(pages[-1].newest_url)
+
+    def test_filters_keep_keyset_paging(self):
+        cl = self.changelist(feedback_type='other')
+        pks = [row.pk for row in cl.result_list]
+        cl = self.changelist(cl.older_url)
+        pks += [row.pk for row in cl.result_list]
+        self.assertFalse(cl.older_url)
+        self.assertEqual(pks, list(Feedback.objects.filter(feedback_type='other').order_by('-created_at', '-pk').values_list('pk', flat=True)))
+        self.assertEqual(cl.result_count, 15)
+
+    def test_other_orderings_fall_back_to_numbered_pages(self):
+        cl = self.changelist(o='3')
+        self.assertFalse(cl.keyset)
+        self.assertEqual(cl.paginator.num_pages, 5)
+
+    def test_bad_cursor_is_an_invalid_lookup(self):
+        for cursor in ('sideways:1:2026-01-01T00:00:00', 'older:x:2026-01-01T00:00:00', 'older:1:yesterday', 'nonsense'):
+            response = self.client.get(reverse('admin:core_feedback_changelist'), {CURSOR_VAR: cursor})
+            self.assertRedirects(response, reverse('admin:core_feedback_changelist') + '?e=1', fetch_redirect_response=False)
+
+    def test_sqlite_full_text_search(self):
+        found = Feedback.objects.create(name='Amina', message='The recitation of Surah Maryam was beautiful')
+        Feedback.objects.create(message='Audio kept buffering')
+        self.assertEqual(list(self.changelist(q='beautiful recitation').result_list), [found])
+        self.assertEqual(list(self.changelist(q='amina maryam').result_list), [found])
+        self.assertEqual(list(self.changelist(q='recit').result_list), [])
+        # FTS5 syntax in the term is searched for as text
+        self.assertEqual(list(self.changelist(q='beautiful OR NOT "').result_list), [])
+
+        # Kept in sync by triggers
+        Feedback.objects.filter(pk=found.pk).update(message='Changed my mind')
+        self.assertEqual(list(self.changelist(q='beautiful').result_list), [])
+        self.assertEqual(list(self.changelist(q='changed').result_list), [found])
+        found.delete()
+        self.assertEqual(list(self.changelist(q='changed').result_list), [])
+
+    def test_email_search_is_exact_and_case_insensitive(self):
+        self.assertEqual([row.email for row in self.changelist(q='R7@Example.COM').result_list], ['r7@example.com'])
+        self.assertEqual(list(self.changelist(q='r7@example').result_list), [])
+
+    def test_contact_messages_search_subjects(self):
+        ContactMessage.objects.create(name='A', email='a@example.com', subject='Tajweed question', message='Hello')
+        response = self.client.get(reverse('admin:core_contactmessage_changelist'), {'q': 'tajweed', 'is_read__exact': '0'})
+        self.assertEqual([row.subject for row in response.context['cl'].result_list], ['Tajweed question'])
+
+
+class LargeTableTimingTests(TestCase):
+
+    @tag('benchmark')
+    def test_million_row_changelist(self):
+        """Admin pages over 1M feedback rows, against the OFFSET page the stock admin would read"""
+        rows = 1_000_000
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s)
+                INSERT INTO core_feedback (id, name, email, feedback_type, message, created_at)
+                SELECT i, 'reader ' || i, 'r' || i || '@example.com',
+                       CASE i % 5 WHEN 0 THEN 'bug' WHEN 1 THEN 'feature' ELSE 'other' END,
+                       CASE WHEN i % 1000 = 0 THEN 'needle in the haystack ' ELSE 'message ' END || i,
+                       datetime('2020-01-01', '+' || (i / 10) || ' seconds')
+                FROM n
+                """,
+                [rows],
+            )
+            cursor.execute('ANALYZE')
+        admin_user = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='!')
+        self.client.force_login(admin_user)
+        url = reverse('admin:core_feedback_changelist')
+        deep = Feedback.objects.get(pk=rows // 10)
+        deep_cursor = make_cursor(OLDER, deep.created_at, deep.pk)
+
+        def page(**params):
+            return lambda: self.assertEqual(self.client.get(url, params).status_code, 200)
+
+        figures = {
+            name: statistics.median(timed(view, 5)) for name, view in {
+                'first_page_ms': page(),
+                'deep_page_ms': page(**{CURSOR_VAR: deep_cursor}),
+                'filtered_ms': page(feedback_type='bug'),
+                'search_ms': page(q='needle'),
+                'email_ms': page(q='R500@example.com'),
+            }.items()
+        }
+        # The page query alone: rendering 100 rows is most of a page either way
+        newest_first = Feedback.objects.order_by('-created_at', '-pk')
+        offset = rows - rows // 10
+        figures['deep_keyset_query_ms'] = statistics.median(timed(lambda: list(newest_first.filter(
+            Q(created_at__lt=deep.created_at) | Q(pk__lt=deep.pk), created_at__lte=deep.created_at,
+        )[:101]), 5))
+        figures['deep_offset_query_ms'] = statistics.median(timed(lambda: list(newest_first[offset:offset + 101]), 5))
+        report('admin changelist over 1M feedback rows', **figures)
+
+
+# ==================== EXPORTS ====================
+
+def seed_feedback(rows):
+    """rows Feedback rows, one a minute from 2020-01-01, without the save() hooks"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s)
+            INSERT INTO core_feedback (name, email, feedback_type, rating, message, created_at)
+            SELECT 'reader ' || i, 'r' || i || '@example.com', 'other', i % 5 + 1,
+                   'Feedback number ' || i || ' about the recitation player',
+                   datetime('2020-01-01', '+' || i || ' minutes')
+            FROM n
+            """,
+            [rows],
+        )
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.at = timezone.now().replace(microsecond=0) - timedelta(days=3)
+        self.feedback = [
+            Feedback.objects.create(name='=HYPERLINK("http://evil")', email='a@example.com', rating=5, message='-1+2'),
+            Feedback.objects.create(name='أمينة', email='b@example.com', message='two\nlines, "quoted"'),
+            Feedback.objects.create(name='@SUM(A1)', email='c@example.com', rating=1, message='fine'),
+        ]
+        for days, row in enumerate(self.feedback):
+            Feedback.objects.filter(pk=row.pk).update(created_at=self.at + timedelta(days=days))
+
+    def text(self, name, fmt, **kwargs):
+        return ''.join(export.lines(export.get_export(name), fmt, **kwargs))
+
+    def test_csv_columns_and_formula_escaping(self):
+        rows = list(csv.reader(StringIO(self.text('feedback', 'csv'))))
+        self.assertEqual(rows[0], ['id', 'created_at', 'name', 'email', 'feedback_type', 'rating', 'message'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(row.pk) for row in self.feedback])
+        self.assertEqual([row[2] for row in rows[1:]], ["'=HYPERLINK(\"http://evil\")", 'أمينة', "'@SUM(A1)"])
+        self.assertEqual([row[6] for row in rows[1:]], ["'-1+2", 'two\nlines, "quoted"', 'fine'])
+        # Only text is escaped
+        self.assertEqual([row[5] for row in rows[1:]], ['5', '', '1'])
+        for value in ('\tcmd', '\rcmd', '+1'):
+            self.assertEqual(export.spreadsheet_safe(value), "'" + value)
+        self.assertEqual(export.spreadsheet_safe(-1), -1)
+
+    def test_jsonl_encoding(self):
+        text = self.text('feedback', 'jsonl')
+        self.assertIn('أمينة', text)
+        lines = text.splitlines()
+        self.assertEqual(len(lines), 3)
+        second = json.loads(lines[1])
+        self.assertEqual(list(second), export.get_export('feedback').columns)
+        self.assertEqual(second['message'], 'two\nlines, "quoted"')
+        self.assertIsNone(second['rating'])
+        self.assertEqual(second['created_at'], (self.at + timedelta(days=1)).isoformat().replace('+00:00', 'Z'))
+        # JSON Lines leaves formulas alone
+        self.assertEqual(json.loads(lines[0])['name'], '=HYPERLINK("http://evil")')
+
+    def test_since_until_is_half_open(self):
+        stats = {}
+        text = self.text('feedback', 'jsonl', since=self.at + timedelta(days=1), until=self.at + timedelta(days=2), stats=stats)
+        self.assertEqual([json.loads(line)['id'] for line in text.splitlines()], [self.feedback[1].pk])
+        self.assertEqual(stats['rows'], 1)
+
+    def test_command(self):
+        stdout, stderr = StringIO(), StringIO()
+        since = timezone.localtime(self.at + timedelta(days=1))
+        call_command('export', 'feedback', '--format', 'jsonl', '--since', since.isoformat(), stdout=stdout, stderr=stderr)
+        self.assertEqual([json.loads(line)['id'] for line in stdout.getvalue().splitlines()], [row.pk for row in self.feedback[1:]])
+        self.assertIn('Exported 2 feedback row(s)', stderr.getvalue())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'feedback.csv'
+            call_command('export', 'feedback', '--until', f'{since:%Y-%m-%d}', '--output', str(path), stdout=StringIO())
+            self.assertEqual(len(path.read_text(encoding='utf-8').splitlines()), 2)
+
+        with self.assertRaisesMessage(CommandError, 'Invalid date: last week'):
+            call_command('export', 'feedback', '--since', 'last week')
+
+    def test_users_never_include_the_password(self):
+        user = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='a long passphrase 42')
+        for fmt in export.FORMATS:
+            text = self.text('users', fmt)
+            self.assertIn('reader@example.com', text)
+            self.assertNotIn('password', text)
+            self.assertNotIn(user.password, text)
+
+    def admin_export(self, action):
+        """The changelist URL and the POST running action on the first and last feedback"""
+        return reverse('admin:core_feedback_changelist'), {
+            'action': action, '_selected_action': [self.feedback[0].pk, self.feedback[2].pk],
+        }
+
+    def test_admin_action_streams_the_selection(self):
+        self.client.force_login(CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='!'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(*self.admin_export('export_csv'))
+            self.assertTrue(response.streaming)
+            before = len(queries)
+            body = b''.join(response.streaming_content).decode()
+        # The rows are read as the body is, by one query over the selection
+        [query] = queries[before:]
+        self.assertIn(' IN (', query['sql'])
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertRegex(response['Content-Disposition'], r'^attachment; filename="feedback-\d{8}\.csv"$')
+        self.assertEqual([row[0] for row in csv.reader(StringIO(body))][1:], [str(self.feedback[0].pk), str(self.feedback[2].pk)])
+
+    async def test_admin_action_streams_under_asgi(self):
+        await self.async_client.aforce_login(await CustomUser.objects.acreate(
+            username='admin', email='admin@example.com', is_staff=True, is_superuser=True,
+        ))
+        response = await self.async_client.post(*self.admin_export('export_jsonl'))
+        self.assertTrue(response.is_async)
+        body = b''.join([part async for part in response.streaming_content]).decode()
+        self.assertEqual(len(body.splitlines()), 2)
+
+    @tag('benchmark')
+    def test_throughput_and_memory(self):
+        """Rows/s and peak Python allocations while streaming 20k and 100k rows"""
+        feedback = export.get_export('feedback')
+
+        def stream(fmt, **kwargs):
+            stats = {}
+            tracemalloc.start()
+            try:
+                for _ in export.lines(feedback, fmt, stats=stats, **kwargs):
+                    pass
+                return stats, tracemalloc.get_traced_memory()[1] / 1024
+            finally:
+                tracemalloc.stop()
+
+        seed_feedback(100_000)
+        # 20k rows: the first 20k minutes after 2020-01-01
+        small = {'until': timezone.make_aware(datetime(2020, 1, 14, 21, 21))}
+        small_stats, small_kb = stream('csv', **small)
+        csv_stats, csv_kb = stream('csv')
+        jsonl_stats, jsonl_kb = stream('jsonl')
+        self.assertEqual((small_stats['rows'], csv_stats['rows']), (20_000, 100_000 + len(self.feedback)))
+        report(
+            'export 100k feedback rows',
+            csv_rows_per_s=csv_stats['rate'], jsonl_rows_per_s=jsonl_stats['rate'],
+            peak_kb_20k=small_kb, peak_kb_100k=csv_kb, jsonl_peak_kb=jsonl_kb,
+        )
+        self.assertLess(csv_kb, small_kb * 2)
+
+
+# ==================== CATALOG ====================
+
+class CatalogTests(TestCase):
+    # Round trip to a third-party CDN, which the local stub doesn't have
+    UPSTREAM_RTT = 0.03
+
+    def test_etag_revalidates(self):
+        response = self.client.get(reverse('api_surah_catalog'))
+        self.assertEqual(len(json.loads(response.content)), 114)
+        self.assertIn('max-age=', response['Cache-Control'])
+        response = self.client.get(reverse('api_surah_catalog'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_gzip_body_is_precompressed(self):
+        response = self.client.get(reverse('api_surah_catalog'), headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content, get_catalog().gzipped_body)
+        self.assertNotEqual(response['ETag'], get_catalog().etag)
+
+    def test_home_inlines_catalog(self):
+        self.assertContains(self.client.get(reverse('home')), 'id="surah-catalog"')
+
+    @tag('benchmark')
+    def test_time_to_data_without_upstream_round_trip(self):
+        catalog = get_catalog()
+        with StubUpstream(body=catalog.body, delay=self.UPSTREAM_RTT, content_type='application/json') as stub:
+            url = stub.url.format(reciter='api', surah='surah')
+            upstream_ms = timed(lambda: json.loads(urlopen(url).read()), 20)
+        local_ms = timed(lambda: json.loads(self.client.get(reverse('api_surah_catalog')).content), 20)
+        # Inlined into the page: no request at all, just the parse
+        inline_ms = timed(lambda: json.loads(catalog.body), 20)
+
+        report(
+            'catalog time-to-data (ms, p50)',
+            upstream=statistics.median(upstream_ms), api=statistics.median(local_ms),
+            inline=statistics.median(inline_ms),
+        )
+        self.assertLess(statistics.median(local_ms), statistics.median(upstream_ms))
+
+
+# ==================== SEARCH ====================
+
+def surah(number=1):
+    meta = get_catalog().get(number)
+    return Surah.objects.create(
+        number=number, name=meta['surahName'], name_arabic=meta['surahNameArabic'],
+        name_translation=meta['surahNameTranslation'], revelation_place=meta['revelationPlace'],
+        total_ayah=meta['totalAyah'],
+    )
+
+
+class NoCorpusTestCase(TestCase):
+    """Reads ayah text from the database, whatever corpus the checkout has built"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(CORPUS_PATH=Path(directory.name) / 'corpus.bin')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class SearchTests(NoCorpusTestCase):
+
+    def setUp(self):
+        super().setUp()
+        fatiha = surah(1)
+        for number, text in enumerate(['In the name of God', 'Praise be to God', 'The Merciful'], start=1):
+            Ayah.objects.create(surah=fatiha, number=number, language='en', text=text)
+        Ayah.objects.create(surah=fatiha, number=1, language='ar', text='بِسْمِ ٱللَّهِ ٱلرَّحْمَٰنِ ٱلرَّحِيمِ')
+
+    def search(self, **params):
+        return self.client.get(reverse('api_search'), params)
+
+    def test_words_are_ranked_and_paginated(self):
+        response = self.search(q='god', page_size=1)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertTrue(data['has_next'])
+        second = self.search(q='god', page_size=1, page=2).json()
+        self.assertFalse(second['has_next'])
+        self.assertEqual(
+            {data['results'][0]['ayah'], second['results'][0]['ayah']}, {1, 2},
+        )
+
+    def test_arabic_query_matches_without_diacritics(self):
+        results = self.search(q='بسم الله').json()['results']
+        self.assertEqual([(result['ayah'], result['language']) for result in results], [(1, 'ar')])
+
+    def test_out_of_range_pages_are_rejected(self):
+        for page in ('0', '-1', '101', '99999999999999999999'):
+            with self.subTest(page=page):
+                self.assertEqual(self.search(q='god', page=page).status_code, 400)
+        self.assertEqual(self.search(q='god', page='x').status_code, 400)
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(self.search(q='god', page_size='100000').json()['page_size'], 50)
+        self.assertEqual(self.search(q='god', page_size='0').json()['page_size'], 1)
+
+    @tag('benchmark')
+    def test_latency_over_full_corpus(self):
+        """p50/p99 of /api/search/ over a synthetic corpus of every ayah in two languages"""
+        rng = random.Random(1)
+        english = ['mercy', 'light', 'guidance', 'patience', 'earth', 'heavens', 'night', 'day', 'water',
+                   'prayer', 'charity', 'truth', 'garden', 'fire', 'signs', 'people', 'book', 'messenger']
+        arabic = ['رَحْمَة', 'نُور', 'هُدًى', 'صَبْر', 'أَرْض', 'سَمَاوَات', 'لَيْل', 'نَهَار', 'مَاء',
+                  'صَلَاة', 'زَكَاة', 'حَقّ', 'جَنَّة', 'نَار', 'آيَات', 'نَاس', 'كِتَاب', 'رَسُول']
+        filler_en = ['the', 'and', 'of', 'for', 'who', 'those', 'is', 'in', 'them', 'We']
+        filler_ar = ['وَ', 'فِي', 'مِنْ', 'إِنَّ', 'الَّذِينَ', 'عَلَى', 'لَهُمْ', 'قَالَ']
+        Ayah.objects.all().delete()
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8') as dump:
+            for meta in get_catalog().surahs:
+                for number in range(1, meta['totalAyah'] + 1):
+                    length = rng.randint(6, 40)
+                    for language, words, filler in (('en', english, filler_en), ('ar', arabic, filler_ar)):
+                        text = ' '.join(rng.choice(words if rng.random() < 0.3 else filler) for _ in range(length))
+                        dump.write(json.dumps(
+                            {'surah': meta['surahNo'], 'ayah': number, 'language': language, 'text': text},
+                            ensure_ascii=False,
+                        ) + '\n')
+            dump.flush()
+            call_command('import_quran', dump.name, stdout=StringIO())
+        rows = Ayah.objects.count()
+
+        queries = [rng.choice(english) for _ in range(100)]
+        queries += [f'{rng.choice(arabic)} {rng.choice(arabic)}' for _ in range(100)]
+        figures = {}
+        for mode in ('words', 'contains'):
+            samples = []
+            for query in queries:
+                samples += timed(lambda: self.search(q=query, mode=mode), 1)
+            figures[f'{mode}_p50'] = percentile(samples, 50)
+            figures[f'{mode}_p99'] = percentile(samples, 99)
+        report(f'search latency over {rows} ayah rows (ms)', **figures)
+        self.assertEqual(rows, 2 * 6236)
+
+
+# ==================== VERSE API ====================
+
+class VerseApiTests(NoCorpusTestCase):
+
+    def setUp(self):
+        super().setUp()
+        baqarah = surah(2)
+        Ayah.objects.bulk_create(
+            Ayah(surah=baqarah, number=number, language=language, text=f'{language} {number}',
+                 text_normalized=f'{language} {number}')
+            for number in range(1, 287) for language in ('ar', 'en')
+        )
+
+    def get(self, **params):
+        return self.client.get(reverse('api_surah_ayahs', args=[2]), params)
+
+    def test_pages_follow_the_cursor(self):
+        numbers, after = [], 0
+        while after is not None:
+            data = self.get(after=after, limit=100).json()
+            numbers += [ayah['ayah'] for ayah in data['ayahs']]
+            after = data['next']
+        self.assertEqual(numbers, list(range(1, 287)))
+
+    def test_only_requested_languages_and_fields(self):
+        ayah = self.get(lang='en', fields='text_normalized', limit=1).json()['ayahs'][0]
+        self.assertEqual(ayah, {'ayah': 1, 'text_normalized': {'en': 'en 1'}})
+
+    def test_invalid_parameters(self):
+        for params in ({'limit': 0}, {'limit': 301}, {'after': -1}, {'lang': 'EN!'}, {'fields': 'password'}):
+            with self.subTest(**params):
+                self.assertEqual(self.get(**params).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_surah_ayahs', args=[115])).status_code, 404)
+
+    def test_ndjson_streams_one_ayah_per_line(self):
+        response = self.get(format='ndjson', lang='ar,en')
+        self.assertTrue(response.streaming)
+        self.assertNotIn('X-Next-Cursor', response)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 286)
+        self.assertEqual(json.loads(lines[-1]), {'ayah': 286, 'text': {'ar': 'ar 286', 'en': 'en 286'}})
+
+    def test_ndjson_rows_are_read_as_the_body_is_sent(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('api_surah_ayahs', args=[2]), {'after': 10, 'limit': 5},
+                headers={'Accept': 'application/x-ndjson'},
+            )
+            self.assertFalse([query for query in queries if 'core_ayah' in query['sql']])
+            first = next(iter(response.streaming_content))
+        self.assertEqual(json.loads(first)['ayah'], 11)
+        self.assertEqual(response['X-Next-Cursor'], '15')
+        self.assertEqual(len([query for query in queries if 'core_ayah' in query['sql']]), 1)
+
+
+# ==================== AUDIO CACHE ====================
+
+class StubUpstream:
+    """
+    A local HTTP server standing in for an upstream: every path is `body`
+    (by default a recitation of `size` bytes), served after `delay` seconds.
+    Subclasses route paths by overriding respond().
+    """
+
+    def __init__(self, size=4096, delay=0, body=None, content_type='audio/mpeg'):
+        self.size = size
+        self.delay = delay
+        self.body = body
+        self.content_type = content_type
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                time.sleep(stub.delay)
+                answer = stub.respond(self.path)
+                if answer is None:
+                    self.send_error(404)
+                    return
+                content_type, body = answer
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.origin = f'http://127.0.0.1:{self.server.server_port}'
+        self.url = f'{self.origin}/{{reciter}}/{{surah}}.mp3'
+
+    def respond(self, path):
+        """(content type, body) for a path, or None for a 404"""
+        return self.content_type, self.body if self.body is not None else bytes(range(256)) * (self.size // 256)
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AudioCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.upstream = StubUpstream()
+        self.upstream.__enter__()
+        self.addCleanup(self.upstream.__exit__)
+        settings = override_settings(AUDIO_UPSTREAM_URL=self.upstream.url, AUDIO_CACHE_DIR=Path(self.cache_dir.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def get(self, surah_number, **headers):
+        return self.client.get(reverse('audio_file', args=['alafasy', surah_number]), headers=headers)
+
+    def test_range_request_gets_206(self):
+        response = self.get(1, Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/4096')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100, 200)))
+
+    def test_unsatisfiable_range_gets_416(self):
+        response = self.get(1, Range='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */4096')
+
+    def test_concurrent_misses_download_once(self):
+        self.upstream.delay = 0.2
+        files = []
+
+        def fetch():
+            files.append(audio.get_audio_file('alafasy', 2))
+
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.upstream.requests, ['/alafasy/2.mp3'])
+        for f in files:
+            with f:
+                self.assertEqual(len(f.read()), 4096)
+
+    def test_least_recently_used_file_is_evicted(self):
+        with override_settings(AUDIO_CACHE_MAX_BYTES=2 * 4096):
+            for surah_number, age in ((1, 300), (2, 200)):
+                audio.get_audio_file('alafasy', surah_number).close()
+                past = time.time() - age
+                audio.os.utime(audio.cache_path('alafasy', surah_number), (past, past))
+            # A hit makes surah 1 the most recently used
+            audio.get_audio_file('alafasy', 1).close()
+            audio.get_audio_file('alafasy', 3).close()
+
+        self.assertTrue(audio.cache_path('alafasy', 1).exists())
+        self.assertFalse(audio.cache_path('alafasy', 2).exists())
+        self.assertTrue(audio.cache_path('alafasy', 3).exists())
+
+    def test_file_over_the_limit_is_still_served(self):
+        with override_settings(AUDIO_CACHE_MAX_BYTES=1024):
+            response = self.get(1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content)), 4096)
+
+    def test_recitation_id_downloads_from_quran_api_url(self):
+        url = self.upstream.url.format(reciter='qdc', surah=1)
+        with mock.patch('core.audio.get_chapter_audio_url', return_value=url) as get_url:
+            response = self.client.get(reverse('audio_file', args=['7', 1]))
+        get_url.assert_called_once_with(7, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.upstream.requests, ['/qdc/1.mp3'])
+        response.close()
+
+    async def test_asgi_response_streams_asynchronously(self):
+        # A synchronous body would be read whole into memory before sending
+        response = await self.async_client.get(
+            reverse('audio_file', args=['alafasy', 1]), headers={'Range': 'bytes=0-99'},
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([part async for part in response.streaming_content]), bytes(range(100)))
+        response.close()
+
+    def test_evicted_file_keeps_streaming(self):
+        f = audio.get_audio_file('alafasy', 1)
+        audio.evict(0)
+        self.assertFalse(audio.cache_path('alafasy', 1).exists())
+        with f:
+            self.assertEqual(len(f.read()), 4096)
+
+
+# ==================== AYAH TIMINGS ====================
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417-byte frames of 26.1 ms
+CBR_FRAME_HEADER = b'\xff\xfb\x90\x00'
+CBR_FRAME_LENGTH = 417
+
+
+def id3v2_tag(size):
+    """An empty ID3v2 tag `size` bytes long, header included"""
+    body = size - 10
+    syncsafe = bytes((body >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b'ID3\x04\x00\x00' + syncsafe + bytes(body)
+
+
+def cbr_mp3(frames, tag_size=0):
+    frame = CBR_FRAME_HEADER + bytes(CBR_FRAME_LENGTH - 4)
+    return (id3v2_tag(tag_size) if tag_size else b'') + frame * frames
+
+
+def timing_file(directory, surah_number=1, ayah_ms=1000):
+    path = Path(directory) / 'timings.json'
+    total = get_catalog().get(surah_number)['totalAyah']
+    path.write_text(json.dumps({'audio_file': {'verse_timings': [
+        {'verse_key': f'{surah_number}:{n}', 'timestamp_from': (n - 1) * ayah_ms, 'timestamp_to': n * ayah_ms}
+        for n in range(1, total + 1)
+    ]}}))
+    return path
+
+
+class AyahTimingTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(AUDIO_CACHE_DIR=self.directory / 'audio')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(audio_timing._indexes.clear)
+        self.addCleanup(audio_timing._misses.clear)
+
+    def import_timings(self, reciter='alafasy'):
+        call_command('import_audio_timings', timing_file(self.directory), reciter=reciter, stdout=StringIO())
+        return TimingIndex.from_bytes(RecitationTiming.objects.get(reciter=reciter, surah=1).data)
+
+    def cache_file(self, data, reciter='alafasy'):
+        path = audio.cache_path(reciter, 1)
+        path.parent.mkdir(parents=True)
+        path.write_bytes(data)
+
+    def test_import_needs_surah_rows(self):
+        with self.assertRaisesMessage(CommandError, 'Run import_quran first'):
+            self.import_timings()
+        self.assertFalse(RecitationTiming.objects.exists())
+
+    def test_offsets_come_from_the_cached_file(self):
+        surah(1)
+        self.cache_file(cbr_mp3(400, tag_size=2048))
+        index = self.import_timings()
+        # Ayah 2 starts at 1000 ms, inside frame 38 (26.12 ms per frame)
+        self.assertEqual(index.offsets[1], 2048 + 38 * CBR_FRAME_LENGTH)
+
+    def test_estimated_offsets_start_after_the_id3_tag(self):
+        surah(1)
+        self.cache_file(id3v2_tag(4096) + b'not audio' * 100)
+        index = self.import_timings()
+        self.assertEqual(list(index.offsets[:2]), [4096, 4096 + 16000])
+
+    def test_timings_api_gives_the_range_of_one_ayah(self):
+        surah(1)
+        self.import_timings()
+        response = self.client.get(reverse('api_audio_timings', args=['alafasy', 1]), {'at': 2500})
+        self.assertEqual(response.json()['ayah']['ayah'], 3)
+        self.assertEqual(response.json()['range'], 'bytes=32000-47999')
+
+    def test_missing_index_is_remembered(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(audio_timing.get_timing_index('alafasy', 2))
+        with self.assertNumQueries(0):
+            self.assertIsNone(audio_timing.get_timing_index('alafasy', 2))
+            response = self.client.get(reverse('audio_clip', args=['alafasy', 2, 1, 2]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_reciter_is_rejected_without_a_query(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('audio_clip', args=['No Such', 1, 1, 2]))
+        self.assertEqual(response.status_code, 404)
+
+    @tag('benchmark')
+    def test_bisect_lookup(self):
+        # Al-Baqarah: 286 ayahs over about two hours
+        starts = [n * 25_000 for n in range(286)]
+        index = TimingIndex(starts, [start + 25_000 for start in starts], [start * 16 for start in starts])
+        rng = random.Random(1)
+        times = [rng.randrange(286 * 25_000) for _ in range(100_000)]
+        offsets = [t * 16 for t in times]
+
+        started = time.perf_counter()
+        for ms in times:
+            index.ayah_at(ms)
+        by_time = (time.perf_counter() - started) / len(times) * 1e9
+        started = time.perf_counter()
+        for offset in offsets:
+            index.ayah_at_byte(offset)
+        by_byte = (time.perf_counter() - started) / len(offsets) * 1e9
+
+        report('timing index lookup over 286 ayahs (ns)', by_time=by_time, by_byte=by_byte)
+        self.assertEqual(index.ayah_at(25_000 * 100 + 1), 101)
+        self.assertEqual(index.ayah_at_byte(25_000 * 16 * 100), 101)
+
+
+# ==================== MP3 CLIPS ====================
+
+def xing_frame(tag=b'Xing'):
+    """A stereo MPEG-1 Xing/Info header frame"""
+    return CBR_FRAME_HEADER + bytes(32) + tag + bytes(CBR_FRAME_LENGTH - 40)
+
+
+class Mp3ClipTests(TestCase):
+
+    def test_cbr_frames_start_after_the_id3v2_tag(self):
+        frames = mp3.scan_frames(BytesIO(cbr_mp3(100, tag_size=1024)))
+        self.assertEqual(len(frames), 100)
+        self.assertEqual(frames.offsets[0], 1024)
+        self.assertEqual(frames.data_end, 1024 + 100 * CBR_FRAME_LENGTH)
+        self.assertFalse(frames.vbr)
+
+    def test_xing_frame_is_metadata_not_audio(self):
+        frames = mp3.scan_frames(BytesIO(xing_frame() + cbr_mp3(100)))
+        self.assertTrue(frames.vbr)
+        self.assertEqual(len(frames), 100)
+        self.assertEqual(frames.offsets[0], CBR_FRAME_LENGTH)
+
+    def test_audio_ends_at_the_id3v1_tag(self):
+        frames = mp3.scan_frames(BytesIO(cbr_mp3(100) + b'TAG' + bytes(125)))
+        self.assertEqual(frames.data_end, 100 * CBR_FRAME_LENGTH)
+
+    def test_not_an_mp3(self):
+        with self.assertRaises(mp3.Mp3Error):
+            mp3.scan_frames(BytesIO(b'RIFF' + bytes(4096)))
+
+    def test_byte_range_covers_whole_frames(self):
+        frames = mp3.scan_frames(BytesIO(cbr_mp3(400)))
+        # 1000-2000 ms overlaps frames 38 to 76 (26.12 ms each)
+        self.assertEqual(frames.byte_range(1000, 2000), (38 * CBR_FRAME_LENGTH, 77 * CBR_FRAME_LENGTH))
+
+    def test_byte_range_is_read_in_bounded_chunks(self):
+        reads = []
+
+        class File(BytesIO):
+            def read(self, size=-1):
+                reads.append(size)
+                return super().read(size)
+
+        f = File(bytes(range(256)) * 1024)
+        parts = list(mp3.iter_byte_range(f, 1000, 101_000, loops=2, chunk_size=4096))
+        self.assertEqual(b''.join(parts), (bytes(range(256)) * 1024)[1000:101_000] * 2)
+        self.assertTrue(0 < max(reads) <= 4096)
+        self.assertTrue(f.closed)
+
+    def test_clip_endpoint_loops_the_requested_ayahs(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(audio_timing._indexes.clear)
+        with override_settings(AUDIO_CACHE_DIR=Path(directory.name) / 'audio'):
+            surah(1)
+            data = cbr_mp3(400, tag_size=1024)
+            path = audio.cache_path('alafasy', 1)
+            path.parent.mkdir(parents=True)
+            path.write_bytes(data)
+            call_command(
+                'import_audio_timings', timing_file(directory.name), reciter='alafasy', stdout=StringIO(),
+            )
+            response = self.client.get(reverse('audio_clip', args=['alafasy', 1, 2, 3]), {'loop': 2})
+            body = b''.join(response.streaming_content)
+
+        start, end = 1024 + 38 * CBR_FRAME_LENGTH, 1024 + 115 * CBR_FRAME_LENGTH
+        self.assertEqual(response['Content-Length'], str(2 * (end - start)))
+        self.assertEqual(body, data[start:end] * 2)
+
+    @tag('benchmark')
+    def test_throughput(self):
+        """Frame scan and clip streaming, one core, over an hour of 128 kbps audio"""
+        data = xing_frame() + cbr_mp3(138_000)
+        megabytes = len(data) / 2**20
+        started = time.perf_counter()
+        frames = mp3.scan_frames(BytesIO(data))
+        scan_seconds = time.perf_counter() - started
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            started = time.perf_counter()
+            for _ in mp3.iter_byte_range(open(f.name, 'rb'), *frames.byte_range(0, frames.duration_ms)):
+                pass
+            stream_seconds = time.perf_counter() - started
+
+        report(
+            f'mp3 throughput over {megabytes:.1f} MB (MB/s per core)',
+            scan=megabytes / scan_seconds, stream=megabytes / stream_seconds,
+        )
+        self.assertEqual(len(frames), 138_000)
+
+
+# ==================== SURAH AUDIO PAGE ====================
+
+class StubQuranApi(StubUpstream):
+    """StubUpstream answering the quran.com API calls behind the player, and serving the audio"""
+    RECITATIONS = [
+        {'id': 7, 'reciter_name': 'Mishari Rashid al-Afasy', 'style': None},
+        {'id': 2, 'reciter_name': 'AbdulBaset AbdulSamad', 'style': 'Murattal'},
+    ]
+
+    @property
+    def api_url(self):
+        return f'{self.origin}/api/v4'
+
+    def respond(self, path):
+        path = path.split('?')[0]
+        if path.startswith('/audio/'):
+            return super().respond(path)
+        if path == '/api/v4/resources/recitations':
+            data = {'recitations': self.RECITATIONS}
+        elif match := re.fullmatch(r'/api/v4/chapters/(\d+)', path):
+            data = {'chapter': get_catalog().get(int(match[1]))}
+        elif match := re.fullmatch(r'/api/v4/chapter_recitations/(\d+)/(\d+)', path):
+            data = {'audio_file': {'audio_url': f'{self.origin}/audio/{match[1]}/{match[2]}.mp3'}}
+        else:
+            return None
+        return 'application/json', json.dumps(data).encode('utf-8')
+
+
+class StubQuranApiTestCase(TestCase):
+    """Talks to a StubQuranApi, starting every test from cold caches"""
+    # Round trip to api.quran.com and its CDN, which the local stub doesn't have
+    UPSTREAM_RTT = 0.03
+
+    def setUp(self):
+        self.api = StubQuranApi(size=64 * 1024)
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            QURAN_API_URL=self.api.api_url,
+            RECITERS_CACHE_FILE=Path(directory.name) / 'reciters.json',
+            AUDIO_CACHE_DIR=Path(directory.name) / 'audio',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.forget()
+        self.addCleanup(self.forget)
+
+    def forget(self):
+        """Start from cold caches, as after a deploy"""
+        reciters._catalog = None
+        cache.clear()
+        caches['pages'].clear()
+        caches['tiered'].l1.clear()
+
+    def get(self, surah_number=1, **params):
+        return self.client.get(reverse('surah_audio', args=[surah_number]), params)
+
+
+class SurahAudioPageTests(StubQuranApiTestCase):
+
+    def test_player_is_rendered_server_side(self):
+        response = self.get()
+        self.assertContains(response, get_catalog().get(1)['surahName'])
+        self.assertContains(response, 'AbdulBaset AbdulSamad (Murattal)')
+        self.assertContains(response, f'src="{reverse("audio_file", args=["7", 1])}"')
+
+    def test_player_is_cached_per_surah_and_reciter(self):
+        self.get()
+        fetched = len(self.api.requests)
+        self.get()
+        self.assertEqual(len(self.api.requests), fetched)
+        # The reciter list is shared; only the new recitation's URL is fetched
+        self.assertContains(self.get(reciter=2), 'selected>AbdulBaset')
+        self.assertEqual(self.api.requests[fetched:], ['/api/v4/chapter_recitations/2/1'])
+
+    @tag('benchmark')
+    def test_time_to_first_audio(self):
+        self.api.delay = self.UPSTREAM_RTT
+
+        def before():
+            # What the page's script did: three serial API calls, then the audio
+            for path in ('chapters/1', 'resources/recitations?language=en', 'chapter_recitations/7/1'):
+                data = json.loads(urlopen(f'{self.api.api_url}/{path}').read())
+            with urlopen(data['audio_file']['audio_url']) as f:
+                f.read(1024)
+
+        def after():
+            self.assertEqual(self.get().status_code, 200)
+            response = self.client.get(reverse('audio_file', args=['7', 1]), headers={'Range': 'bytes=0-1023'})
+            b''.join(response.streaming_content)
+            response.close()
+
+        def after_cold():
+            self.forget()
+            after()
+
+        before_ms = timed(before, 10)
+        cold_ms = timed(after_cold, 10)
+        warm_ms = timed(after, 10)
+        report(
+            'surah_audio time-to-first-audio (ms, p50)',
+            client_side=statistics.median(before_ms), server_cold=statistics.median(cold_ms),
+            server_warm=statistics.median(warm_ms),
+        )
+        self.assertLess(statistics.median(warm_ms), statistics.median(before_ms))
+
+
+# ==================== ASGI ====================
+
+class AsgiModeTests(StubQuranApiTestCase):
+
+    def test_data_views_are_async(self):
+        for view in (views.surah_catalog, views.reciters, views.audio_timings, views.surah_audio):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+    async def test_upstream_client_is_pooled_per_host(self):
+        client = async_http.get_async_client(f'{self.api.api_url}/chapters/1')
+        other = async_http.get_async_client('http://localhost:1/')
+        try:
+            self.assertIs(async_http.get_async_client(f'{self.api.api_url}/resources/recitations'), client)
+            self.assertIsNot(other, client)
+        finally:
+            await client.aclose()
+            await other.aclose()
+
+    @override_settings(SERVER_MODE='asgi')
+    async def test_requests_wait_on_upstream_concurrently(self):
+        # A sync-only middleware would run these one after the other
+        self.api.delay = 0.3
+        client = async_http.get_async_client(self.api.api_url)
+        started = time.perf_counter()
+        try:
+            responses = await asyncio.gather(*(
+                self.async_client.get(reverse('surah_audio', args=[number])) for number in (1, 2, 3)
+            ))
+        finally:
+            await client.aclose()
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        # One reciter list and three chapter lookups, overlapping rather than 1.2 s back to back
+        self.assertLess(time.perf_counter() - started, 0.9)
+
+    @override_settings(WHITENOISE_AUTOREFRESH=True, WHITENOISE_USE_FINDERS=True)
+    async def test_static_files_are_served_in_async_mode(self):
+        response = await self.async_client.get('/static/home/styles/style.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/css; charset="utf-8"')
+
+    @override_settings(SERVER_MODE='asgi')
+    async def test_asgi_mode_fetches_through_the_pooled_client(self):
+        client = async_http.get_async_client(self.api.api_url)
+        try:
+            with mock.patch.object(client, 'get', wraps=client.get) as get:
+                response = await self.async_client.get(reverse('surah_audio', args=[1]))
+        finally:
+            await client.aclose()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(call.args[0].removeprefix(self.api.api_url) for call in get.call_args_list),
+            ['/chapter_recitations/7/1', '/resources/recitations'],
+        )
+
+    @tag('benchmark')
+    def test_concurrent_requests_per_worker(self):
+        """Cold surah pages, each waiting on upstream: one sync worker versus one event loop"""
+        self.api.delay = 0.1
+        # Warm the reciter list so every request makes one upstream call
+        self.get(114)
+        surahs = range(1, 21)
+
+        started = time.perf_counter()
+        for number in surahs:
+            self.assertEqual(self.get(number).status_code, 200)
+        sync_seconds = time.perf_counter() - started
+
+        self.forget()
+        self.get(114)
+
+        async def concurrently():
+            with override_settings(SERVER_MODE='asgi'):
+                client = async_http.get_async_client(self.api.api_url)
+                try:
+                    responses = await asyncio.gather(*(
+                        self.async_client.get(reverse('surah_audio', args=[number])) for number in surahs
+                    ))
+                finally:
+                    await client.aclose()
+            return [response.status_code for response in responses]
+
+        started = time.perf_counter()
+        self.assertEqual(asyncio.run(concurrently()), [200] * len(surahs))
+        async_seconds = time.perf_counter() - started
+
+        report(
+            f'{len(surahs)} requests with {self.api.delay * 1000:.0f} ms upstream latency (requests/s per worker)',
+            sync=len(surahs) / sync_seconds, asgi=len(surahs) / async_seconds,
+        )
+        self.assertLess(async_seconds, sync_seconds)
+
+
+# ==================== RECITERS ====================
+
+class ReciterCatalogTests(TestCase):
+
+    def setUp(self):
+        self.api = StubQuranApi()
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(QURAN_API_URL=self.api.api_url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.delete_many([reciters.CACHE_KEY, reciters.REFRESH_LOCK_KEY])
+        self.addCleanup(cache.delete_many, [reciters.CACHE_KEY, reciters.REFRESH_LOCK_KEY])
+
+        self.catalog = reciters.ReciterCatalog(60, Path(directory.name) / 'reciters.json')
+        self.stale = [{'id': 1, 'reciter_name': 'Stale', 'style': None}]
+        self.catalog.entry = {'reciters': self.stale, 'fetched_at': time.time() - 120}
+
+    def wait_for_refresh(self):
+        with self.catalog.refresh_lock:
+            pass
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        self.assertEqual(self.catalog.get(), self.stale)
+        self.wait_for_refresh()
+        self.assertEqual(self.catalog.get(), StubQuranApi.RECITATIONS[::-1])
+        self.assertEqual(self.api.requests, ['/api/v4/resources/recitations?language=en'])
+
+    async def test_async_refresh_keeps_cache_calls_off_the_event_loop(self):
+        calls = []
+
+        def off_loop(name):
+            def call(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    calls.append(name)
+                except RuntimeError:
+                    pass
+                return getattr(cache, name)(*args, **kwargs)
+            return call
+
+        checked_cache = mock.Mock(wraps=cache, **{f'{name}.side_effect': off_loop(name) for name in ('add', 'get')})
+        with mock.patch('core.reciters.cache', checked_cache):
+            self.assertEqual(await self.catalog.aget(), self.stale)
+            await sync_to_async(self.wait_for_refresh)()
+        checked_cache.add.assert_called_once()
+        self.assertEqual(calls, [])
+
+
+# ==================== PRERENDER ====================
+
+class PrerenderTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name) / 'prerendered'
+        self.manifest = Path(directory.name) / 'var' / 'prerender-manifest.json'
+        settings = override_settings(
+            PRERENDER_ROOT=self.root, PRERENDER_MANIFEST=self.manifest, CORPUS_PATH=self.root / 'corpus.bin',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # No reciters: the surah HTML pages are skipped, the rest still renders
+        patcher = mock.patch('core.management.commands.prerender_surahs.get_reciters', return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def prerender(self):
+        out = StringIO()
+        call_command('prerender_surahs', workers=1, stdout=out)
+        return out.getvalue()
+
+    def test_manifest_is_kept_out_of_the_served_root(self):
+        legacy = self.root / 'pages' / 'manifest.json'
+        legacy.parent.mkdir(parents=True)
+        legacy.write_text('{"pages": {}}')
+        self.prerender()
+        self.assertIn('pages/index.html', json.loads(self.manifest.read_text())['pages'])
+        self.assertFalse(legacy.exists())
+        self.assertEqual(list(self.root.rglob('*manifest*')), [])
+
+    def test_pages_are_rendered_for_an_anonymous_visitor(self):
+        self.prerender()
+        page = (self.root / 'pages' / 'index.html').read_text()
+        self.assertIn('Log In', page)
+        self.assertIn('id="surah-catalog"', page)
+        self.assertTrue((self.root / 'pages' / 'index.html.gz').exists())
+
+    def test_unchanged_pages_are_not_rewritten(self):
+        self.prerender()
+        self.assertIn('Rendered 0 page(s), 115 unchanged', self.prerender())
+
+    def test_csrf_token_cant_be_prerendered(self):
+        def render_to_string(template_name, context=None, request=None):
+            return engines['django'].from_string('<form>{% csrf_token %}</form>').render(context, request)
+
+        job = {
+            'kind': 'html', 'name': 'pages/index.html', 'path': '/pages/', 'root': str(self.root),
+            'template': 'home/index.html', 'context': {},
+        }
+        with mock.patch.object(prerender_surahs, 'render_to_string', render_to_string):
+            with self.assertRaisesMessage(CommandError, "uses csrf_token and can't be pre-rendered"):
+                prerender_surahs.render_page(job)
+
+
+# ==================== UPSTREAM ====================
+
+class UpstreamCoalescingTests(TestCase):
+
+    def setUp(self):
+        self.key = f'test:{self.id()}'
+        self.addCleanup(cache.delete_many, [upstream.entry_key(self.key), upstream.lock_key(self.key)])
+
+    def test_waiter_gets_the_value_stored_by_the_lock_holder(self):
+        # Another worker holds the lock, stores its value and only then releases it
+        cache.add(upstream.lock_key(self.key), 1, 10)
+
+        def finish():
+            time.sleep(0.2)
+            cache.set(upstream.entry_key(self.key), upstream.new_entry('fresh', 60), 60)
+            cache.delete(upstream.lock_key(self.key))
+
+        holder = threading.Thread(target=finish)
+        holder.start()
+        fetch = mock.Mock(return_value='fetched again')
+        self.assertEqual(upstream.cached(self.key, fetch, 60), 'fresh')
+        holder.join()
+        fetch.assert_not_called()
+
+    def test_lock_is_released_after_the_entry_is_stored(self):
+        entry_when_unlocked = []
+
+        def delete(key, *args, **kwargs):
+            if key == upstream.lock_key(self.key):
+                entry_when_unlocked.append(cache.get(upstream.entry_key(self.key)))
+            return cache.delete(key, *args, **kwargs)
+
+        recording_cache = mock.Mock(wraps=cache)
+        recording_cache.delete.side_effect = delete
+        with mock.patch('core.upstream.cache', recording_cache):
+            self.assertEqual(upstream.cached(self.key, lambda: 'value', 60), 'value')
+        self.assertEqual(entry_when_unlocked[0]['value'], 'value')
+
+
+# ==================== TIERED CACHE ====================
+
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        self.tiered = caches['tiered']
+        self.namespace = f'test-{self._testMethodName}'
+        self.key = f'{self.namespace}:page'
+        self.addCleanup(self.tiered.shared.clear)
+        self.addCleanup(self.tiered.l1.clear)
+
+    def forget(self):
+        """Drop what this process knows, as a fresh worker would"""
+        self.tiered.l1.clear()
+        self.tiered.generations.clear()
+
+    def test_invalidation_survives_shared_cache_eviction(self):
+        self.tiered.set(self.key, 'old')
+        old_l2_key = self.tiered.l2_key(self.key)
+        self.tiered.invalidate(self.namespace)
+        self.assertEqual(CacheGeneration.current(self.namespace), 1)
+
+        # The shared cache culls everything but the stale entry
+        self.tiered.shared.clear()
+        self.tiered.shared.set(old_l2_key, 'old')
+        self.forget()
+        self.assertIsNone(self.tiered.get(self.key))
+
+    def test_invalidation_reaches_other_workers(self):
+        self.tiered.set(self.key, 'old')
+        self.assertEqual(self.tiered.get(self.key), 'old')
+        # Another worker invalidates; this one sees it after SYNC_INTERVAL
+        CacheGeneration.bump(self.namespace)
+        self.tiered.generations.clear()
+        self.assertIsNone(self.tiered.get(self.key))
+
+    def test_oversized_value_replaces_l1_entry(self):
+        lru = LRU(max_entries=10, max_bytes=100)
+        lru.set('key', b'small', 60)
+        lru.set('key', b'x' * 200, 60)
+        self.assertIsNone(lru.get('key'))
+        self.assertEqual(lru.size, 0)
+
+
+# ==================== PAGE CACHE ====================
+
+@override_settings(PAGE_CACHE_TIMEOUT=60)
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(caches['pages'].clear)
+        self.addCleanup(caches['tiered'].l1.clear)
+
+    def key(self, url):
+        request = RequestFactory().get(url)
+        return page_cache.page_key(request, page_cache.cached_query(request))
+
+    def test_key_ignores_unlisted_query_parameters(self):
+        self.assertEqual(self.key('/aboutus/'), self.key('/aboutus/?utm_source=x&_=123'))
+        self.assertEqual(self.key('/surah/audio/1/?reciter=7'), self.key('/surah/audio/1/?_=1&reciter=7'))
+        self.assertNotEqual(self.key('/surah/audio/1/?reciter=7'), self.key('/surah/audio/1/?reciter=8'))
+
+    def test_undecorated_views_skip_the_cache(self):
+        self.assertIsNone(page_cache.cached_query(RequestFactory().get('/feedback/')))
+        self.assertIsNone(page_cache.cached_query(RequestFactory().get('/no-such-page/')))
+
+    def test_cache_busting_query_is_served_from_the_cache(self):
+        self.assertEqual(self.client.get('/aboutus/')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get('/aboutus/?_=123')['X-Page-Cache'], 'hit')
+
+    def test_pages_stay_out_of_the_default_cache(self):
+        self.client.get('/aboutus/')
+        self.assertIsNot(caches['tiered'].shared, cache)
+        self.assertIsNone(cache.get(caches['tiered'].l2_key(self.key('/aboutus/'))))
+        self.assertIsNotNone(caches['pages'].get(caches['tiered'].l2_key(self.key('/aboutus/'))))
+
+
+# ==================== CORPUS ====================
+
+class CorpusGenerationTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.corpus_path = Path(directory.name) / 'corpus.bin'
+        settings = override_settings(CORPUS_PATH=self.corpus_path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.surah = Surah.objects.create(
+            number=1, name='Al-Fatiha', name_arabic='الفاتحة', name_translation='The Opening',
+            revelation_place='Mecca', total_ayah=7,
+        )
+        for number in range(1, 7):
+            Ayah.objects.create(surah=self.surah, number=number, language='en', text=f'Verse {number}')
+        self.build()
+
+    def build(self):
+        call_command('build_corpus', stdout=StringIO())
+        # Don't wait out the per-process generation check
+        corpus._generation['value'] = None
+
+    def texts(self, limit=6):
+        return [ayah['text']['en'] for ayah in verses.iter_ayahs(1, 0, limit, ['en'])]
+
+    def test_current_corpus_is_served(self):
+        self.assertIsNotNone(corpus.get_corpus())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.texts(), [f'Verse {number}' for number in range(1, 7)])
+
+    def test_stale_corpus_falls_back_to_database(self):
+        ayah = Ayah.objects.get(number=2)
+        ayah.text = 'Edited'
+        ayah.save()
+        corpus._generation['value'] = None
+
+        self.assertIsNone(corpus.get_corpus())
+        self.assertEqual(self.texts()[1], 'Edited')
+
+        self.build()
+        self.assertIsNotNone(corpus.get_corpus())
+        self.assertEqual(self.texts()[1], 'Edited')
+
+    def test_oversized_corpus_fails_before_an_offset_overflows(self):
+        with mock.patch('core.management.commands.build_corpus.MAX_OFFSET', 100):
+            with self.assertRaisesMessage(CommandError, 'too large for 32-bit offsets'):
+                call_command('build_corpus', stdout=StringIO())
+        self.assertEqual(list(self.corpus_path.parent.glob('*.part')), [])
+
+    def test_ayah_missing_from_corpus_is_read_from_database(self):
+        # bulk_create skips Ayah.save(), so the generation doesn't move
+        Ayah.objects.bulk_create([Ayah(surah=self.surah, number=7, language='en', text='Verse 7')])
+        self.assertIsNotNone(corpus.get_corpus())
+        self.assertEqual(self.texts(limit=7)[-1], 'Verse 7')
+
+
+# ==================== ROLLUPS ====================
+
+class RollupRebuildTests(TestCase):
+
+    def test_rebuild_upserts_fresh_counts(self):
+        today = timezone.localdate()
+        Feedback.objects.create(message='saved', feedback_type='other', rating=4)
+        # Skips save(), so the rollup misses it until a rebuild
+        Feedback.objects.bulk_create([Feedback(message='bulk', feedback_type='other', rating=2)])
+        # A day whose feedback has all been deleted since it was counted
+        FeedbackDailyRollup.objects.create(
+            day=today - timedelta(days=1), feedback_type='other', count=3, rated_count=1, rating_sum=5,
+        )
+        pks = set(FeedbackDailyRollup.objects.values_list('pk', flat=True))
+
+        self.assertEqual(rollups.rebuild(today - timedelta(days=1), today + timedelta(days=1)), 2)
+        # Updated in place, not deleted and inserted again
+        self.assertEqual(set(FeedbackDailyRollup.objects.values_list('pk', flat=True)), pks)
+
+        counts = {
+            rollup.day: (rollup.count, rollup.rated_count, rollup.rating_sum)
+            for rollup in FeedbackDailyRollup.objects.all()
+        }
+        self.assertEqual(counts, {today: (2, 2, 6), today - timedelta(days=1): (0, 0, 0)})
+
+
+class RollupRaceTests(TransactionTestCase):
+
+    def test_save_between_count_and_write_is_kept(self):
+        """
+        Another connection saves feedback right after rebuild() has read
+        the counts; its increment must survive the rebuild's write.
+        """
+        today = timezone.localdate()
+        Feedback.objects.create(message='counted', feedback_type='bug', rating=5)
+        Feedback.objects.bulk_create([Feedback(message='uncounted', feedback_type='bug')])
+        saved = threading.Event()
+
+        def save_concurrently():
+            try:
+                while True:
+                    try:
+                        Feedback.objects.create(message='concurrent', feedback_type='bug', rating=3)
+                        saved.set()
+                        return
+                    except OperationalError:
+                        # SQLite: the rebuild holds the write lock; a server database waits instead
+                        time.sleep(0.01)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=save_concurrently)
+        counted = False
+
+        def before_write(execute, sql, params, many, context):
+            nonlocal counted
+            if counted and 'ON CONFLICT' in sql and not thread.is_alive():
+                thread.start()
+                # Long enough for the save to land if nothing holds it back
+                saved.wait(0.5)
+            counted = counted or 'GROUP BY' in sql
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(before_write):
+            rollups.rebuild(today, today + timedelta(days=1))
+        thread.join(10)
+        self.assertTrue(saved.is_set())
+
+        rollup = FeedbackDailyRollup.objects.get(day=today, feedback_type='bug')
+        self.assertEqual((rollup.count, rollup.rated_count, rollup.rating_sum), (3, 2, 8))
+        # No empty placeholders left behind
+        self.assertEqual(FeedbackDailyRollup.objects.count(), 1)
+
+
+# ==================== OUTBOX ====================
+
+class StubSMTP:
+    """
+    A local SMTP server standing in for the relay. It records the
+    recipients of each message, one list per connection, and refuses
+    the addresses in `reject`.
+    """
+
+    def __init__(self):
+        self.connections = []
+        self.reject = set()
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                messages = []
+                stub.connections.append(messages)
+                recipients = []
+                self.reply('220 stub ESMTP')
+                while line := self.rfile.readline():
+                    command = line.decode('ascii').strip()
+                    verb = command[:4].upper()
+                    if verb == 'MAIL':
+                        recipients = []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        address = command.split(':', 1)[1].strip().strip('<>')
+                        if address in stub.reject:
+                            self.reply('550 No such user')
+                        else:
+                            recipients.append(address)
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        while self.rfile.readline() not in (b'.\r\n', b''):
+                            pass
+                        messages.append(recipients)
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:  # EHLO, RSET, NOOP
+                        self.reply('250 OK')
+
+            def reply(self, line):
+                self.wfile.write(line.encode('ascii') + b'\r\n')
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(OUTBOX_BATCH_SIZE=10, OUTBOX_RETRY_BACKOFF=30, OUTBOX_MAX_ATTEMPTS=3, OUTBOX_LEASE=300)
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.smtp = StubSMTP()
+        self.smtp.__enter__()
+        self.addCleanup(self.smtp.__exit__)
+        settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.smtp.port, EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='', EMAIL_TIMEOUT=5,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def queue(self, to='reader@example.com'):
+        return outbox.queue('Subject', 'Body', [to])
+
+    def test_queue_only_inserts(self):
+        outbound = self.queue()
+        self.assertEqual(outbound.status, OutboundEmail.STATUS_PENDING)
+        self.assertEqual(outbound.attempts, 0)
+        self.assertEqual(self.smtp.connections, [])
+
+    def test_batch_goes_over_one_connection(self):
+        for n in range(3):
+            self.queue(f'reader{n}@example.com')
+        self.assertEqual(outbox.deliver_batch(), (3, 0))
+        self.assertEqual(
+            self.smtp.connections, [[[f'reader{n}@example.com'] for n in range(3)]],
+        )
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.STATUS_SENT).exists())
+        self.assertEqual(outbox.deliver_batch(), (0, 0))
+
+    def test_failures_back_off_then_give_up(self):
+        self.smtp.reject.add('gone@example.com')
+        outbound = self.queue('gone@example.com')
+        self.queue()
+
+        for attempt, delay in ((1, 30), (2, 60)):
+            started = timezone.now()
+            self.assertEqual(outbox.deliver_batch(), (0, 1) if attempt > 1 else (1, 1))
+            outbound.refresh_from_db()
+            self.assertEqual(outbound.attempts, attempt)
+            self.assertEqual(outbound.status, OutboundEmail.STATUS_PENDING)
+            self.assertIn('SMTPRecipientsRefused', outbound.last_error)
+            wait = (outbound.next_attempt_at - started).total_seconds()
+            self.assertAlmostEqual(wait, delay, delta=2)
+
+            # Not due yet; then let the delay pass
+            self.assertEqual(outbox.deliver_batch(), (0, 0))
+            OutboundEmail.objects.filter(pk=outbound.pk).update(next_attempt_at=timezone.now())
+
+        self.assertEqual(outbox.deliver_batch(), (0, 1))
+        outbound.refresh_from_db()
+        self.assertEqual(outbound.status, OutboundEmail.STATUS_FAILED)
+        self.assertEqual(outbound.attempts, 3)
+
+    def test_leased_messages_wait_for_the_lease_to_run_out(self):
+        outbound = self.queue()
+        # A sender claims the message and dies before sending it
+        self.assertEqual(outbox.claim(10), [outbound])
+        self.assertEqual(outbox.deliver_batch(), (0, 0))
+        self.assertEqual(self.smtp.connections, [])
+
+        OutboundEmail.objects.filter(pk=outbound.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.deliver_batch(), (1, 0))
+        outbound.refresh_from_db()
+        self.assertEqual(outbound.status, OutboundEmail.STATUS_SENT)
+        self.assertEqual(outbound.attempts, 1)
+
+    def test_password_reset_is_queued_not_sent(self):
+        CustomUser.objects.create_user(username='reader', email='reader@example.com', password='x' * 12)
+        response = self.client.post(reverse('password_reset'), {'email': 'reader@example.com'})
+        self.assertRedirects(response, '/password-reset/done/', fetch_redirect_response=False)
+        self.assertEqual(self.smtp.connections, [])
+        outbound = OutboundEmail.objects.get()
+        self.assertEqual(outbound.to, ['reader@example.com'])
+        self.assertIn('/password-reset-confirm/', outbound.body)
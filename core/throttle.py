@@ -0,0 +1,70 @@
+"""
+Login throttling in front of password checks.
+
+A password check is a full PBKDF2 hash, hundreds of milliseconds of CPU,
+even for an unknown email, so a modest credential-stuffing flood can
+saturate every worker. check_login() runs before authenticate() and
+charges one attempt against two token buckets in the shared cache (see
+core.ratelimit): one per client IP, one per email address. A refused
+attempt is answered with a 429 without hashing anything.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import metrics, ratelimit
+
+
+LOGIN_PER_IP = ratelimit.Rate('login_ip', settings.LOGIN_IP_LIMIT, settings.LOGIN_IP_PERIOD)
+LOGIN_PER_EMAIL = ratelimit.Rate('login_email', settings.LOGIN_EMAIL_LIMIT, settings.LOGIN_EMAIL_PERIOD)
+
+
+def client_ip(request):
+    """
+    The client's address: REMOTE_ADDR, or behind TRUSTED_PROXY_COUNT
+    proxies the address the outermost trusted proxy saw, taken from the
+    right of X-Forwarded-For (entries further left are client-supplied).
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_login(request, email):
+    """Charge one login attempt; a refused Decision means answer 429"""
+    checks = [(LOGIN_PER_IP, client_ip(request))]
+    email = (email or '').strip().lower()
+    if email:
+        checks.append((LOGIN_PER_EMAIL, email))
+
+    decision = ratelimit.hit_all(*checks)
+    if decision.allowed:
+        metrics.incr('login.allowed')
+    else:
+        metrics.incr('login.throttled')
+        metrics.incr(f'login.throttled_{decision.rate.name}')
+    return decision
+
+
+def refused_message(decision):
+    return f"Too many sign-in attempts. Please try again in {decision.retry_after} seconds."
+
+
+def throttle_login(email_field):
+    """Throttle POSTs to a login view whose email comes in email_field"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'POST':
+                decision = check_login(request, request.POST.get(email_field))
+                if not decision.allowed:
+                    response = HttpResponse(refused_message(decision), status=429, content_type='text/plain')
+                    response['Retry-After'] = str(decision.retry_after)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
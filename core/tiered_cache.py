@@ -0,0 +1,229 @@
+"""
+Two-tier Django cache backend: a small in-process LRU (L1) in front of a
+shared cache every worker sees (L2, another CACHES alias: Redis, or the
+file-based cache on a single box).
+
+    CACHES = {
+        'pages': {...shared store...},
+        'tiered': {
+            'BACKEND': 'core.tiered_cache.TieredCache',
+            'LOCATION': 'pages',            # alias of the L2 cache
+            'OPTIONS': {'MAX_ENTRIES': 1000, 'MAX_BYTES': 16 * 2**20,
+                        'L1_TIMEOUT': 5, 'SYNC_INTERVAL': 1},
+        },
+    }
+
+Reads try L1, then L2 (filling L1); writes go to L2 and this worker's L1.
+L1 entries live at most L1_TIMEOUT seconds, and L1 is bounded by entry
+count and by pickled size, evicting least recently used entries first.
+Values are kept pickled, like LocMemCache, so callers can't mutate a
+shared copy.
+
+Cross-worker invalidation is by version key. Every key belongs to a
+namespace (the part before its first ':'), and every namespace has a
+generation number that is part of each stored key. invalidate(ns) bumps
+the generation. Each worker rereads it at most every SYNC_INTERVAL
+seconds, after which every old entry of that namespace is unreachable
+in both tiers, with no key listing or broadcast. Generations live in the
+database (CacheGeneration), not in L2: a cache may evict them, and one
+that fell back to 0 would bring invalidated entries back.
+
+Atomic operations (add, incr, touch) run on L2 only. Counters and locks
+belong on the L2 alias itself.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+from .models import CacheGeneration
+
+
+class LRU:
+    """Bounded, thread-safe store of pickled values with per-entry expiry"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, data, ttl):
+        with self.lock:
+            self._remove(key)
+            if len(data) > self.max_bytes:
+                # Too big to keep; the value it replaces must not linger either
+                return
+            self.entries[key] = (time.monotonic() + ttl, data)
+            self.size += len(data)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                metrics.incr('cache.l1.evictions')
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+# Django makes a backend instance per thread; the LRU and the known
+# generations are per process
+_lrus = {}
+_lrus_lock = threading.Lock()
+_generations = {}
+
+
+class TieredCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = location
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.sync_interval = options.get('SYNC_INTERVAL', 1)
+        with _lrus_lock:
+            self.l1 = _lrus.get(location)
+            if self.l1 is None:
+                self.l1 = _lrus[location] = LRU(
+                    options.get('MAX_ENTRIES', 1000), options.get('MAX_BYTES', 16 * 2**20),
+                )
+        self.generations = _generations.setdefault(location, {})
+
+    @property
+    def shared(self):
+        """The L2 cache"""
+        return caches[self.l2_alias]
+
+    # ==================== VERSION KEYS ====================
+
+    def generation(self, namespace):
+        now = time.monotonic()
+        known = self.generations.get(namespace)
+        if known is None or now - known[1] > self.sync_interval:
+            known = self.generations[namespace] = (CacheGeneration.current(namespace), now)
+        return known[0]
+
+    def invalidate(self, namespace):
+        """Drop every entry of a namespace, in every worker and in L2"""
+        CacheGeneration.bump(namespace)
+        self.generations.pop(namespace, None)
+        metrics.incr('cache.invalidations')
+
+    def l2_key(self, key):
+        return f'{key}:g{self.generation(key.split(":", 1)[0])}'
+
+    def l1_key(self, l2_key, version):
+        return self.make_and_validate_key(l2_key, version)
+
+    # ==================== READS ====================
+
+    def get(self, key, default=None, version=None):
+        l2_key = self.l2_key(key)
+        l1_key = self.l1_key(l2_key, version)
+        data = self.l1.get(l1_key)
+        if data is not None:
+            metrics.incr('cache.l1.hit')
+            return pickle.loads(data)
+        metrics.incr('cache.l1.miss')
+
+        missing = object()
+        value = self.shared.get(l2_key, missing, version=version)
+        if value is missing:
+            metrics.incr('cache.l2.miss')
+            return default
+        metrics.incr('cache.l2.hit')
+        self.l1.set(l1_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.l1_timeout)
+        return value
+
+    def has_key(self, key, version=None):
+        missing = object()
+        return self.get(key, missing, version=version) is not missing
+
+    # ==================== WRITES ====================
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l2_key = self.l2_key(key)
+        timeout = self.timeout_seconds(timeout)
+        self.shared.set(l2_key, value, timeout, version=version)
+        self.fill_l1(l2_key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l2_key = self.l2_key(key)
+        timeout = self.timeout_seconds(timeout)
+        if not self.shared.add(l2_key, value, timeout, version=version):
+            return False
+        self.fill_l1(l2_key, value, timeout, version)
+        return True
+
+    def fill_l1(self, l2_key, value, timeout, version):
+        ttl = self.l1_timeout if timeout is None else min(self.l1_timeout, timeout)
+        l1_key = self.l1_key(l2_key, version)
+        if ttl > 0:
+            self.l1.set(l1_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+        else:
+            self.l1.delete(l1_key)
+
+    def timeout_seconds(self, timeout=DEFAULT_TIMEOUT):
+        """Seconds until expiry, or None for never"""
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else max(timeout, 0)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(self.l2_key(key), self.timeout_seconds(timeout), version=version)
+
+    def delete(self, key, version=None):
+        l2_key = self.l2_key(key)
+        self.l1.delete(self.l1_key(l2_key, version))
+        return self.shared.delete(l2_key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        l2_key = self.l2_key(key)
+        self.l1.delete(self.l1_key(l2_key, version))
+        return self.shared.incr(l2_key, delta, version=version)
+
+    def clear(self):
+        self.l1.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        """Empty this worker's L1 only"""
+        self.l1.clear()
+
+    # ==================== STATS ====================
+
+    def stats(self):
+        """Per-tier hit ratios of this worker and the current L1 size"""
+        counters = metrics.snapshot('cache.')
+        stats = {'l1_entries': len(self.l1.entries), 'l1_bytes': self.l1.size}
+        for tier in ('l1', 'l2'):
+            hits = counters.get(f'cache.{tier}.hit', 0)
+            lookups = hits + counters.get(f'cache.{tier}.miss', 0)
+            stats[f'{tier}_hit_ratio'] = round(hits / lookups, 4) if lookups else None
+        return stats
+
@@ -0,0 +1,316 @@
+"""
+Guard rails for every server-side call to an upstream API.
+
+call() / acall() run one request against a host behind that host's
+circuit breaker, with a bounded number of retries. After
+UPSTREAM_BREAKER_THRESHOLD consecutive failures the breaker opens and
+calls fail fast with UpstreamUnavailable; after UPSTREAM_BREAKER_RESET
+seconds a single probe is let through (half-open) and its outcome closes
+or reopens the breaker.
+
+cached() / acached() put a cache in front of that, fetching each key at
+most once at a time: concurrent callers in a process wait for the one
+fetch in flight, and across workers a cache lock lets one worker fetch
+while the others serve the previous value or wait for the new one. An
+entry outlives its timeout as last known good data, served whenever
+upstream is unavailable.
+"""
+import asyncio
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+
+POLL_INTERVAL = 0.05
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream failed, or its circuit breaker is open"""
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, threshold, reset_timeout):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let exactly one probe through
+                self.state = 'half_open'
+                metrics.incr('upstream.half_open')
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != 'closed':
+                metrics.incr('upstream.closed')
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                metrics.incr('upstream.open')
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host):
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(
+                host, settings.UPSTREAM_BREAKER_THRESHOLD, settings.UPSTREAM_BREAKER_RESET,
+            )
+        return breaker
+
+
+def _begin(host):
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        metrics.incr('upstream.short_circuited')
+        raise UpstreamUnavailable(f'Circuit open for {host}')
+    return breaker
+
+
+def call(host, fetch, errors):
+    """
+    Run fetch() for host behind its breaker, retrying on `errors` up to
+    UPSTREAM_RETRIES times. Any other exception means upstream answered
+    (a 404, a bad file) and is passed through as a success for the breaker.
+    """
+    breaker = _begin(host)
+    for attempt in range(settings.UPSTREAM_RETRIES + 1):
+        if attempt:
+            metrics.incr('upstream.retries')
+            time.sleep(settings.UPSTREAM_RETRY_BACKOFF * 2 ** (attempt - 1))
+        metrics.incr('upstream.calls')
+        try:
+            result = fetch()
+        except errors as e:
+            error = e
+            continue
+        except Exception:
+            breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    metrics.incr('upstream.failures')
+    breaker.record_failure()
+    raise UpstreamUnavailable(str(error)) from error
+
+
+async def acall(host, fetch, errors):
+    """call() for a coroutine function"""
+    breaker = _begin(host)
+    for attempt in range(settings.UPSTREAM_RETRIES + 1):
+        if attempt:
+            metrics.incr('upstream.retries')
+            await asyncio.sleep(settings.UPSTREAM_RETRY_BACKOFF * 2 ** (attempt - 1))
+        metrics.incr('upstream.calls')
+        try:
+            result = await fetch()
+        except errors as e:
+            error = e
+            continue
+        except Exception:
+            breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    metrics.incr('upstream.failures')
+    breaker.record_failure()
+    raise UpstreamUnavailable(str(error)) from error
+
+
+# ==================== CACHED, COALESCED FETCHES ====================
+
+def entry_key(key):
+    return f'upstream:{key}'
+
+
+def lock_key(key):
+    return f'upstream:lock:{key}'
+
+
+def is_fresh(entry):
+    return entry is not None and entry['expires'] > time.time()
+
+
+def new_entry(value, timeout):
+    # Stored for UPSTREAM_STALE_TIMEOUT, well past `expires`, so it can
+    # stand in as the last known good value while upstream is down
+    return {'value': value, 'expires': time.time() + timeout}
+
+
+class Flight:
+    """One in-process fetch that concurrent callers of the same key share"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def cached(key, fetch, timeout):
+    """
+    The value of fetch() cached under key for timeout seconds; fetch raises
+    UpstreamUnavailable when upstream can't answer. None is not cached.
+    """
+    entry = cache.get(entry_key(key))
+    if is_fresh(entry):
+        return entry['value']
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        metrics.incr('upstream.coalesced')
+        metrics.incr('upstream.saved')
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _fetch_once(key, fetch, timeout, entry)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _fetch_once(key, fetch, timeout, entry):
+    """Fetch across workers: only the holder of the cache lock calls upstream"""
+    locked = cache.add(lock_key(key), 1, settings.UPSTREAM_LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            metrics.incr('upstream.saved')
+            return entry['value']
+        deadline = time.monotonic() + settings.UPSTREAM_LOCK_TIMEOUT
+        while True:
+            # Lock first, then entry: the holder writes the entry before
+            # releasing the lock, so once it is gone the entry is there
+            released = time.monotonic() >= deadline or cache.get(lock_key(key)) is None
+            shared = cache.get(entry_key(key))
+            if is_fresh(shared):
+                metrics.incr('upstream.coalesced_remote')
+                metrics.incr('upstream.saved')
+                return shared['value']
+            if released:
+                break
+            time.sleep(POLL_INTERVAL)
+        # The other worker failed or gave up; fetch ourselves
+
+    try:
+        try:
+            value = fetch()
+        except UpstreamUnavailable:
+            if entry is None:
+                raise
+            metrics.incr('upstream.stale_served')
+            return entry['value']
+        if value is not None:
+            cache.set(entry_key(key), new_entry(value, timeout), settings.UPSTREAM_STALE_TIMEOUT)
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key(key))
+
+
+_async_flights = weakref.WeakKeyDictionary()
+
+
+async def acached(key, fetch, timeout):
+    """cached() for a coroutine function, coalescing within the event loop"""
+    entry = await cache.aget(entry_key(key))
+    if is_fresh(entry):
+        return entry['value']
+
+    flights = _async_flights.setdefault(asyncio.get_running_loop(), {})
+    flight = flights.get(key)
+    if flight is not None:
+        metrics.incr('upstream.coalesced')
+        metrics.incr('upstream.saved')
+        return await asyncio.shield(flight)
+
+    flight = flights[key] = asyncio.ensure_future(_afetch_once(key, fetch, timeout, entry))
+    try:
+        return await asyncio.shield(flight)
+    finally:
+        if flight.done():
+            flights.pop(key, None)
+        else:
+            # We were cancelled; drop the entry when the fetch finishes
+            flight.add_done_callback(lambda _: flights.pop(key, None))
+
+
+async def _afetch_once(key, fetch, timeout, entry):
+    locked = await cache.aadd(lock_key(key), 1, settings.UPSTREAM_LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            metrics.incr('upstream.saved')
+            return entry['value']
+        deadline = time.monotonic() + settings.UPSTREAM_LOCK_TIMEOUT
+        while True:
+            # Lock first, then entry: the holder writes the entry before
+            # releasing the lock, so once it is gone the entry is there
+            released = time.monotonic() >= deadline or await cache.aget(lock_key(key)) is None
+            shared = await cache.aget(entry_key(key))
+            if is_fresh(shared):
+                metrics.incr('upstream.coalesced_remote')
+                metrics.incr('upstream.saved')
+                return shared['value']
+            if released:
+                break
+            await asyncio.sleep(POLL_INTERVAL)
+        # The other worker failed or gave up; fetch ourselves
+
+    try:
+        try:
+            value = await fetch()
+        except UpstreamUnavailable:
+            if entry is None:
+                raise
+            metrics.incr('upstream.stale_served')
+            return entry['value']
+        if value is not None:
+            await cache.aset(entry_key(key), new_entry(value, timeout), settings.UPSTREAM_STALE_TIMEOUT)
+        return value
+    finally:
+        if locked:
+            await cache.adelete(lock_key(key))
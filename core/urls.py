@@ -1,9 +1,12 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
+from django.views.generic import RedirectView
+from .forms import OutboxPasswordResetForm
 from .views import (
     signin, signup_step1_email, signup_step2_verify, signup_step2_resend,
     signup_step3_complete, home, feedback, contactus, aboutus, 
-    logout_view, surah_audio
+    logout_view, surah_audio, surah_catalog, search, reciters, metrics_view,
+    audio_file, audio_timings, audio_clip, surah_ayahs
 )
 
 urlpatterns = [
@@ -24,6 +27,7 @@ urlpatterns = [
     # Password Reset
     path('password-reset/', 
          auth_views.PasswordResetView.as_view(
+             form_class=OutboxPasswordResetForm,
              template_name='password_reset/password_reset_form.html',
              email_template_name='password_reset/password_reset_email.html',
              subject_template_name='password_reset/password_reset_subject.txt',
@@ -52,4 +56,21 @@ urlpatterns = [
     
     # Surah audio
     path('surah/audio/<int:surah_number>/', surah_audio, name='surah_audio'),
+    # Served by WhiteNoise once prerender_surahs has run; until then fall back
+    path('pages/', RedirectView.as_view(pattern_name='home')),
+    path('pages/surah/<int:surah_number>/', RedirectView.as_view(pattern_name='surah_audio')),
+    path('audio/<str:reciter>/<int:surah_number>.mp3', audio_file, name='audio_file'),
+    path(
+        'audio/<str:reciter>/<int:surah_number>/<int:from_ayah>-<int:to_ayah>.mp3',
+        audio_clip,
+        name='audio_clip'
+    ),
+
+    # API
+    path('api/surahs/', surah_catalog, name='api_surah_catalog'),
+    path('api/surahs/<int:surah_number>/ayahs/', surah_ayahs, name='api_surah_ayahs'),
+    path('api/search/', search, name='api_search'),
+    path('api/reciters/', reciters, name='api_reciters'),
+    path('api/audio/<str:reciter>/<int:surah_number>/timings/', audio_timings, name='api_audio_timings'),
+    path('api/metrics/', metrics_view, name='api_metrics'),
 ]
\ No newline at end of file
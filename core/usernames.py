@@ -0,0 +1,98 @@
+"""
+Unique usernames derived from email addresses.
+
+A username is the email's local part, or the local part plus the next
+number after the highest numeric suffix already taken ("ahmed",
+"ahmed1", "ahmed2", ...). The highest suffix is found with one aggregate
+query over the usernames starting with the base, which the username
+index answers. So a new name costs one query however many people share
+the local part.
+
+Two signups can still pick the same name at once. Instead of checking
+first, save_with_username() lets the unique constraint decide and
+allocates again on an IntegrityError for the username.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import IntegerField, Max, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Substr
+
+from .models import CustomUser
+
+
+MAX_LENGTH = CustomUser._meta.get_field('username').max_length
+# Longest numeric suffix looked at; keeps the cast inside a 32-bit integer
+MAX_SUFFIX_DIGITS = 9
+MAX_ATTEMPTS = 5
+
+INVALID_CHARS_RE = re.compile(r'[^\w.@+-]')
+
+
+def base_username(email):
+    """The part of an email address usable as a username"""
+    local = INVALID_CHARS_RE.sub('', (email or '').split('@')[0])
+    return local[:MAX_LENGTH - MAX_SUFFIX_DIGITS] or 'user'
+
+
+def next_suffix(base):
+    """
+    None if no username is base or base followed by digits, else the
+    number to append for the next free one (1 when only base is taken).
+    """
+    highest = (
+        CustomUser.objects
+        .filter(username__startswith=base, username__regex=rf'^{re.escape(base)}[0-9]{{0,{MAX_SUFFIX_DIGITS}}}$')
+        .annotate(suffix=Coalesce(
+            Cast(NullIf(Substr('username', len(base) + 1), Value('')), IntegerField()),
+            0,
+        ))
+        .aggregate(highest=Max('suffix'))['highest']
+    )
+    return None if highest is None else highest + 1
+
+
+def with_suffix(base, suffix):
+    return base if suffix is None else f'{base}{suffix}'
+
+
+def next_free(base):
+    """The next free username for base (one query)"""
+    return with_suffix(base, next_suffix(base))
+
+
+def allocate(bases):
+    """
+    Free usernames for a list of bases, in order, for a bulk insert: one
+    query per distinct base, then counting up in memory.
+    """
+    counters = {}
+    usernames = []
+    for base in bases:
+        if base not in counters:
+            counters[base] = next_suffix(base)
+        suffix = counters[base]
+        usernames.append(with_suffix(base, suffix))
+        counters[base] = 1 if suffix is None else suffix + 1
+    return usernames
+
+
+def save_with_username(user, save=None, base=None):
+    """
+    Save a new user (with save(), default user.save) under a free username,
+    allocating a new one if another signup took it first. Keeps
+    user.username if it is already set. Other integrity errors, such as a
+    duplicate email, are raised.
+    """
+    base = base or base_username(user.email)
+    if not user.username:
+        user.username = next_free(base)
+
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return (save or user.save)()
+        except IntegrityError:
+            if attempt == MAX_ATTEMPTS - 1 or not CustomUser.objects.filter(username=user.username).exists():
+                raise
+            user.username = next_free(base)
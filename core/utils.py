@@ -1,11 +1,11 @@
-from django.core.mail import send_mail, EmailMultiAlternatives
 from django.conf import settings
 from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+
+from . import outbox
 
 
 def send_verification_email(email, code):
-    """Send verification code to user's email with HTML template"""
+    """Queue the verification code email (HTML with plain text fallback)"""
     subject = 'Verify Your Email - Al-Qur\'an'
     
     # Render HTML email
@@ -30,17 +30,16 @@ The Al-Qur'an Team
     from_email = settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@alquran.com'
     
     try:
-        # Create email with both HTML and plain text
-        email_message = EmailMultiAlternatives(
+        # Queue it; `manage.py send_outbox` delivers it outside the request
+        outbox.queue(
             subject=subject,
             body=plain_message,
+            to=[email],
+            html_body=html_message,
             from_email=from_email,
-            to=[email]
         )
-        email_message.attach_alternative(html_message, "text/html")
-        email_message.send(fail_silently=False)
         
         return True
     except Exception as e:
-        print(f"Email send failed: {e}")
-        return False
\ No newline at end of file
+        print(f"Email queueing failed: {e}")
+        return False
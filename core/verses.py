@@ -0,0 +1,100 @@
+"""
+Cursor-paginated reads of one surah's ayahs.
+
+Ayah numbers run 1..totalAyah without gaps, so a page is the keyset range
+after < number <= after + limit on the (surah, number, language) unique
+index, and the next cursor is known before any row is read. Rows come
+from the memory-mapped corpus when one is built, else from a server-side
+cursor, grouped per ayah on the fly, so a whole surah with several
+translations is never held in memory.
+"""
+import re
+from itertools import groupby
+
+from .corpus import get_corpus
+from .models import Ayah
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 300
+ITERATOR_CHUNK_SIZE = 500
+MAX_LANGUAGES = 10
+
+# Per-language columns a client can ask for; 'text' when none are given
+AYAH_FIELDS = ('text', 'text_normalized')
+
+LANGUAGE_RE = re.compile(r'^[a-z]{2,3}(?:[-_][a-z0-9]{1,16})?$')
+
+
+def parse_list(value, default, allowed=None, pattern=None, max_items=None):
+    """Split a comma-separated query parameter, validating every item"""
+    items = [item.strip() for item in (value or '').split(',') if item.strip()]
+    if not items:
+        return list(default)
+    if max_items is not None and len(items) > max_items:
+        raise ValueError(f'At most {max_items} values are allowed.')
+    for item in items:
+        if (allowed is not None and item not in allowed) or (pattern is not None and not pattern.match(item)):
+            raise ValueError(f'Invalid value {item!r}.')
+    return list(dict.fromkeys(items))
+
+
+def next_cursor(total_ayah, after, limit):
+    """Cursor for the page after this one, or None on the last page"""
+    last = after + limit
+    return last if last < total_ayah else None
+
+
+def iter_ayahs(surah_number, after=0, limit=DEFAULT_LIMIT, languages=('ar',), fields=('text',)):
+    """
+    Yield {'ayah': n, field: {language: value}, ...} for ayahs after the
+    cursor, in order. Languages with no row for an ayah are left out.
+    Plain text comes from the mapped corpus when it has every language
+    and every ayah of the page; otherwise the page is read from the database.
+    """
+    corpus = get_corpus()
+    if corpus is not None and list(fields) == ['text'] and set(languages) <= set(corpus.languages):
+        page = corpus_page(corpus, surah_number, after, limit, languages)
+        if page is not None:
+            yield from page
+            return
+
+    rows = (
+        Ayah.objects
+        .filter(
+            surah_id=surah_number,
+            number__gt=after,
+            number__lte=after + limit,
+            language__in=languages,
+        )
+        .order_by('number', 'language')
+        .values_list('number', 'language', *fields)
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+
+    for number, group in groupby(rows, key=lambda row: row[0]):
+        ayah = {'ayah': number}
+        for field in fields:
+            ayah[field] = {}
+        for row in group:
+            for field, value in zip(fields, row[2:]):
+                ayah[field][row[1]] = value
+        yield ayah
+
+
+def corpus_page(corpus, surah_number, after, limit, languages):
+    """
+    One page of plain texts from the corpus, or None if it lacks any of
+    them (the database may still have the row)
+    """
+    page = []
+    last = min(after + limit, corpus.ayah_count(surah_number))
+    for number in range(after + 1, last + 1):
+        texts = {}
+        for language in languages:
+            text = corpus.text(surah_number, number, language)
+            if text is None:
+                return None
+            texts[language] = text
+        page.append({'ayah': number, 'text': texts})
+    return page
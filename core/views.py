@@ -1,13 +1,40 @@
+import json
+import os
+import re
+
+from django.http import StreamingHttpResponse, FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_GET, require_safe
 
 from .forms import (
     SignInForm, EmailEntryForm, CodeVerificationForm, 
     CompleteRegistrationForm, FeedbackForm, ContactForm
 )
+from .audio_timing import get_timing_index
+from .catalog import CATALOG_MAX_AGE, get_catalog
+from .mp3 import Mp3Error, get_frame_table, iter_byte_range
 from .models import EmailVerification
+from . import metrics
+from .audio import (
+    AUDIO_MAX_AGE, RECITER_RE, AudioUnavailable, FileRange, get_audio_file, parse_range, player_urls,
+)
+from .quran_api import aget_chapter_audio_url
+from .reciters import aget_reciters
+from .page_cache import cache_for_anonymous
+from .search import DEFAULT_PAGE_SIZE, search_ayahs
+from . import streaming
+from .throttle import check_login, refused_message
+from . import verses
 from .utils import send_verification_email
 
 
@@ -75,15 +102,8 @@ def signup_step2_resend(request):
         messages.error(request, "Session expired. Please start again.")
         return redirect('signup_step1_email')
     
-    # Check if user can resend (60 second cooldown)
-    can_resend, wait_time = EmailVerification.can_resend(email)
-    
-    if not can_resend:
-        messages.error(request, f"Please wait {wait_time} seconds before requesting a new code.")
-        return redirect('signup_step2_verify')
-    
     try:
-        # Create new verification code
+        # Create new verification code (includes the 60 second cooldown)
         verification = EmailVerification.create_verification(email)
         
         if send_verification_email(email, verification.code):
@@ -92,7 +112,7 @@ def signup_step2_resend(request):
             messages.error(request, "Failed to send email. Please try again.")
     
     except ValueError as e:
-        # Rate limit exceeded
+        # Cooldown or rate limit exceeded
         messages.error(request, str(e))
     
     return redirect('signup_step2_verify')
@@ -107,7 +127,7 @@ def signup_step3_complete(request):
         return redirect('signup_step1_email')
     
     # Verify that email was actually verified
-    if not EmailVerification.objects.filter(email=email, is_verified=True).exists():
+    if not EmailVerification.is_email_verified(email):
         messages.error(request, "Please verify your email first.")
         return redirect('signup_step2_verify')
     
@@ -115,7 +135,8 @@ def signup_step3_complete(request):
         form = CompleteRegistrationForm(email=email, data=request.POST)
         if form.is_valid():
             user = form.save()
-            login(request, user)
+            # Not authenticated through a backend, and two are configured
+            login(request, user, backend='django.contrib.auth.backends.ModelBackend')
             
             # Clean up session
             del request.session['signup_email']
@@ -134,6 +155,16 @@ def signup_step3_complete(request):
 
 
 def signin(request):
+    if request.method == 'POST':
+        # Throttle before the form's authenticate() hashes the password
+        decision = check_login(request, request.POST.get('email'))
+        if not decision.allowed:
+            messages.error(request, refused_message(decision))
+            form = SignInForm(initial={'email': request.POST.get('email', '')})
+            response = render(request, 'signin/signin.html', {'form': form}, status=429)
+            response['Retry-After'] = str(decision.retry_after)
+            return response
+    
     form = SignInForm(request, data=request.POST) if request.method == 'POST' else SignInForm()
     
     if request.method == 'POST' and form.is_valid():
@@ -158,8 +189,12 @@ def logout_view(request):
 
 # ==================== PAGE VIEWS (keep as is) ====================
 
+@cache_for_anonymous
 def home(request):
-    return render(request, 'home/index.html')
+    # Inline the catalog so the grid renders without an extra request
+    return render(request, 'home/index.html', {
+        'surah_catalog': get_catalog().script_tag,
+    })
 
 
 def feedback(request):
@@ -214,14 +249,297 @@ def contactus(request):
     return render(request, 'contactus/contactus.html', {'form': form})
 
 
+@cache_for_anonymous
 def aboutus(request):
     return render(request, 'aboutus/aboutus.html')
 
 
-def surah_audio(request, surah_number):
+@cache_for_anonymous(query=['reciter'])
+async def surah_audio(request, surah_number):
     """Handle surah audio playback with validation"""
     if not (1 <= surah_number <= 114):
         messages.error(request, "Invalid Surah number.")
         return redirect('home')
-    
-    return render(request, 'home/surah_audio.html', {'surah_number': surah_number})
\ No newline at end of file
+
+    try:
+        reciter_id = int(request.GET.get('reciter', settings.DEFAULT_RECITER_ID))
+    except ValueError:
+        reciter_id = settings.DEFAULT_RECITER_ID
+
+    # The player (names, reciter list, audio URL) is identical for everyone
+    # listening to the same surah/reciter, so it is rendered once and cached
+    cache_key = f'surah_audio_player:{surah_number}:{reciter_id}'
+    player = await caches['tiered'].aget(cache_key)
+
+    if player is None:
+        reciters = await aget_reciters()
+        if reciters and reciter_id not in {reciter['id'] for reciter in reciters}:
+            reciter_id = reciters[0]['id']
+        # Only checks that the recitation exists (and warms the URL the
+        # audio cache downloads from); the player streams it through audio_file
+        available = bool(await aget_chapter_audio_url(reciter_id, surah_number)) if reciters else False
+
+        player = render_to_string('home/surah_audio_player.html', {
+            'surah': get_catalog().get(surah_number),
+            'reciters': reciters,
+            'reciter_id': reciter_id,
+            **(player_urls(reciter_id, surah_number) if available else {}),
+        })
+        # Don't pin an upstream outage into the cache
+        if available:
+            await caches['tiered'].aset(cache_key, player, settings.QURAN_API_CACHE_TIMEOUT)
+        cacheable = available
+    else:
+        cacheable = True
+
+    response = render(request, 'home/surah_audio.html', {
+        'surah_number': surah_number,
+        'surah': get_catalog().get(surah_number),
+        'player': player,
+    })
+    response.cache_for_anonymous = cacheable
+    return response
+
+
+@require_safe
+def audio_file(request, reciter, surah_number):
+    """Serve a recitation MP3 from the local cache, honouring Range requests"""
+    if not (1 <= surah_number <= 114) or not RECITER_RE.match(reciter):
+        raise Http404("Unknown recitation.")
+
+    try:
+        f = get_audio_file(reciter, surah_number)
+    except AudioUnavailable:
+        return HttpResponse("Audio is temporarily unavailable.", status=502)
+
+    size = os.fstat(f.fileno()).st_size
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        f.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+    length = end - start + 1
+
+    response = FileResponse(
+        streaming.file_body(request, FileRange(f, start, length)), status=status, content_type='audio/mpeg',
+    )
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    patch_cache_control(response, public=True, max_age=AUDIO_MAX_AGE)
+    return response
+
+
+MAX_CLIP_LOOPS = 20
+
+
+@require_safe
+def audio_clip(request, reciter, surah_number, from_ayah, to_ayah):
+    """
+    Stream only the frames covering ayahs from_ayah..to_ayah of a cached
+    recitation (repeated ?loop=N times), cut at MP3 frame boundaries.
+    """
+    index = get_timing_index(reciter, surah_number) if RECITER_RE.match(reciter) else None
+    if index is None or not (1 <= from_ayah <= to_ayah <= len(index)):
+        raise Http404("Unknown recitation or ayah range.")
+
+    try:
+        loops = min(max(int(request.GET.get('loop', 1)), 1), MAX_CLIP_LOOPS)
+    except ValueError:
+        loops = 1
+
+    try:
+        f = get_audio_file(reciter, surah_number)
+    except AudioUnavailable:
+        return HttpResponse("Audio is temporarily unavailable.", status=502)
+    try:
+        frames = get_frame_table(f)
+    except Mp3Error:
+        f.close()
+        return HttpResponse("Audio file could not be parsed.", status=502)
+
+    start, end = frames.byte_range(index.starts[from_ayah - 1], index.ends[to_ayah - 1])
+    response = StreamingHttpResponse(
+        streaming.body(request, iter_byte_range(f, start, end, loops)), content_type='audio/mpeg',
+    )
+    response['Content-Length'] = (end - start) * loops
+    patch_cache_control(response, public=True, max_age=AUDIO_MAX_AGE)
+    return response
+
+
+# ==================== API VIEWS ====================
+
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+@require_GET
+async def surah_catalog(request):
+    """Serve the surah catalog as JSON, precompressed and cacheable"""
+    catalog = get_catalog()
+    use_gzip = bool(ACCEPTS_GZIP_RE.search(request.headers.get('Accept-Encoding', '')))
+    etag = catalog.gzipped_etag if use_gzip else catalog.etag
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            catalog.gzipped_body if use_gzip else catalog.body,
+            content_type='application/json; charset=utf-8',
+        )
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = len(response.content)
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=CATALOG_MAX_AGE)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+@require_GET
+def surah_ayahs(request, surah_number):
+    """
+    Ayahs of one surah, keyset-paginated with ?after=<ayah>&limit=N.
+    ?lang=ar,en picks translations and ?fields=text,text_normalized the
+    columns. ?format=ndjson (or Accept: application/x-ndjson) streams one
+    ayah per line, by default to the end of the surah.
+    """
+    surah = get_catalog().get(surah_number)
+    if surah is None:
+        return JsonResponse({'error': 'Unknown surah.'}, status=404)
+    total_ayah = surah['totalAyah']
+
+    ndjson = (
+        request.GET.get('format') == 'ndjson'
+        or 'application/x-ndjson' in request.headers.get('Accept', '')
+    )
+
+    try:
+        after = int(request.GET.get('after', 0))
+        max_limit = total_ayah if ndjson else verses.MAX_LIMIT
+        limit = int(request.GET.get('limit', max_limit if ndjson else verses.DEFAULT_LIMIT))
+        if after < 0 or not 1 <= limit <= max_limit:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit.'}, status=400)
+
+    try:
+        languages = verses.parse_list(
+            request.GET.get('lang'), ['ar'],
+            pattern=verses.LANGUAGE_RE, max_items=verses.MAX_LANGUAGES,
+        )
+        fields = verses.parse_list(request.GET.get('fields'), ['text'], allowed=verses.AYAH_FIELDS)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    ayahs = verses.iter_ayahs(surah_number, after, limit, languages, fields)
+    cursor = verses.next_cursor(total_ayah, after, limit)
+
+    if ndjson:
+        lines = (json.dumps(ayah, ensure_ascii=False) + '\n' for ayah in ayahs)
+        response = StreamingHttpResponse(
+            streaming.body(request, lines), content_type='application/x-ndjson; charset=utf-8',
+        )
+        if cursor is not None:
+            response['X-Next-Cursor'] = cursor
+    else:
+        response = JsonResponse(
+            {'surah': surah_number, 'ayahs': list(ayahs), 'next': cursor},
+            json_dumps_params={'ensure_ascii': False},
+        )
+
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@require_GET
+def search(request):
+    """Ranked, paginated full-text search over ayahs and translations"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Missing search query.'}, status=400)
+
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid page number.'}, status=400)
+
+    try:
+        results = search_ayahs(
+            query,
+            language=request.GET.get('lang') or None,
+            page=page,
+            page_size=page_size,
+            mode=request.GET.get('mode', 'words'),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse(results, json_dumps_params={'ensure_ascii': False})
+
+
+@require_GET
+async def reciters(request):
+    """Serve the cached reciter catalog"""
+    response = JsonResponse({'reciters': await aget_reciters()}, json_dumps_params={'ensure_ascii': False})
+    patch_cache_control(response, public=True, max_age=60 * 60)
+    return response
+
+
+@require_GET
+@staff_member_required
+def metrics_view(request):
+    """Counters of the worker process that served this request"""
+    return JsonResponse({
+        'pid': os.getpid(),
+        'counters': metrics.snapshot(),
+        'cache': caches['tiered'].stats(),
+    })
+
+
+@require_GET
+async def audio_timings(request, reciter, surah_number):
+    """
+    Ayah timing index of a recitation. ?ayah=N or ?at=<ms> narrow it to one
+    ayah and include the Range header that fetches exactly that verse.
+    """
+    index = None
+    if RECITER_RE.match(reciter):
+        index = await sync_to_async(get_timing_index)(reciter, surah_number)
+    if index is None:
+        return JsonResponse({'error': 'No timings for this recitation.'}, status=404)
+
+    data = {
+        'reciter': reciter,
+        'surah': surah_number,
+        'audio_url': reverse('audio_file', args=[reciter, surah_number]),
+    }
+
+    try:
+        if 'ayah' in request.GET:
+            ayah = index.ayah(int(request.GET['ayah']))
+        elif 'at' in request.GET:
+            ayah = index.ayah(index.ayah_at(int(request.GET['at'])))
+        else:
+            ayah = None
+    except (ValueError, IndexError):
+        return JsonResponse({'error': 'Invalid ayah or time.'}, status=400)
+
+    if ayah is None:
+        data['ayahs'] = index.ayahs()
+    else:
+        data['ayah'] = ayah
+        data['range'] = f"bytes={ayah['byte_start']}-{ayah['byte_end'] if ayah['byte_end'] is not None else ''}"
+
+    response = JsonResponse(data)
+    patch_cache_control(response, public=True, max_age=60 * 60)
+    return response
@@ -0,0 +1,11 @@
+# Read by gunicorn from the working directory. SERVER_MODE=asgi serves the
+# ASGI application with uvicorn workers, so async views can wait on
+# upstream without holding a worker; the default stays sync WSGI.
+import os
+
+
+if os.environ.get('SERVER_MODE') == 'asgi':
+    wsgi_app = 'myquran.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'myquran.wsgi:application'
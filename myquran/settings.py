@@ -38,7 +38,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files in production
+    'core.static_files.StaticFilesMiddleware',  # WhiteNoise, for static files in production
+    'core.page_cache.AnonymousPageCacheMiddleware',  # Before session/auth/messages on purpose
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -93,6 +94,16 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
+# ==================== LOGIN THROTTLING ====================
+# Sign-in attempts allowed per client IP and per email (see core.throttle)
+LOGIN_IP_LIMIT = config('LOGIN_IP_LIMIT', default=10, cast=int)
+LOGIN_IP_PERIOD = config('LOGIN_IP_PERIOD', default=60, cast=int)
+LOGIN_EMAIL_LIMIT = config('LOGIN_EMAIL_LIMIT', default=10, cast=int)
+LOGIN_EMAIL_PERIOD = config('LOGIN_EMAIL_PERIOD', default=15 * 60, cast=int)
+# Reverse proxies in front of the app whose X-Forwarded-For is trusted
+# (Render and Railway each add one)
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=0 if DEBUG else 1, cast=int)
+
 # ==================== EMAIL CONFIGURATION ====================
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config('EMAIL_HOST', default='smtp-relay.brevo.com')
@@ -103,6 +114,140 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='Al-Qur\'an <noreply@alquran.com>')
 
+# Requests queue mail in the outbox; `manage.py send_outbox` sends it
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=50, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+OUTBOX_RETRY_BACKOFF = config('OUTBOX_RETRY_BACKOFF', default=30, cast=int)  # seconds, doubled per attempt
+OUTBOX_LEASE = config('OUTBOX_LEASE', default=5 * 60, cast=int)
+OUTBOX_POLL_INTERVAL = config('OUTBOX_POLL_INTERVAL', default=2, cast=float)
+
+
+# ==================== RETENTION ====================
+# Age in days after which `manage.py purge` deletes rows (None: keep forever);
+# see core.retention for what each policy covers
+
+
+def days_or_forever(value):
+    """A number of days, or None for an empty value or "none" (keep forever)"""
+    value = str(value).strip()
+    return None if value.lower() in ('', 'none') else int(value)
+
+
+RETENTION_DAYS = {
+    'verifications': config('RETENTION_VERIFICATIONS_DAYS', default=1, cast=days_or_forever),
+    'outbox': config('RETENTION_OUTBOX_DAYS', default=30, cast=days_or_forever),
+    'sessions': 0,
+    'feedback': config('RETENTION_FEEDBACK_DAYS', default=730, cast=days_or_forever),
+    'contact_messages': config('RETENTION_CONTACT_MESSAGES_DAYS', default=365, cast=days_or_forever),
+}
+PURGE_CHUNK_SIZE = config('PURGE_CHUNK_SIZE', default=1000, cast=int)
+PURGE_CHUNK_SLEEP = config('PURGE_CHUNK_SLEEP', default=0.1, cast=float)
+
+
+# ==================== EXPORTS ====================
+# Rows fetched per round trip by the CSV/JSONL exports (see core.export)
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+
+# ==================== QURAN DATA APIS ====================
+QURAN_API_URL = config('QURAN_API_URL', default='https://api.quran.com/api/v4')
+QURAN_API_TIMEOUT = config('QURAN_API_TIMEOUT', default=5, cast=int)
+QURAN_API_CACHE_TIMEOUT = config('QURAN_API_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+DEFAULT_RECITER_ID = config('DEFAULT_RECITER_ID', default=7, cast=int)  # Mishary Alafasy
+
+# 'wsgi' (sync gunicorn workers) or 'asgi' (uvicorn workers, see
+# gunicorn.conf.py); in ASGI mode async views call upstream through pooled
+# httpx clients, limited per upstream host
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+UPSTREAM_MAX_CONNECTIONS = config('UPSTREAM_MAX_CONNECTIONS', default=20, cast=int)
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = config('UPSTREAM_MAX_KEEPALIVE_CONNECTIONS', default=10, cast=int)
+UPSTREAM_KEEPALIVE_EXPIRY = config('UPSTREAM_KEEPALIVE_EXPIRY', default=30, cast=int)
+
+# Every upstream call (core.upstream): retries with exponential backoff, a
+# per-host circuit breaker that fails fast after repeated failures, and a
+# per-key cache lock so one worker refetches while others serve the
+# last known good value (kept for UPSTREAM_STALE_TIMEOUT)
+UPSTREAM_RETRIES = config('UPSTREAM_RETRIES', default=1, cast=int)
+UPSTREAM_RETRY_BACKOFF = config('UPSTREAM_RETRY_BACKOFF', default=0.2, cast=float)
+UPSTREAM_BREAKER_THRESHOLD = config('UPSTREAM_BREAKER_THRESHOLD', default=5, cast=int)
+UPSTREAM_BREAKER_RESET = config('UPSTREAM_BREAKER_RESET', default=30, cast=int)
+UPSTREAM_LOCK_TIMEOUT = config('UPSTREAM_LOCK_TIMEOUT', default=15, cast=int)
+UPSTREAM_STALE_TIMEOUT = config('UPSTREAM_STALE_TIMEOUT', default=60 * 60 * 24 * 7, cast=int)
+
+# Local state that should survive restarts (persisted upstream responses)
+DATA_CACHE_DIR = Path(config('DATA_CACHE_DIR', default=str(BASE_DIR / 'var')))
+RECITERS_TTL = config('RECITERS_TTL', default=60 * 60 * 24, cast=int)
+RECITERS_CACHE_FILE = DATA_CACHE_DIR / 'reciters.json'
+
+# Ayah texts for all languages, written by `manage.py build_corpus` and
+# memory-mapped by every worker; the database is used until it exists
+CORPUS_PATH = Path(config('CORPUS_PATH', default=str(DATA_CACHE_DIR / 'corpus.bin')))
+
+# Recitation MP3s are proxied through a size-bounded on-disk LRU cache
+AUDIO_UPSTREAM_URL = config(
+    'AUDIO_UPSTREAM_URL',
+    default='https://cdn.islamic.network/quran/audio-surah/128/{reciter}/{surah}.mp3'
+)
+AUDIO_CACHE_DIR = DATA_CACHE_DIR / 'audio'
+AUDIO_CACHE_MAX_BYTES = config('AUDIO_CACHE_MAX_BYTES', default=2 * 1024 ** 3, cast=int)
+AUDIO_DOWNLOAD_TIMEOUT = config('AUDIO_DOWNLOAD_TIMEOUT', default=30, cast=int)
+
+
+# ==================== CACHES ====================
+# 'default' is shared by all workers (rate limits, upstream locks and last
+# known good data): Redis when REDIS_URL is set, else files under
+# DATA_CACHE_DIR for single-box deploys. Rendered pages and fragments go
+# to 'pages' instead, so their churn never culls a rate limit bucket or
+# a lock; 'tiered' puts a small in-process LRU in front of it (see
+# core.tiered_cache).
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+    # Redis doesn't cull; keep maxmemory-policy at noeviction or volatile-*
+    PAGES_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'pages',
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(DATA_CACHE_DIR / 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+    PAGES_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(DATA_CACHE_DIR / 'pages'),
+        'OPTIONS': {'MAX_ENTRIES': config('PAGES_CACHE_MAX_ENTRIES', default=10000, cast=int)},
+    }
+
+CACHES = {
+    'default': SHARED_CACHE,
+    'pages': PAGES_CACHE,
+    'tiered': {
+        'BACKEND': 'core.tiered_cache.TieredCache',
+        'LOCATION': 'pages',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('L1_CACHE_MAX_ENTRIES', default=1000, cast=int),
+            'MAX_BYTES': config('L1_CACHE_MAX_BYTES', default=16 * 1024 * 1024, cast=int),
+            'L1_TIMEOUT': config('L1_CACHE_TIMEOUT', default=5, cast=int),
+            'SYNC_INTERVAL': 1,
+        },
+    },
+}
+
+# Whole pages for visitors without a session (see core.page_cache); the
+# version defaults to the deployed commit so every deploy starts fresh
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=0 if DEBUG else 10 * 60, cast=int)
+PAGE_CACHE_VERSION = config(
+    'PAGE_CACHE_VERSION',
+    default=config('RENDER_GIT_COMMIT', default=config('RAILWAY_GIT_COMMIT_SHA', default='dev')),
+)[:12]
+
 
 # ==================== INTERNATIONALIZATION ====================
 LANGUAGE_CODE = 'en-us'
@@ -118,6 +263,22 @@ STATICFILES_DIRS = [
 ]
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Pages rendered ahead of time by `manage.py prerender_surahs`. WhiteNoise
+# serves them (and their .br/.gz variants) before Django sees the request;
+# it scans the directory at startup, so render before starting the server.
+# They keep stable, bookmarkable URLs, so they are not immutable: browsers
+# and CDNs keep them for WHITENOISE_MAX_AGE (60 s unless DEBUG), then
+# revalidate with the ETag / Last-Modified WhiteNoise sends, and a page is
+# only rewritten (and its validators changed) when its content changes.
+PRERENDER_ROOT = Path(config('PRERENDER_ROOT', default=str(BASE_DIR / 'prerendered')))
+# What each page was rendered from; kept out of the served root
+PRERENDER_MANIFEST = Path(config('PRERENDER_MANIFEST', default=str(DATA_CACHE_DIR / 'prerender-manifest.json')))
+if PRERENDER_ROOT.is_dir():
+    WHITENOISE_ROOT = PRERENDER_ROOT
+WHITENOISE_INDEX_FILE = True
+# Content-hashed names from collectstatic never change
+WHITENOISE_IMMUTABLE_FILE_TEST = r'^.+\.[0-9a-f]{12}\..+$'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ==================== DJANGO-ALLAUTH ====================
@@ -154,6 +315,7 @@ SOCIALACCOUNT_PROVIDERS = {
 }
 
 
+ACCOUNT_ADAPTER = 'core.adapters.CustomAccountAdapter'
 SOCIALACCOUNT_ADAPTER = 'core.adapters.CustomSocialAccountAdapter'
 
 # ==================== SECURITY SETTINGS FOR PRODUCTION ====================
@@ -1,8 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
+from allauth.account.views import LoginView
+
+from core.throttle import throttle_login
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # allauth's login, throttled before it checks the password
+    path('accounts/login/', throttle_login('login')(LoginView.as_view()), name='account_login'),
     path('accounts/', include('allauth.urls')),
     path('', include('core.urls')),
 ]
\ No newline at end of file